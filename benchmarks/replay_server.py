@@ -0,0 +1,164 @@
+import argparse
+import gzip
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Directory with the recorded API payloads, laid out as the API paths
+# e.g. /api/v1/event/11352300/statistics -> fixtures/event/11352300/statistics.json
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Prefix of the replayed API paths (same as https://www.sofascore.com/api/v1)
+API_PREFIX = '/api/v1'
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    Local HTTP server that replays the recorded SofaScore API payloads.
+
+    The bodies are served gzip-compressed with Content-Encoding: gzip, like the real API.
+    Every response can be delayed and a fraction of the requests can fail on purpose,
+    so the scraping logic can be measured under realistic network conditions.
+
+    Args:
+        port (int): Port to listen on (0 picks a free one).
+        fixtures_dir (str): Directory with the recorded payloads.
+        latency (float): Delay added to every response, in seconds.
+        jitter (float): Random extra delay, between 0 and this value, in seconds.
+        error_rate (float): Fraction of the requests answered with error_status (0 to 1).
+        error_status (int): HTTP status of the injected errors.
+        retry_after (float): Retry-After header (seconds) sent with the injected 429 errors, None to omit it.
+        seed (int): Seed of the random generator, so the injected errors are reproducible.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port=0, fixtures_dir=FIXTURES_DIR, latency=0.0, jitter=0.0, error_rate=0.0, error_status=429, retry_after=None, seed=0):
+        super().__init__(('127.0.0.1', port), ReplayHandler)
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests_served = 0
+        self.errors_injected = 0
+        self.bytes_sent = 0
+        self.cache = {}
+
+    @property
+    def api_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}{API_PREFIX}"
+
+    # Returns the gzip-compressed body of a fixture, or None if it was not recorded
+    def load_fixture(self, path):
+        if path not in self.cache:
+            filename = os.path.join(self.fixtures_dir, *path.strip('/').split('/')) + '.json'
+            if os.path.isfile(filename):
+                with open(filename, 'rb') as f:
+                    self.cache[path] = gzip.compress(f.read())
+            else:
+                self.cache[path] = None
+        return self.cache[path]
+
+    # Draws the delay and decides whether the request fails
+    def plan_response(self):
+        with self.lock:
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+            fail = self.error_rate > 0 and self.random.random() < self.error_rate
+            self.requests_served += 1
+            if fail:
+                self.errors_injected += 1
+        return delay, fail
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def stats(self):
+        return {
+            'requests_served': self.requests_served,
+            'errors_injected': self.errors_injected,
+            'bytes_sent': self.bytes_sent,
+        }
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        delay, fail = server.plan_response()
+        if delay:
+            time.sleep(delay)
+
+        path = self.path.split('?', 1)[0]
+        body = None
+        if path.startswith(API_PREFIX + '/'):
+            body = server.load_fixture(path[len(API_PREFIX):])
+
+        if fail:
+            self.send_error_body(server.error_status)
+        elif body is None:
+            self.send_error_body(404)
+        else:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            with server.lock:
+                server.bytes_sent += len(body)
+
+    def send_error_body(self, status):
+        body = b'{"error":{"code":%d}}' % status
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if status == 429 and self.server.retry_after is not None:
+            self.send_header('Retry-After', f"{self.server.retry_after:g}")
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Keep the benchmark output readable
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the recorded SofaScore API payloads locally")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help="Directory with the recorded payloads")
+    parser.add_argument('--latency', type=float, default=0.0, help="Delay added to every response, in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Random extra delay, in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of the requests that fail (0 to 1)")
+    parser.add_argument('--error-status', type=int, default=429, help="HTTP status of the injected errors")
+    parser.add_argument('--retry-after', type=float, help="Retry-After header (seconds) of the injected 429 errors")
+    args = parser.parse_args()
+
+    server = ReplayServer(
+        port=args.port,
+        fixtures_dir=args.fixtures,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after
+    )
+    print(f"Replaying {args.fixtures} on {server.api_url} (set SOFASCORE_API_URL to this URL)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,337 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from sofascore_scrap import metrics, rate_limiter, response_cache, sofascore_api
+from sofascore_scrap import stage1_collect_match_keys as stage1
+from sofascore_scrap import stage2_extract_match_data as stage2
+from sofascore_scrap.s3_uploader import S3Uploader
+from sofascore_scrap.state_store import StateStore
+from replay_server import ReplayServer, FIXTURES_DIR
+from standins import connect_postgres, local_s3, bucket_usage, LOCAL_S3_KEY_ID, LOCAL_S3_SECRET_KEY
+
+# Offline benchmark of both stages:
+# stage1 collects the match keys of the recorded season (api mode) from the replay server,
+# stage2 fetches the selected endpoints (info and statistics by default) of every collected match from the same server and
+# runs the stage2 processing and uploads against the local S3 stand-in.
+
+# Metrics compared between two result files, with the direction that is better
+METRICS = {
+    'stage1': {
+        'elapsed_s': 'lower',
+        'matches_per_s': 'higher',
+        'db_round_trips': 'lower',
+        'http_requests': 'lower',
+    },
+    'stage2': {
+        'elapsed_s': 'lower',
+        'matches_per_s': 'higher',
+        'latency_p50_ms': 'lower',
+        'latency_p95_ms': 'lower',
+        'bytes_uploaded': 'lower',
+        'http_requests': 'lower',
+    },
+}
+
+
+# Nearest-rank percentile of a list of values
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+# Commit of the benchmarked tree, so the results can be compared across commits
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+# Requests an endpoint and returns the response as stage2 sees it in the browser (body still encoded)
+# Returns None if the request failed, like a response that was never captured
+def fetch_response(session, url):
+    limiter = rate_limiter.get()
+    limiter.acquire()
+    try:
+        response = session.get(url, stream=True, timeout=30)
+    except Exception as e:
+        print(f"Error requesting {url}: {e}")
+        return None
+
+    try:
+        body = response.raw.read(decode_content=False)
+    finally:
+        response.close()
+
+    if response.status_code in rate_limiter.THROTTLE_STATUSES:
+        limiter.on_throttle(rate_limiter.retry_after_seconds(response.headers))
+    if response.status_code != 200:
+        print(f"Status {response.status_code} for {url}")
+        return None
+    limiter.on_success()
+
+    return SimpleNamespace(
+        url=url,
+        response=SimpleNamespace(status_code=response.status_code, headers=response.headers, body=body)
+    )
+
+
+def run_stage1(leagues, state_path, server, max_workers):
+    conn = connect_postgres()
+    requests_before = server.requests_served
+    collected = []
+
+    started = time.perf_counter()
+    collector = stage1.MatchKeyCollector(
+        mode='api',
+        max_workers=max_workers,
+        on_match=collected.append,
+        store=StateStore(state_path),
+        conn=conn
+    )
+    with collector:
+        collector.run(leagues)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'elapsed_s': elapsed,
+        'matches': len(collected),
+        'matches_per_s': len(collected) / elapsed if elapsed else None,
+        'db_round_trips': conn.round_trips,
+        'http_requests': server.requests_served - requests_before,
+    }
+
+
+def run_stage2(state_path, server, bucket_name, endpoint_url, raw, endpoints):
+    store = StateStore(state_path)
+    matches = store.pending_matches()
+    session = sofascore_api.create_session()
+    uploader = S3Uploader(
+        bucket_name,
+        aws_access_key_id=LOCAL_S3_KEY_ID,
+        aws_secret_access_key=LOCAL_S3_SECRET_KEY,
+        endpoint_url=endpoint_url
+    )
+    requests_before = server.requests_served
+    latencies = []
+    in_flight = []
+    failed = 0
+
+    started = time.perf_counter()
+    try:
+        for match in matches:
+            match_started = time.perf_counter()
+            responses = {
+                name: fetch_response(session, sofascore_api.api_url(f"/event/{match['id']}{stage2.ENDPOINTS[name][0]}"))
+                for name in endpoints
+            }
+            uploads, failures = stage2.process_match_responses(match, responses, uploader, raw=raw)
+            latencies.append(time.perf_counter() - match_started)
+
+            if failures:
+                failed += 1
+                store.set_stage2_status([(match['id'], 'failed', "; ".join(failures))])
+            else:
+                in_flight.append((match['id'], uploads))
+            in_flight = stage2.record_finished_uploads(store, in_flight)
+    finally:
+        # The run ends when every queued upload has finished
+        upload_errors = uploader.close()
+        stage2.record_finished_uploads(store, in_flight)
+        store.close()
+        session.close()
+    elapsed = time.perf_counter() - started
+
+    objects, size = bucket_usage(bucket_name, endpoint_url)
+    processed = len(matches) - failed
+    return {
+        'elapsed_s': elapsed,
+        'matches': processed,
+        'failed': failed,
+        'upload_errors': len(upload_errors),
+        'matches_per_s': processed / elapsed if elapsed else None,
+        'latencies': latencies,
+        'objects_uploaded': objects,
+        'bytes_uploaded': size,
+        'http_requests': server.requests_served - requests_before,
+    }
+
+
+# Runs both stages once, in a temporary working directory with a fresh state store and bucket
+def run_once(leagues, server, max_workers, raw, endpoints):
+    with tempfile.TemporaryDirectory(prefix='sofascore-bench-') as workdir, local_s3() as (bucket_name, endpoint_url):
+        state_path = os.path.join(workdir, 'scrap_state.db')
+        cwd = os.getcwd()
+        # keys_matches.csv is exported to the working directory at the end of stage1
+        os.chdir(workdir)
+        try:
+            stage1_result = run_stage1(leagues, state_path, server, max_workers)
+            stage2_result = run_stage2(state_path, server, bucket_name, endpoint_url, raw, endpoints)
+        finally:
+            # The response cache of the run lives in the temporary directory too
+            response_cache.close()
+            os.chdir(cwd)
+    return stage1_result, stage2_result
+
+
+# Combines the runs: median of every metric, percentiles over the latencies of all runs
+def summarize(runs):
+    summary = {}
+    for stage in ('stage1', 'stage2'):
+        results = [run[stage] for run in runs]
+        stage_summary = {}
+        for key in results[0]:
+            if key == 'latencies':
+                continue
+            values = [result[key] for result in results if result[key] is not None]
+            stage_summary[key] = statistics.median(values) if values else None
+        summary[stage] = stage_summary
+
+    latencies = [latency for run in runs for latency in run['stage2']['latencies']]
+    summary['stage2']['latency_p50_ms'] = percentile(latencies, 50) * 1000 if latencies else None
+    summary['stage2']['latency_p95_ms'] = percentile(latencies, 95) * 1000 if latencies else None
+    return summary
+
+# Compares a result with a baseline result
+# Returns the regressions: metrics that got worse by more than `threshold` percent
+def compare(result, baseline, threshold):
+    regressions = []
+
+    if result['config'] != baseline['config']:
+        print("Warning: the baseline was run with a different configuration")
+        print(f"  baseline: {baseline['config']}")
+        print(f"  current:  {result['config']}")
+
+    print(f"\nComparison with {baseline.get('commit')} (threshold {threshold}%)")
+    for stage, stage_metrics in METRICS.items():
+        for key, better in stage_metrics.items():
+            old = baseline.get(stage, {}).get(key)
+            new = result[stage].get(key)
+            if old is None or new is None:
+                continue
+
+            change = (new - old) / old * 100 if old else 0.0
+            worse = change > threshold if better == 'lower' else change < -threshold
+            flag = "REGRESSION" if worse else ""
+            print(f"  {stage}.{key:<16} {old:>14.3f} -> {new:>14.3f} ({change:+7.1f}%) {flag}")
+            if worse:
+                regressions.append((f"{stage}.{key}", old, new))
+
+    return regressions
+
+
+def print_summary(result):
+    print(f"\nCommit: {result['commit']}{' (with local changes)' if result['dirty'] else ''}")
+    for stage in ('stage1', 'stage2'):
+        print(f"{stage}:")
+        for key, value in result[stage].items():
+            print(f"  {key:<18} {value:.3f}" if isinstance(value, float) else f"  {key:<18} {value}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark stage1 and stage2 offline, against the recorded API payloads")
+    parser.add_argument('--latency', type=float, default=0.05, help="Delay added to every API response, in seconds")
+    parser.add_argument('--jitter', type=float, default=0.02, help="Random extra delay of the API responses, in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of the API requests that fail (0 to 1)")
+    parser.add_argument('--error-status', type=int, default=429, help="HTTP status of the injected errors")
+    parser.add_argument('--retry-after', type=float, default=0.5, help="Retry-After header (seconds) of the injected 429 errors")
+    parser.add_argument('--rate', type=float, default=1000.0, help="Rate limit of the requests, per second (the default does not limit)")
+    parser.add_argument('--max-workers', type=int, default=8, help="Rounds requested at the same time by stage1")
+    parser.add_argument('--raw', action='store_true', help="Run stage2 with --raw (gzip bodies stored as .json.gz)")
+    parser.add_argument('--endpoints', default=','.join(stage2.DEFAULT_ENDPOINTS), help=f"Match endpoints fetched by stage2 (available: {', '.join(stage2.ENDPOINTS)})")
+    parser.add_argument('--repeat', type=int, default=3, help="Number of runs; the reported numbers are the medians")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the injected latency and errors")
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help="Directory with the recorded payloads")
+    parser.add_argument('--leagues', default=os.path.join(BENCHMARK_DIR, 'leagues_season.json'), help="League seasons to collect (must be in the fixtures)")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Compare with a previous results file and exit with status 1 on regressions")
+    parser.add_argument('--threshold', type=float, default=10.0, help="Change (in percent) reported as a regression")
+    parser.add_argument('--verbose', action='store_true', help="Show the output of the stages")
+    args = parser.parse_args()
+
+    leagues = stage1.load_leagues(args.leagues)
+    endpoints = stage2.parse_endpoints(args.endpoints)
+
+    server = ReplayServer(
+        fixtures_dir=args.fixtures,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        seed=args.seed
+    ).start()
+    os.environ['SOFASCORE_API_URL'] = server.api_url
+
+    runs = []
+    try:
+        for i in range(args.repeat):
+            # A fresh limiter per run, so the throttling of one run does not slow down the next
+            rate_limiter.install(rate_limiter.RateLimiter(rate=args.rate, max_rate=args.rate))
+            print(f"Run {i + 1}/{args.repeat}")
+            output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            metrics.reset()
+            with output:
+                stage1_result, stage2_result = run_once(leagues, server, args.max_workers, args.raw, endpoints)
+            runs.append({'stage1': stage1_result, 'stage2': stage2_result, 'metrics': metrics.snapshot()})
+    finally:
+        server.stop()
+
+    commit, dirty = git_revision()
+    result = {
+        'commit': commit,
+        'dirty': dirty,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'config': {
+            'latency': args.latency,
+            'jitter': args.jitter,
+            'error_rate': args.error_rate,
+            'error_status': args.error_status,
+            'retry_after': args.retry_after,
+            'rate': args.rate,
+            'max_workers': args.max_workers,
+            'raw': args.raw,
+            'endpoints': endpoints,
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'leagues': [league['id_season'] for league in leagues],
+        },
+        **summarize(runs),
+        # Time per phase and counters of the last run, to see where a change moved the time
+        'phases': runs[-1]['metrics'],
+    }
+
+    print_summary(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold}%")
+            sys.exit(1)
@@ -0,0 +1,196 @@
+import os
+import uuid
+from contextlib import contextmanager
+import boto3
+
+# Stand-ins for PostgreSQL and S3 used by the benchmark.
+# PostgreSQL: every statement sent to the server is counted as a round-trip. With BENCH_POSTGRES_DSN
+# the statements run against a real (local) database, otherwise they are only counted.
+# S3: a local S3-compatible endpoint (S3_ENDPOINT_URL, e.g. MinIO) or, if it is not set,
+# the in-process S3 of moto (pip install -r benchmarks/requirements.txt).
+
+# Credentials accepted by moto and by a default local MinIO
+LOCAL_S3_KEY_ID = os.environ.get('BENCH_S3_ACCESS_KEY_ID', 'testing')
+LOCAL_S3_SECRET_KEY = os.environ.get('BENCH_S3_SECRET_ACCESS_KEY', 'testing')
+LOCAL_S3_REGION = 'us-east-2'
+
+
+class CountingCursor:
+    """
+    Cursor wrapper that counts the statements sent to the database.
+
+    Args:
+        cursor: The wrapped cursor (a psycopg2 cursor or a NullCursor).
+        counter (CountingConnection): The connection holding the counters.
+    """
+
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def execute(self, query, vars=None):
+        self._counter.round_trips += 1
+        return self._cursor.execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        # psycopg2 sends one statement per row
+        vars_list = list(vars_list)
+        self._counter.round_trips += len(vars_list)
+        return self._cursor.executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        self._counter.round_trips += 1
+        return self._cursor.copy_expert(sql, file, size)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CountingConnection:
+    """
+    Connection wrapper that counts the round-trips (statements, commits and rollbacks).
+
+    Args:
+        conn: The wrapped connection (a psycopg2 connection or a NullConnection).
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.round_trips = 0
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs), self)
+
+    def commit(self):
+        self.round_trips += 1
+        return self._conn.commit()
+
+    def rollback(self):
+        self.round_trips += 1
+        return self._conn.rollback()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class NullCursor:
+    """
+    Cursor that accepts every statement without a database behind it.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = 0
+
+    # Used by psycopg2.extras.execute_values to build the multi-row VALUES list
+    def mogrify(self, query, vars=None):
+        if isinstance(query, str):
+            query = query.encode('utf-8')
+        return query + repr(vars).encode('utf-8')
+
+    def execute(self, query, vars=None):
+        self.rowcount = 0
+
+    def executemany(self, query, vars_list):
+        self.rowcount = 0
+
+    def copy_expert(self, sql, file, size=8192):
+        while file.read(size):
+            pass
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class NullConnection:
+    """
+    Connection that accepts every statement without a database behind it.
+    """
+
+    encoding = 'UTF8'
+
+    def __init__(self):
+        self.closed = 0
+
+    def cursor(self, *args, **kwargs):
+        return NullCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+# Opens the PostgreSQL stand-in
+def connect_postgres():
+    dsn = os.environ.get('BENCH_POSTGRES_DSN')
+    if dsn:
+        import psycopg2
+        return CountingConnection(psycopg2.connect(dsn))
+    return CountingConnection(NullConnection())
+
+
+# Starts the S3 stand-in and creates an empty bucket for a run
+# Yields (bucket_name, endpoint_url), where endpoint_url is None for moto
+@contextmanager
+def local_s3():
+    endpoint_url = os.environ.get('S3_ENDPOINT_URL')
+    mock = None
+
+    if endpoint_url is None:
+        try:
+            from moto import mock_aws
+        except ImportError:
+            raise RuntimeError("Set S3_ENDPOINT_URL to a local S3 endpoint or install moto (pip install -r benchmarks/requirements.txt)")
+        mock = mock_aws()
+        mock.start()
+
+    try:
+        # A new bucket per run, so the uploader never skips objects left by a previous run
+        bucket_name = f"bench-{uuid.uuid4().hex[:12]}"
+        create_s3_client(endpoint_url).create_bucket(
+            Bucket=bucket_name,
+            CreateBucketConfiguration={'LocationConstraint': LOCAL_S3_REGION}
+        )
+        yield bucket_name, endpoint_url
+    finally:
+        if mock is not None:
+            mock.stop()
+
+
+def create_s3_client(endpoint_url=None):
+    return boto3.client(
+        's3',
+        aws_access_key_id=LOCAL_S3_KEY_ID,
+        aws_secret_access_key=LOCAL_S3_SECRET_KEY,
+        region_name=LOCAL_S3_REGION,
+        endpoint_url=endpoint_url
+    )
+
+
+# Counts the objects and bytes stored in a bucket
+def bucket_usage(bucket_name, endpoint_url=None):
+    objects = 0
+    size = 0
+    paginator = create_s3_client(endpoint_url).get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name):
+        for item in page.get('Contents', []):
+            objects += 1
+            size += item['Size']
+    return objects, size
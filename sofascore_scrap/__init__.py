@@ -0,0 +1,3 @@
+# SofaScore match data pipeline.
+# The stages are importable as modules of this package (e.g. `from sofascore_scrap.stage1_collect_match_keys
+# import MatchKeyCollector`); nothing is imported here so that `sofascore-scrap` stays fast to start.
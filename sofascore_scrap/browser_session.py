@@ -0,0 +1,171 @@
+import os
+from . import metrics
+
+# Measures the memory of the Chrome processes to recycle a bloated browser
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Warm browser sessions for the stages that visit one page per match.
+# - The driver is started once and reused: the window is maximized and the cookie consent accepted
+#   once per browser, not on every match.
+# - Chrome runs with a persistent profile (one directory per worker, Chrome locks it), so the
+#   cookies, the consent and the HTTP cache of the static assets are kept between runs.
+# - The driver is recycled (quit and started again on the next page) every N pages, or when the
+#   Chrome processes use more memory than a threshold, so long backfills do not slow down.
+#
+# Configuration (environment variables):
+#   BROWSER_PROFILE_DIR     directory of the profiles (default browser_profiles/, "none" for a temporary profile)
+#   BROWSER_RECYCLE_EVERY   pages before the driver is recycled (default 200, 0 to disable)
+#   BROWSER_MAX_MEMORY_MB   memory of the Chrome processes that triggers a recycle (default 2048, needs psutil)
+
+DEFAULT_PROFILE_DIR = 'browser_profiles'
+DEFAULT_RECYCLE_EVERY = 200
+DEFAULT_MAX_MEMORY_MB = 2048
+
+# Default timeout (seconds) of the session's WebDriverWait
+WAIT_TIMEOUT = 30
+
+# Cookie consent button of the site
+CONSENT_BUTTON_XPATH = '//button[contains(text(),"Accept")]'
+
+
+# Directory of a named profile, or None to let Chrome use a temporary profile
+def profile_dir(name):
+    base = os.environ.get('BROWSER_PROFILE_DIR', DEFAULT_PROFILE_DIR).strip()
+    if not base or base.lower() == 'none':
+        return None
+    return os.path.abspath(os.path.join(base, name))
+
+
+class BrowserStartError(RuntimeError):
+    """
+    Raised when the browser cannot be started (e.g. Chrome or chromedriver is missing).
+    """
+
+
+class BrowserSession:
+    """
+    A Chrome driver kept warm across pages, started on first use and recycled periodically.
+
+    Args:
+        create_driver (callable): Creates the driver; called with the profile directory (None for a temporary profile).
+        name (str): Name of the profile, unique per worker (e.g. 'stage2-0').
+        recycle_every (int): Pages before the driver is recycled (0 to disable).
+        max_memory_mb (float): Memory of the Chrome processes, in MB, that triggers a recycle (0 to disable).
+    """
+
+    def __init__(self, create_driver, name, recycle_every=None, max_memory_mb=None):
+        self.create_driver = create_driver
+        self.profile_dir = profile_dir(name)
+        self.recycle_every = int(os.environ.get('BROWSER_RECYCLE_EVERY', DEFAULT_RECYCLE_EVERY)) if recycle_every is None else recycle_every
+        self.max_memory_mb = float(os.environ.get('BROWSER_MAX_MEMORY_MB', DEFAULT_MAX_MEMORY_MB)) if max_memory_mb is None else max_memory_mb
+        self.driver = None
+        self.wait = None
+        self.pages = 0
+        self.consent_accepted = False
+
+        if self.max_memory_mb and psutil is None:
+            print(f"Warning: BROWSER_MAX_MEMORY_MB is {self.max_memory_mb:g} but psutil is not installed "
+                  "(pip install -r requirements.txt): the browser is only recycled every BROWSER_RECYCLE_EVERY pages")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        """
+        Returns the driver, starting the browser if it is not running.
+
+        Returns:
+            selenium.webdriver.Chrome: The driver.
+        """
+        if self.driver is None:
+            from selenium.webdriver.support.ui import WebDriverWait
+
+            if self.profile_dir:
+                os.makedirs(self.profile_dir, exist_ok=True)
+            try:
+                with metrics.timer('browser_start'):
+                    self.driver = self.create_driver(self.profile_dir)
+                    self.driver.maximize_window()
+            except Exception as e:
+                self.close()
+                raise BrowserStartError(f"Could not start the browser: {e}") from e
+            self.wait = WebDriverWait(self.driver, WAIT_TIMEOUT)
+            self.pages = 0
+            self.consent_accepted = False
+            metrics.incr('browser_started')
+        return self.driver
+
+    def accept_cookies(self):
+        """
+        Clicks the cookie consent button, until it has been accepted once by this browser.
+
+        With a persistent profile the consent is stored, so the button no longer shows up.
+        """
+        if self.consent_accepted:
+            return
+        from selenium.webdriver.common.by import By
+
+        # find_elements does not wait (nor raise) when the button is not there
+        for button in self.driver.find_elements(By.XPATH, CONSENT_BUTTON_XPATH):
+            try:
+                button.click()
+                self.consent_accepted = True
+                break
+            except Exception:
+                pass
+
+    # Memory (MB) used by chromedriver and the Chrome processes it started, or None if it cannot be measured
+    def memory_mb(self):
+        if psutil is None or self.driver is None:
+            return None
+        try:
+            process = psutil.Process(self.driver.service.process.pid)
+            processes = [process] + process.children(recursive=True)
+            return sum(child.memory_info().rss for child in processes if child.is_running()) / (1024 * 1024)
+        except Exception:
+            return None
+
+    def page_done(self):
+        """
+        Counts a visited page and recycles the driver if it reached the page or memory limit.
+        """
+        self.pages += 1
+        if self.recycle_every and self.pages >= self.recycle_every:
+            self.recycle(f"{self.pages} pages")
+            return
+
+        if self.max_memory_mb:
+            memory = self.memory_mb()
+            if memory is not None and memory > self.max_memory_mb:
+                self.recycle(f"{memory:.0f} MB used")
+
+    def check(self):
+        """
+        Recycles the driver if the browser stopped responding (e.g. after a crash of the tab).
+        """
+        if self.driver is None:
+            return
+        try:
+            self.driver.current_url
+        except Exception as e:
+            self.recycle(f"browser not responding: {e}")
+
+    def recycle(self, reason):
+        print(f"Recycling the browser ({reason})")
+        metrics.incr('browser_recycled')
+        self.close()
+
+    def close(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception as e:
+                print(f"Error closing the browser: {e}")
+            self.driver = None
+            self.wait = None
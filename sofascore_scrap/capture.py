@@ -0,0 +1,423 @@
+import base64
+import gzip
+import json
+import os
+import re
+import time
+import zlib
+from . import metrics
+from . import request_filter
+from . import response_cache
+
+# Decoders for the Brotli and Zstandard content encodings (Chrome advertises br and zstd, both in requirements.txt)
+# A missing one only fails the responses that use its encoding
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Default time (seconds) to wait for an intercepted API response
+RESPONSE_TIMEOUT = 15
+
+# Available capture backends:
+# cdp: reads the responses from the Chrome DevTools Protocol network events (no proxy)
+# seleniumwire: reads the responses stored by the selenium-wire proxy
+CAPTURE_BACKENDS = ('cdp', 'seleniumwire')
+
+# Interval (seconds) between two reads of the DevTools network events
+CDP_POLL_INTERVAL = 0.1
+
+# Size (bytes) of the DevTools buffer that keeps the response bodies
+CDP_BUFFER_SIZE = 100 * 1024 * 1024
+
+# Requests every URL of arguments[0] from the page at once, with the page's cookies,
+# and returns the status, headers and text body of each one (status 0 if the request failed)
+FETCH_SCRIPT = '''
+const urls = arguments[0];
+const done = arguments[arguments.length - 1];
+Promise.all(urls.map(url =>
+    fetch(url, {credentials: 'include'})
+        .then(response => response.text().then(body => ({
+            url: url,
+            status: response.status,
+            headers: Object.fromEntries(response.headers.entries()),
+            body: body
+        })))
+        .catch(error => ({url: url, status: 0, headers: {}, body: String(error)}))
+)).then(done);
+'''
+
+
+def exact_url(url):
+    """
+    Builds a pattern that only matches the given URL.
+
+    Args:
+        url (str): The full request URL.
+
+    Returns:
+        str: A regular expression anchored on both ends.
+    """
+    return '^' + re.escape(url) + '$'
+
+
+class CapturedResponse:
+    """
+    A response read from the DevTools network events, with the attributes the stages use
+    from a selenium-wire response.
+    """
+
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+
+class CapturedRequest:
+    def __init__(self, url, response):
+        self.url = url
+        self.response = response
+
+
+class SeleniumWireCapture:
+    """
+    Capture backend that reads the responses stored by the selenium-wire proxy.
+
+    Args:
+        driver (seleniumwire.webdriver.Chrome): The selenium-wire driver.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def wait(self, pattern, timeout):
+        from selenium.common.exceptions import TimeoutException
+
+        try:
+            # selenium-wire polls its request storage index and only returns requests with a response
+            return self.driver.wait_for_request(pattern, timeout=timeout)
+        except TimeoutException:
+            pass
+
+        # Fallback: the response may have been stored in a way the index lookup did not catch
+        for request in reversed(self.driver.requests):
+            if request.response and re.search(pattern, request.url):
+                return request
+        return None
+
+    def clear(self):
+        del self.driver.requests
+
+
+class CdpCapture:
+    """
+    Capture backend that reads the responses from the Chrome DevTools Protocol, without a proxy.
+
+    The Network.responseReceived and Network.loadingFinished events are read from the
+    performance log, and the body of a matching response is only requested (Network.getResponseBody)
+    when a stage asks for it. Only the responses in scope are tracked.
+
+    Args:
+        driver (selenium.webdriver.Chrome): A driver created with performance logging enabled.
+        scopes (list): Regular expressions of the URLs to track (all URLs if empty).
+    """
+
+    def __init__(self, driver, scopes=None):
+        self.driver = driver
+        self.scopes = [re.compile(scope) for scope in scopes or []]
+        self.responses = {}   # requestId -> CDP Response object of the in-scope responses
+        self.finished = []    # requestIds whose body has been fully received, in arrival order
+
+        # Larger buffers so the bodies are still available when they are requested
+        driver.execute_cdp_cmd('Network.enable', {
+            'maxTotalBufferSize': CDP_BUFFER_SIZE,
+            'maxResourceBufferSize': CDP_BUFFER_SIZE // 4
+        })
+
+    def in_scope(self, url):
+        return not self.scopes or any(scope.search(url) for scope in self.scopes)
+
+    # Reads the network events logged since the last call
+    def poll(self):
+        for entry in self.driver.get_log('performance'):
+            message = json.loads(entry['message'])['message']
+            method = message.get('method')
+
+            if method == 'Network.responseReceived':
+                params = message['params']
+                if self.in_scope(params['response']['url']):
+                    self.responses[params['requestId']] = params['response']
+            elif method == 'Network.loadingFinished':
+                request_id = message['params']['requestId']
+                if request_id in self.responses:
+                    self.finished.append(request_id)
+
+    # Requests the body of a finished response
+    def fetch(self, request_id):
+        response = self.responses[request_id]
+        try:
+            result = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+        except Exception as e:
+            print(f"Could not read the body of {response['url']}: {e}")
+            self.finished.remove(request_id)
+            return None
+
+        body = result.get('body', '')
+        body = base64.b64decode(body) if result.get('base64Encoded') else body.encode('utf-8')
+
+        # Chrome has already decoded the body, so its Content-Encoding no longer applies
+        headers = {name: value for name, value in response.get('headers', {}).items() if name.lower() != 'content-encoding'}
+        return CapturedRequest(response['url'], CapturedResponse(response.get('status'), headers, body))
+
+    def wait(self, pattern, timeout):
+        regex = re.compile(pattern)
+        deadline = time.monotonic() + timeout
+
+        while True:
+            self.poll()
+            # The most recent matching response first, like the selenium-wire fallback
+            for request_id in reversed(self.finished):
+                if regex.search(self.responses[request_id]['url']):
+                    request = self.fetch(request_id)
+                    if request is not None:
+                        return request
+
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(CDP_POLL_INTERVAL)
+
+    def clear(self):
+        self.poll()
+        self.responses.clear()
+        self.finished.clear()
+
+
+def capture_backend_name():
+    backend = os.environ.get('CAPTURE_BACKEND', 'cdp').strip().lower()
+    if backend not in CAPTURE_BACKENDS:
+        raise ValueError(f"Unknown CAPTURE_BACKEND {backend!r}, use one of {', '.join(CAPTURE_BACKENDS)}")
+    return backend
+
+
+def create_driver(options, scopes, backend=None):
+    """
+    Creates a Chrome driver with a capture backend that only tracks the given API URLs.
+
+    Args:
+        options (selenium.webdriver.chrome.options.Options): The Chrome options.
+        scopes (list): Regular expressions of the API URLs the stage reads.
+        backend (str): 'cdp' or 'seleniumwire'; defaults to the CAPTURE_BACKEND environment variable (cdp).
+
+    Returns:
+        selenium.webdriver.Chrome: The driver, with its capture backend in `driver.capture_backend`.
+    """
+    backend = backend or capture_backend_name()
+
+    if backend == 'cdp':
+        from selenium import webdriver
+
+        # The network events are read from the performance log
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        driver = webdriver.Chrome(options=options)
+        request_filter.apply(driver, scopes)
+        driver.capture_backend = CdpCapture(driver, scopes)
+    else:
+        from seleniumwire import webdriver
+
+        driver = webdriver.Chrome(options=options, seleniumwire_options=request_filter.seleniumwire_options())
+        request_filter.apply(driver, scopes)
+        driver.capture_backend = SeleniumWireCapture(driver)
+
+    return driver
+
+
+def get_backend(driver):
+    backend = getattr(driver, 'capture_backend', None)
+    return backend if backend is not None else SeleniumWireCapture(driver)
+
+
+def wait_for_response(driver, pattern, timeout=RESPONSE_TIMEOUT):
+    """
+    Waits until a request matching the pattern has been captured with its response.
+
+    Returns as soon as the response arrives instead of sleeping a fixed time.
+
+    Args:
+        driver (selenium.webdriver.Chrome): A driver created with `create_driver`.
+        pattern (str): Regular expression searched in the request URL.
+        timeout (float): Maximum time to wait, in seconds.
+
+    Returns:
+        The captured request (with `url` and `response.body`, `response.headers`, `response.status_code`),
+        or None if no response arrived.
+    """
+    with metrics.timer('wait_response'):
+        request = get_backend(driver).wait(pattern, timeout)
+
+    if request is None:
+        metrics.incr('responses_timed_out')
+        print(f"Timed out after {timeout}s waiting for a response matching {pattern}")
+    return request
+
+
+def find_response(driver, pattern):
+    """
+    Returns a response matching the pattern that has already been captured, without waiting.
+
+    Args:
+        driver (selenium.webdriver.Chrome): A driver created with `create_driver`.
+        pattern (str): Regular expression searched in the request URL.
+
+    Returns:
+        The captured request, or None if the page has not requested the URL.
+    """
+    return get_backend(driver).wait(pattern, 0)
+
+
+def fetch_in_page(driver, urls, timeout=RESPONSE_TIMEOUT):
+    """
+    Requests several URLs from the current page at once, with its cookies and session.
+
+    Used for the API calls the page only makes after a click: they are all sent together
+    instead of one interaction (and one wait) per call.
+
+    Args:
+        driver (selenium.webdriver.Chrome): The driver, with a page of the site loaded.
+        urls (list): The URLs to request.
+        timeout (float): Maximum time to wait for all the responses, in seconds.
+
+    Returns:
+        list: A request (like the captured ones, with a decoded body) per URL, or None if it could not be sent.
+    """
+    driver.set_script_timeout(timeout)
+    try:
+        with metrics.timer('fetch_in_page', requests=len(urls)):
+            results = driver.execute_async_script(FETCH_SCRIPT, urls)
+    except Exception as e:
+        print(f"Error requesting {', '.join(urls)} from the page: {e}")
+        return [None] * len(urls)
+
+    requests = []
+    for result in results:
+        if not result['status']:
+            print(f"Error requesting {result['url']} from the page: {result['body']}")
+            requests.append(None)
+            continue
+        # fetch() has already decoded the body, so its Content-Encoding no longer applies
+        headers = {name: value for name, value in result['headers'].items() if name.lower() != 'content-encoding'}
+        requests.append(CapturedRequest(result['url'], CapturedResponse(result['status'], headers, result['body'].encode('utf-8'))))
+    return requests
+
+
+def cache_response(request, json_data=None):
+    """
+    Stores a captured response in the response cache (successful responses and 404s only).
+
+    Args:
+        request: A captured request with its response.
+        json_data (dict): The parsed body, if the caller already has it.
+    """
+    cache = response_cache.get()
+    if cache is None or request is None or request.response.status_code not in (200, 404):
+        return
+    try:
+        cache.put(request.url, response_body(request), status=request.response.status_code, json_data=json_data)
+    except Exception as e:
+        print(f"Could not cache {request.url}: {e}")
+
+
+def clear_responses(driver):
+    """
+    Forgets the responses captured so far, so the next wait only sees the new ones.
+
+    Args:
+        driver (selenium.webdriver.Chrome): A driver created with `create_driver`.
+    """
+    get_backend(driver).clear()
+
+
+def decode_body(body, content_encoding=None):
+    """
+    Decodes a response body according to its Content-Encoding.
+
+    Args:
+        body (bytes): The body as received (still encoded).
+        content_encoding (str): The Content-Encoding header value (gzip, br, zstd, deflate or identity).
+
+    Returns:
+        bytes: The decoded body.
+    """
+    encoding = (content_encoding or 'identity').strip().lower()
+    metrics.incr('bytes_received', len(body))
+
+    with metrics.timer('decode', encoding=encoding):
+        body = _decode(body, encoding, content_encoding)
+    metrics.incr('bytes_decoded', len(body))
+    return body
+
+
+def _decode(body, encoding, content_encoding):
+    if encoding == 'identity':
+        return body
+    if encoding in ('gzip', 'x-gzip'):
+        return gzip.decompress(body)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # Some servers send raw deflate data without the zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    if encoding == 'br':
+        if brotli is None:
+            raise RuntimeError("The 'brotli' package is required to decode br responses (pip install -r requirements.txt)")
+        return brotli.decompress(body)
+    if encoding == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("The 'zstandard' package is required to decode zstd responses (pip install -r requirements.txt)")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+
+    raise ValueError(f"Unsupported Content-Encoding: {content_encoding}")
+
+
+def response_body(request):
+    """
+    Returns the decoded body of a captured response.
+
+    Args:
+        request (seleniumwire.request.Request): A captured request with its response.
+
+    Returns:
+        bytes: The decoded body.
+    """
+    return decode_body(request.response.body, request.response.headers.get('Content-Encoding'))
+
+
+def response_json(request):
+    body = response_body(request)
+    with metrics.timer('json_parse'):
+        return json.loads(body.decode('utf-8'))
+
+
+def gzip_response_body(request):
+    """
+    Returns the body of a captured response gzip-compressed.
+
+    A gzip body is returned as received, without decompressing and compressing it again. That is only
+    the case with the seleniumwire backend: the cdp backend captures the bodies already decoded by
+    Chrome (without their Content-Encoding), so they are compressed again.
+
+    Args:
+        request (seleniumwire.request.Request): A captured request with its response.
+
+    Returns:
+        bytes: The gzip-compressed body.
+    """
+    content_encoding = (request.response.headers.get('Content-Encoding') or '').strip().lower()
+    if content_encoding in ('gzip', 'x-gzip'):
+        return request.response.body
+    return gzip.compress(response_body(request))
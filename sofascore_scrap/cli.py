@@ -0,0 +1,46 @@
+import argparse
+import importlib
+import sys
+
+# Single command line entry point of the pipeline: `sofascore-scrap <command> [options]`
+# (or `python -m sofascore_scrap <command>`).
+# Only the module of the selected command is imported, so a command does not pay for the imports
+# of the others (selenium, boto3, pyarrow...).
+
+# command -> (module, description)
+COMMANDS = {
+    'setup-db': ('setup_database', "Create or upgrade the PostgreSQL schema"),
+    'collect': ('stage1_collect_match_keys', "Collect the keys of the ended matches of the configured seasons"),
+    'extract': ('stage2_extract_match_data', "Extract the statistics and info of the collected matches"),
+    'run': ('pipeline', "Collect the match keys and extract the match data in a single streaming run"),
+    'load': ('stage3_load_match_data', "Load the match info and statistics documents into PostgreSQL"),
+    'export': ('stage4_export_parquet', "Export the match info and statistics to a Parquet dataset partitioned by league-season"),
+    'state': ('state_store', "Import/export the scraping state from/to the legacy CSV files and manage the dead letters"),
+    'cache': ('response_cache', "Show or clean up the API response cache"),
+}
+
+
+def main(argv=None):
+    """
+    Parses the command line and runs the selected command.
+
+    Args:
+        argv (list): The arguments (default: sys.argv[1:]).
+    """
+    epilog = "commands:\n" + "\n".join(f"  {name:<10} {description}" for name, (_, description) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        prog='sofascore-scrap',
+        description="SofaScore match data pipeline",
+        epilog=epilog + "\n\nRun `sofascore-scrap <command> --help` for the options of a command.",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('command', choices=COMMANDS, metavar='command', help="One of: " + ", ".join(COMMANDS))
+    parser.add_argument('args', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    module_name, description = COMMANDS[args.command]
+    module = importlib.import_module(f'.{module_name}', __package__)
+
+    command_parser = argparse.ArgumentParser(prog=f"sofascore-scrap {args.command}", description=description)
+    module.add_arguments(command_parser)
+    module.main(command_parser.parse_args(args.args))
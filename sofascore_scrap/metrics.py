@@ -0,0 +1,242 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Lightweight per-process instrumentation of the scraping phases.
+# Timers and counters are kept in memory (a perf_counter call and a dict update under a lock);
+# the outputs are configured with environment variables:
+#   METRICS_JSONL      file where every timed phase is appended as a JSON line (plus a summary line at the end)
+#   METRICS_PROM_FILE  Prometheus text-format file written at the end of the run (e.g. for the node_exporter textfile collector)
+#   METRICS_PORT       port of a Prometheus /metrics endpoint served while the run is in progress
+
+# Prefix of the exported Prometheus metrics
+PREFIX = 'sofascore'
+
+_lock = threading.Lock()
+_timers = {}    # phase -> [count, total seconds, max seconds]
+_counters = {}  # name -> value
+_jsonl = None
+_jsonl_closed = False  # set by finish(): the process does not write events anymore
+_server = None
+
+
+# Opens METRICS_JSONL on first use; called under _lock
+def _open_jsonl():
+    global _jsonl
+    path = os.environ.get('METRICS_JSONL')
+    if path and _jsonl is None and not _jsonl_closed:
+        # Line buffered: each event is a single append, so several processes can share the file
+        _jsonl = open(path, mode='a', buffering=1, encoding='utf-8')
+    return _jsonl
+
+
+def observe(phase, seconds, **fields):
+    """
+    Records the duration of a phase.
+
+    Args:
+        phase (str): The phase name, e.g. 'page_load' or 's3_put'.
+        seconds (float): The measured duration.
+        **fields: Extra fields written to the JSON-lines event (e.g. the match ID).
+    """
+    with _lock:
+        timer = _timers.get(phase)
+        if timer is None:
+            _timers[phase] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            if seconds > timer[2]:
+                timer[2] = seconds
+
+        # Written under the lock, so the lines of the threads (S3 uploads, stage1 fetches) never interleave
+        # A worker process started with spawn or forkserver has not called start(): it opens the file on its first event
+        jsonl = _open_jsonl()
+        if jsonl is not None:
+            event = {'ts': round(time.time(), 3), 'pid': os.getpid(), 'phase': phase, 'seconds': round(seconds, 6)}
+            event.update(fields)
+            jsonl.write(json.dumps(event, default=str) + '\n')
+
+
+class timer:
+    """
+    Context manager that times a phase.
+
+    Example:
+        with metrics.timer('page_load', match=id_match):
+            driver.get(url)
+
+    Args:
+        phase (str): The phase name.
+        **fields: Extra fields written to the JSON-lines event.
+    """
+
+    __slots__ = ('phase', 'fields', 'started')
+
+    def __init__(self, phase, **fields):
+        self.phase = phase
+        self.fields = fields
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        observe(self.phase, time.perf_counter() - self.started, **self.fields)
+
+
+def incr(name, value=1):
+    """
+    Increments a counter, e.g. 'matches_processed' or 'bytes_uploaded'.
+
+    Args:
+        name (str): The counter name.
+        value (int): The increment.
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def snapshot():
+    """
+    Returns a copy of the current timers and counters.
+
+    Returns:
+        dict: {'timers': {phase: {'count', 'seconds', 'max_seconds'}}, 'counters': {name: value}}.
+    """
+    with _lock:
+        return {
+            'timers': {phase: {'count': t[0], 'seconds': t[1], 'max_seconds': t[2]} for phase, t in _timers.items()},
+            'counters': dict(_counters),
+        }
+
+
+def merge(other):
+    """
+    Adds a snapshot taken in another process (e.g. a stage2 worker) to the metrics of this process.
+
+    Args:
+        other (dict): A snapshot returned by `snapshot()`.
+    """
+    with _lock:
+        for phase, t in other.get('timers', {}).items():
+            timer_values = _timers.setdefault(phase, [0, 0.0, 0.0])
+            timer_values[0] += t['count']
+            timer_values[1] += t['seconds']
+            timer_values[2] = max(timer_values[2], t['max_seconds'])
+        for name, value in other.get('counters', {}).items():
+            _counters[name] = _counters.get(name, 0) + value
+
+
+def reset():
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+
+def prometheus_text():
+    """
+    Formats the metrics in the Prometheus text exposition format.
+
+    Returns:
+        str: The metrics text.
+    """
+    data = snapshot()
+    lines = [
+        f"# HELP {PREFIX}_phase_seconds Time spent in each phase of the run.",
+        f"# TYPE {PREFIX}_phase_seconds summary",
+    ]
+    for phase, t in sorted(data['timers'].items()):
+        lines.append(f'{PREFIX}_phase_seconds_sum{{phase="{phase}"}} {t["seconds"]:.6f}')
+        lines.append(f'{PREFIX}_phase_seconds_count{{phase="{phase}"}} {t["count"]}')
+    lines.append(f"# HELP {PREFIX}_phase_max_seconds Longest single occurrence of each phase.")
+    lines.append(f"# TYPE {PREFIX}_phase_max_seconds gauge")
+    for phase, t in sorted(data['timers'].items()):
+        lines.append(f'{PREFIX}_phase_max_seconds{{phase="{phase}"}} {t["max_seconds"]:.6f}')
+    for name, value in sorted(data['counters'].items()):
+        lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+        lines.append(f"{PREFIX}_{name}_total {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path):
+    # Write to a temporary file first so a scraper never reads a half written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, mode='w', encoding='utf-8') as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start():
+    """
+    Opens the outputs configured in the environment. Called once by the main process of each script.
+    """
+    global _server, _jsonl_closed
+    with _lock:
+        _jsonl_closed = False
+        _open_jsonl()
+
+    port = os.environ.get('METRICS_PORT')
+    if port and _server is None:
+        _server = ThreadingHTTPServer(('', int(port)), MetricsHandler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://localhost:{port}/metrics")
+
+
+def finish():
+    """
+    Writes the final metrics to the configured outputs and prints a summary of the phases.
+    """
+    global _jsonl, _jsonl_closed, _server
+    data = snapshot()
+
+    with _lock:
+        if _jsonl is not None:
+            _jsonl.write(json.dumps({'ts': round(time.time(), 3), 'pid': os.getpid(), 'summary': data}) + '\n')
+            _jsonl.close()
+            _jsonl = None
+        _jsonl_closed = True
+
+    path = os.environ.get('METRICS_PROM_FILE')
+    if path:
+        write_prometheus(path)
+
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
+
+    print_summary(data)
+
+
+def print_summary(data=None):
+    data = data or snapshot()
+    if not data['timers'] and not data['counters']:
+        return
+
+    print("Time per phase:")
+    for phase, t in sorted(data['timers'].items(), key=lambda item: item[1]['seconds'], reverse=True):
+        print(f"  {phase:<20} {t['seconds']:>10.2f}s  count {t['count']:>7}  avg {t['seconds'] / t['count'] * 1000:>9.1f}ms  max {t['max_seconds'] * 1000:>9.1f}ms")
+    print("Counters:")
+    for name, value in sorted(data['counters'].items()):
+        print(f"  {name:<20} {value}")
+
@@ -0,0 +1,128 @@
+import argparse
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from . import metrics
+from . import rate_limiter
+from . import response_cache
+from .stage1_collect_match_keys import MatchKeyCollector, add_collect_arguments, load_leagues
+from .stage2_extract_match_data import ENDPOINTS, DEFAULT_ENDPOINTS, parse_endpoints, run_queue_consumer, matches_to_extract
+from .state_store import StateStore
+
+# Runs stage1 and stage2 at the same time:
+# stage1 pushes every new ended match onto a bounded queue as soon as it is recorded,
+# and the stage2 workers pull the matches from the queue and extract them immediately.
+# The matches that were pending before the run are fed to the same queue.
+# The workers start their browser on their first match, and a run with nothing to collect
+# nor extract returns before starting any worker.
+
+
+# Puts a match on the queue, giving up if every stage2 worker has stopped
+# (otherwise stage1 would block forever on a full queue)
+def enqueue(match_queue, match, consumers):
+    while True:
+        try:
+            match_queue.put(match, timeout=5)
+            return
+        except queue.Full:
+            if all(consumer.done() for consumer in consumers):
+                raise RuntimeError("All stage2 workers have stopped")
+
+# Puts the matches left by previous runs on the queue
+def feed_backlog(match_queue, backlog, consumers):
+    try:
+        for match in backlog:
+            enqueue(match_queue, match, consumers)
+    except RuntimeError as e:
+        print(f"Backlog not fully queued: {e}")
+
+
+# Adds the pipeline command line arguments (stage1's included) to a parser
+def add_arguments(parser):
+    add_collect_arguments(parser)
+    parser.add_argument('--workers', type=int, default=2, help="Number of stage2 worker processes, each one with its own browser")
+    parser.add_argument('--raw', action='store_true', help="Store the gzip API bodies as .json.gz instead of pretty-printed JSON (the original bytes only with CAPTURE_BACKEND=seleniumwire)")
+    parser.add_argument('--endpoints', help=f"Comma-separated match endpoints stage2 stores (available: {', '.join(ENDPOINTS)}; default: STAGE2_ENDPOINTS or {','.join(DEFAULT_ENDPOINTS)})")
+    parser.add_argument('--manifest', help="List of the stored documents used by the pre-flight check instead of the bucket: a local copy of the bucket or a file with one key per line")
+    parser.add_argument('--no-preflight', action='store_true', help="Do not check which backlog matches are already stored")
+    parser.add_argument('--queue-size', type=int, default=100, help="Maximum number of matches waiting for a stage2 worker")
+
+# Runs stage1 and stage2 with the parsed command line arguments
+def main(args):
+    endpoints = parse_endpoints(args.endpoints)
+    if args.offline:
+        response_cache.set_offline()
+
+    leagues = load_leagues()
+    metrics.start()
+
+    # Matches collected by previous runs that stage2 has not completed yet
+    with StateStore() as store:
+        backlog = matches_to_extract(store, endpoints, manifest=args.manifest, preflight=not args.no_preflight)
+        # Every season finished and nothing left to extract (e.g. an incremental run from cron)
+        idle = not backlog and all(store.is_season_finished(league['id_season']) for league in leagues)
+
+    if idle:
+        print("Nothing to collect or extract")
+        metrics.finish()
+        return
+
+    processed = []
+    errors = []
+
+    # Stage1 and every stage2 worker draw from the same rate limit
+    limiter = rate_limiter.get()
+
+    with multiprocessing.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=rate_limiter.install, initargs=(limiter,)) as executor:
+        match_queue = manager.Queue(maxsize=args.queue_size)
+        consumers = [
+            executor.submit(run_queue_consumer, match_queue, raw=args.raw, endpoints=endpoints, worker=worker)
+            for worker in range(args.workers)
+        ]
+
+        # Feed the backlog while stage1 is running
+        feeder = threading.Thread(target=feed_backlog, args=(match_queue, backlog, consumers), daemon=True)
+        feeder.start()
+
+        try:
+            collector = MatchKeyCollector(
+                mode=args.mode,
+                max_workers=args.max_workers,
+                on_match=lambda match: enqueue(match_queue, match, consumers)
+            )
+            with collector:
+                collector.run(leagues)
+        except Exception as error:
+            print("Error running stage1: ", error)
+        finally:
+            # Clean shutdown: one sentinel per worker once every match has been queued
+            feeder.join()
+            try:
+                for _ in consumers:
+                    enqueue(match_queue, None, consumers)
+            except RuntimeError:
+                pass
+
+        for consumer in consumers:
+            try:
+                consumer_processed, consumer_errors, consumer_metrics = consumer.result()
+                processed.extend(consumer_processed)
+                errors.extend(consumer_errors)
+                metrics.merge(consumer_metrics)
+            except Exception as e:
+                print(f"Worker failed: {e}")
+
+    print(f"Matches processed: {len(processed)}")
+    print(f"Errors (matches and S3 keys): {len(errors)}")
+    for item, error in errors:
+        print(f"  {item}: {error}")
+
+    metrics.finish()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Collect the match keys and extract the match data in a single streaming run")
+    add_arguments(parser)
+    main(parser.parse_args())
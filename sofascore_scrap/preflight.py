@@ -0,0 +1,93 @@
+import os
+import re
+from . import metrics
+
+# Pre-flight check of stage2: the documents already in the bucket are listed once per league
+# (paginated ListObjectsV2, or a local manifest), and only the matches that are missing one of
+# them are sent to the browser. The others are marked as done without loading their page.
+# An optional endpoint the API does not have for a match (404, recorded by stage2) counts as stored.
+
+# Match document names: <prefix>/<league>/<slug>-<id>-<suffix>.json(.gz)
+document_pattern = re.compile(r'(?:^|/)(matche_[a-z_]+)/([^/]+)/[^/]*-(\d+)-[a-z-]+\.json(?:\.gz)?$')
+
+
+def read_manifest(path):
+    """
+    Reads the document names of a local manifest.
+
+    Args:
+        path (str): A local copy of the bucket (directory), or a text file with one key per line
+            (the output of `aws s3 ls --recursive` works too: the key is the last column).
+
+    Returns:
+        list: The document names.
+    """
+    if os.path.isdir(path):
+        names = []
+        for dirpath, _, filenames in os.walk(path):
+            names.extend(os.path.relpath(os.path.join(dirpath, filename), path).replace(os.sep, '/') for filename in filenames)
+        return names
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.split()[-1] for line in f if line.strip()]
+
+
+def stored_documents(names):
+    """
+    Groups document names by prefix.
+
+    Args:
+        names (iterable): Keys or paths of the stage2 documents (.json or .json.gz).
+
+    Returns:
+        dict: prefix (e.g. 'matche_info') -> set of the match IDs stored under it.
+    """
+    stored = {}
+    for name in names:
+        match = document_pattern.search(name)
+        if match:
+            stored.setdefault(match.group(1), set()).add(int(match.group(3)))
+    return stored
+
+
+def split_pending(matches, prefixes, s3=None, bucket_name=None, manifest=None, absent=None):
+    """
+    Splits the matches into the ones stage2 still has to extract and the ones already stored.
+
+    Args:
+        matches (list): Match keys (dicts with 'id' and 'league').
+        prefixes (list): Prefixes of the documents every match must have (e.g. ['matche_info', 'matche_stats']).
+        s3 (boto3.client): S3 client used to list the bucket (ignored if a manifest is given).
+        bucket_name (str): Name of the bucket.
+        manifest (str): Local manifest read instead of the bucket (see `read_manifest`).
+        absent (dict): Match ID -> set of the prefixes the match has no document for (the endpoint returned 404).
+
+    Returns:
+        tuple: (pending matches, IDs of the matches whose documents are all stored).
+    """
+    with metrics.timer('preflight'):
+        if manifest:
+            stored = stored_documents(read_manifest(manifest))
+        else:
+            # Same listing as stage3 (imported here: stage2 only needs it when the bucket is listed)
+            from .stage3_load_match_data import list_s3_documents
+
+            # One listing per prefix and league, instead of one page load per match
+            names = []
+            for league in sorted({match['league'] for match in matches}):
+                for prefix in prefixes:
+                    names.extend(list_s3_documents(s3, f"{prefix}/{league}/", bucket=bucket_name))
+            stored = stored_documents(names)
+
+    absent = absent or {}
+    pending = []
+    done = []
+    for match in matches:
+        id_match = int(match['id'])
+        if all(id_match in stored.get(prefix, ()) or prefix in absent.get(id_match, ()) for prefix in prefixes):
+            done.append(match['id'])
+        else:
+            pending.append(match)
+
+    metrics.incr('preflight_skipped', len(done))
+    return pending, done
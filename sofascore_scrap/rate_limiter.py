@@ -0,0 +1,241 @@
+import heapq
+import multiprocessing
+import os
+import random
+import time
+from . import metrics
+
+# Request pacing shared by every driver and HTTP session of a run.
+# - RateLimiter: token bucket kept in shared memory, so the stage2 worker processes (and stage1
+#   in the streaming pipeline) draw from the same budget. The rate adapts: it is cut on every
+#   throttling response and slowly raised again while the requests succeed (AIMD).
+# - RetryQueue: failed items are retried later, with exponential backoff and jitter.
+#
+# Configuration (environment variables):
+#   RATE_LIMIT       initial rate, in requests (page loads or API calls) per second
+#   RATE_LIMIT_MIN   lowest rate reached after repeated throttling
+#   RATE_LIMIT_MAX   highest rate reached while the requests succeed
+#   RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY   attempts and backoff (seconds) of the retry queue
+
+# HTTP status codes the site uses to throttle
+THROTTLE_STATUSES = (403, 429)
+
+DEFAULT_RATE = 2.0
+DEFAULT_MIN_RATE = 0.1
+DEFAULT_MAX_RATE = 8.0
+
+# Retry queue defaults: attempts (including the first one) and backoff delays (seconds)
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 30.0
+DEFAULT_MAX_DELAY = 600.0
+
+# Pause applied to every worker after a throttling response without Retry-After (seconds)
+DEFAULT_COOLDOWN = 10.0
+
+# Positions in the shared state array
+_TOKENS, _LAST, _RATE, _PAUSED_UNTIL, _SUCCESSES = range(5)
+
+
+class ThrottledError(RuntimeError):
+    """
+    Raised when the site answers with a throttling status (or an empty page).
+
+    Args:
+        message (str): The error message.
+        retry_after (float): Seconds to wait, if the response said so.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    Token bucket shared between processes, with an adaptive rate.
+
+    Create it in the parent process and pass it to the workers with `install` as the
+    ProcessPoolExecutor initializer; threads of the same process can use it directly.
+
+    Args:
+        rate (float): Initial rate, in requests per second.
+        burst (int): Maximum number of requests sent at once after an idle period.
+        min_rate (float): Lowest rate.
+        max_rate (float): Highest rate.
+        decrease (float): Factor applied to the rate on every throttling response.
+        increase (float): Rate added after `increase_after` consecutive successes.
+        increase_after (int): Consecutive successes needed to raise the rate.
+    """
+
+    def __init__(self, rate=None, burst=4, min_rate=None, max_rate=None, decrease=0.5, increase=0.25, increase_after=20):
+        self.min_rate = min_rate or float(os.environ.get('RATE_LIMIT_MIN', DEFAULT_MIN_RATE))
+        self.max_rate = max_rate or float(os.environ.get('RATE_LIMIT_MAX', DEFAULT_MAX_RATE))
+        rate = rate or float(os.environ.get('RATE_LIMIT', DEFAULT_RATE))
+        self.burst = burst
+        self.decrease = decrease
+        self.increase = increase
+        self.increase_after = increase_after
+
+        self._lock = multiprocessing.Lock()
+        self._state = multiprocessing.RawArray('d', [float(burst), time.time(), min(max(rate, self.min_rate), self.max_rate), 0.0, 0.0])
+
+    @property
+    def rate(self):
+        return self._state[_RATE]
+
+    def acquire(self):
+        """
+        Blocks until the request can be sent.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                state = self._state
+                now = time.time()
+                if now < state[_PAUSED_UNTIL]:
+                    delay = state[_PAUSED_UNTIL] - now
+                else:
+                    tokens = min(self.burst, state[_TOKENS] + (now - state[_LAST]) * state[_RATE])
+                    state[_LAST] = now
+                    if tokens >= 1:
+                        state[_TOKENS] = tokens - 1
+                        break
+                    state[_TOKENS] = tokens
+                    delay = (1 - tokens) / state[_RATE]
+            time.sleep(delay)
+            waited += delay
+
+        if waited:
+            metrics.observe('rate_limit_wait', waited)
+
+    def on_success(self):
+        with self._lock:
+            state = self._state
+            state[_SUCCESSES] += 1
+            if state[_SUCCESSES] >= self.increase_after and state[_RATE] < self.max_rate:
+                state[_RATE] = min(self.max_rate, state[_RATE] + self.increase)
+                state[_SUCCESSES] = 0
+
+    def on_throttle(self, retry_after=None):
+        """
+        Cuts the rate and pauses every worker after a throttling response.
+
+        Args:
+            retry_after (float): Seconds to pause, if the response said so.
+        """
+        pause = DEFAULT_COOLDOWN if retry_after is None else retry_after
+        with self._lock:
+            state = self._state
+            now = time.time()
+            state[_RATE] = max(self.min_rate, state[_RATE] * self.decrease)
+            state[_PAUSED_UNTIL] = max(state[_PAUSED_UNTIL], now + pause)
+            state[_TOKENS] = 0.0
+            state[_SUCCESSES] = 0
+            rate = state[_RATE]
+
+        metrics.incr('throttled')
+        print(f"Throttled by the site: pausing {pause:.1f}s, rate lowered to {rate:.2f} requests/s")
+
+
+class RetryQueue:
+    """
+    Items waiting to be retried, with exponential backoff and jitter.
+
+    Args:
+        max_attempts (int): Attempts (including the first one) before an item is given up.
+        base_delay (float): Delay before the first retry, in seconds.
+        max_delay (float): Upper bound of the delay, in seconds.
+    """
+
+    def __init__(self, max_attempts=None, base_delay=None, max_delay=None):
+        self.max_attempts = max_attempts or int(os.environ.get('RETRY_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS))
+        self.base_delay = float(os.environ.get('RETRY_BASE_DELAY', DEFAULT_BASE_DELAY)) if base_delay is None else base_delay
+        self.max_delay = float(os.environ.get('RETRY_MAX_DELAY', DEFAULT_MAX_DELAY)) if max_delay is None else max_delay
+        self._heap = []
+        self._counter = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, item, attempts):
+        """
+        Schedules another attempt of an item.
+
+        Args:
+            item: The item to retry.
+            attempts (int): Attempts made so far.
+
+        Returns:
+            bool: False if the item has no attempts left (it should go to the dead-letter list).
+        """
+        if attempts >= self.max_attempts:
+            return False
+
+        ready_at = time.time() + backoff_delay(attempts - 1, self.base_delay, self.max_delay)
+        # The counter keeps the heap from comparing the items themselves
+        heapq.heappush(self._heap, (ready_at, self._counter, attempts, item))
+        self._counter += 1
+        return True
+
+    def pop_ready(self):
+        """
+        Removes the items whose retry time has come.
+
+        Returns:
+            list: (item, attempts) tuples.
+        """
+        ready = []
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, attempts, item = heapq.heappop(self._heap)
+            ready.append((item, attempts))
+        return ready
+
+    def next_delay(self):
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - time.time())
+
+
+# Exponential backoff with jitter: half of the delay is fixed, the other half random
+def backoff_delay(attempt, base_delay=1.0, max_delay=60.0):
+    delay = min(max_delay, base_delay * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+# Reads the Retry-After header (in seconds) of a response, if any
+# The header name is matched case-insensitively (the DevTools headers keep the HTTP/2 lowercase names)
+def retry_after_seconds(headers):
+    for name, value in (headers or {}).items():
+        if name.lower() == 'retry-after':
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+
+_limiter = None
+
+
+def install(limiter):
+    """
+    Sets the limiter used by this process (ProcessPoolExecutor initializer of the workers).
+
+    Args:
+        limiter (RateLimiter): The limiter created by the parent process.
+    """
+    global _limiter
+    _limiter = limiter
+
+
+def get():
+    """
+    Returns the limiter of this process, creating one from the environment settings if none was installed.
+
+    Returns:
+        RateLimiter: The limiter.
+    """
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter()
+    return _limiter
@@ -0,0 +1,123 @@
+import os
+import re
+
+# Request filtering for the Chrome drivers of both stages.
+# - Capture: only the API calls that match the stage's scopes are tracked by the capture backend.
+#   selenium-wire still terminates TLS for every request that goes through its proxy and only skips
+#   storing the out-of-scope ones; the third-party hosts (ads, analytics, CDNs) bypass the proxy entirely
+#   (exclude_hosts), so they are neither decrypted nor slowed down by it.
+# - Blocking: images, fonts, media, ads and analytics are blocked inside Chrome (image content
+#   setting and the DevTools Network.setBlockedURLs command), so they never reach the proxy.
+#   selenium-wire's request_interceptor is not used for this: it is only called for in-scope requests.
+#
+# Configuration (environment variables):
+#   BROWSER_BLOCK=0        disables the blocking (the capture scopes are always applied)
+#   BROWSER_BLOCK_EXTRA    extra comma-separated URL patterns to block, with * as wildcard
+
+# URL patterns blocked in Chrome (* matches any sequence of characters)
+BLOCKED_URL_PATTERNS = [
+    # Images, team/player logos, fonts and media
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.mp4', '*.webm', '*.mp3',
+    '*img.sofascore.com/*', '*/image', '*/image?*',
+    # Ads and analytics
+    '*googletagmanager.com/*', '*google-analytics.com/*', '*doubleclick.net/*',
+    '*googlesyndication.com/*', '*adservice.google.*', '*googleadservices.com/*',
+    '*amazon-adsystem.com/*', '*facebook.net/*', '*connect.facebook.com/*',
+    '*criteo.com/*', '*criteo.net/*', '*taboola.com/*', '*outbrain.com/*',
+    '*scorecardresearch.com/*', '*hotjar.com/*', '*clarity.ms/*',
+    '*adnxs.com/*', '*pubmatic.com/*', '*rubiconproject.com/*', '*openx.net/*',
+    '*quantserve.com/*', '*sentry.io/*', '*sentry-cdn.com/*',
+]
+
+# Third-party hosts that bypass the selenium-wire proxy (Chrome's proxy bypass list, * as wildcard)
+# Only the sofascore.com requests have to go through it
+PROXY_BYPASS_HOSTS = [
+    '*.googletagmanager.com', '*.google-analytics.com', '*.doubleclick.net', '*.googlesyndication.com',
+    '*.googleadservices.com', 'adservice.google.com', '*.gstatic.com', '*.googleapis.com',
+    '*.amazon-adsystem.com', '*.facebook.net', 'connect.facebook.com', '*.criteo.com', '*.criteo.net',
+    '*.taboola.com', '*.outbrain.com', '*.scorecardresearch.com', '*.hotjar.com', '*.clarity.ms',
+    '*.adnxs.com', '*.pubmatic.com', '*.rubiconproject.com', '*.openx.net', '*.quantserve.com',
+    '*.sentry.io', '*.sentry-cdn.com', '*.cloudflareinsights.com',
+]
+
+# SofaScore API root as requested by the pages
+PAGE_API_URL = 'https://www.sofascore.com/api/v1'
+
+# API calls read by stage1: the season's rounds list and the events of each round
+STAGE1_SCOPES = [
+    '^' + re.escape(PAGE_API_URL) + r'/unique-tournament/\d+/season/\d+/(?:rounds|events/round/\d+)(?:[/?]|$)',
+]
+
+# API calls read by stage2: the match info and the endpoints it can store (see stage2 ENDPOINTS)
+STAGE2_SCOPES = [
+    '^' + re.escape(PAGE_API_URL) + r'/event/\d+(?:/(?:statistics|lineups|incidents|shotmap))?(?:\?|$)',
+]
+
+
+def blocking_enabled():
+    return os.environ.get('BROWSER_BLOCK', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+def blocked_url_patterns():
+    """
+    Returns the URL patterns to block, including the ones added with BROWSER_BLOCK_EXTRA.
+
+    Returns:
+        list: Patterns with * as wildcard.
+    """
+    extra = os.environ.get('BROWSER_BLOCK_EXTRA', '')
+    return BLOCKED_URL_PATTERNS + [pattern.strip() for pattern in extra.split(',') if pattern.strip()]
+
+
+def configure_options(options):
+    """
+    Adds the Chrome settings that keep the non-essential resources from being requested.
+
+    Args:
+        options (selenium.webdriver.chrome.options.Options): The options used to create the driver.
+    """
+    if not blocking_enabled():
+        return
+
+    # Images are not even requested (the layout still reserves their space)
+    options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+    options.add_argument('--blink-settings=imagesEnabled=false')
+
+
+def seleniumwire_options():
+    """
+    Returns the selenium-wire options: the captured responses are few and small, so they are kept in memory,
+    and the third-party hosts bypass the proxy.
+
+    Returns:
+        dict: The seleniumwire_options argument of the driver.
+    """
+    return {
+        'request_storage': 'memory',
+        'request_storage_max_size': 500,
+        'exclude_hosts': PROXY_BYPASS_HOSTS,
+    }
+
+
+def apply(driver, scopes):
+    """
+    Restricts the selenium-wire capture to the given API URL patterns and blocks the non-essential requests.
+
+    Args:
+        driver (selenium.webdriver.Chrome): The driver (selenium-wire or plain Chrome for the CDP capture).
+        scopes (list): Regular expressions of the URLs to capture (e.g. STAGE1_SCOPES).
+    """
+    # Plain Chrome drivers have no proxy: the CDP capture applies the scopes itself
+    if hasattr(driver, 'scopes'):
+        driver.scopes = scopes
+
+    if not blocking_enabled():
+        return
+
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked_url_patterns()})
+    except Exception as e:
+        # The capture still works, only without blocking
+        print(f"Could not enable request blocking: {e}")
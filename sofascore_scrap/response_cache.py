@@ -0,0 +1,353 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from . import metrics
+
+# On-disk cache of the decoded API responses read by both stages, so the data can be processed
+# again (after a parser change or a failed upload) without scraping the site again.
+# - Entries are keyed by the endpoint path (the part after /api/v1), so the responses captured from
+#   the browser and the ones requested directly share the same entries.
+# - Bodies are stored once per content (content-addressed by their SHA-256), gzip-compressed.
+# - The index (SQLite, WAL mode) keeps the last access of every entry: above the size cap the least
+#   recently used entries are evicted.
+# - Freshness: an ended match and its sub-resources never change, so they never expire; the rounds
+#   list and the rounds that still have matches to play expire after RESPONSE_CACHE_TTL.
+#
+# Configuration (environment variables):
+#   RESPONSE_CACHE_DIR       cache directory (default response_cache/, "none" disables the cache)
+#   RESPONSE_CACHE_MAX_MB    size cap of the stored bodies (default 1024)
+#   RESPONSE_CACHE_TTL       lifetime of the entries that can still change, in seconds (default 3600)
+#   RESPONSE_CACHE_OFFLINE=1 only the cache is read (expired entries included): no browser, no request
+
+DEFAULT_DIR = 'response_cache'
+DEFAULT_MAX_MB = 1024
+DEFAULT_TTL = 3600
+
+# Puts between two checks of the size cap
+EVICT_EVERY = 50
+
+# Event statuses that will not change anymore
+FINAL_STATUSES = ('finished', 'canceled')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_accessed_at ON entries (accessed_at);
+CREATE INDEX IF NOT EXISTS idx_entries_digest ON entries (digest);
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+"""
+
+
+class CacheMiss(LookupError):
+    """
+    Raised in offline mode when a response is not in the cache.
+    """
+
+
+def cache_key(url):
+    """
+    Builds the cache key of an API URL: the path after /api/v1, with its query string.
+
+    Args:
+        url (str): The endpoint URL (site or replay server).
+
+    Returns:
+        str: The key, e.g. '/event/11352300/statistics'.
+    """
+    match = re.search(r'/api/v1(/.*)$', url)
+    return match.group(1) if match else url
+
+
+def freshness(key, json_data, status, ttl):
+    """
+    Returns how long an entry stays fresh.
+
+    Args:
+        key (str): The cache key.
+        json_data (dict): The decoded response (None if it is not JSON).
+        status (int): The HTTP status of the response.
+        ttl (float): Lifetime of the entries that can still change, in seconds.
+
+    Returns:
+        float: Seconds, or None if the entry never expires.
+    """
+    if status == 200 and json_data is not None:
+        # Sub-resources of a match (statistics, lineups...) are only requested for ended matches
+        if re.match(r'^/event/\d+/', key):
+            return None
+        if re.match(r'^/event/\d+(?:\?|$)', key):
+            return None if json_data.get('event', {}).get('status', {}).get('type') in FINAL_STATUSES else ttl
+        if '/events/round/' in key:
+            events = json_data.get('events', [])
+            return None if events and all(event.get('status', {}).get('type') in FINAL_STATUSES for event in events) else ttl
+    return ttl
+
+
+def offline():
+    return os.environ.get('RESPONSE_CACHE_OFFLINE', '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def set_offline(enabled=True):
+    """
+    Enables the offline mode for this process and the worker processes it starts.
+
+    Args:
+        enabled (bool): True to only read the cache.
+    """
+    os.environ['RESPONSE_CACHE_OFFLINE'] = '1' if enabled else '0'
+
+
+class ResponseCache:
+    """
+    On-disk cache of decoded API responses, with LRU eviction and freshness rules.
+
+    Safe to use from several processes (each one opens its own index connection) and threads.
+
+    Args:
+        path (str): Cache directory.
+        max_bytes (int): Size cap of the stored (compressed) bodies.
+        ttl (float): Lifetime of the entries that can still change, in seconds.
+    """
+
+    def __init__(self, path=None, max_bytes=None, ttl=None):
+        self.path = os.path.abspath(path or os.environ.get('RESPONSE_CACHE_DIR', DEFAULT_DIR))
+        self.max_bytes = max_bytes or int(float(os.environ.get('RESPONSE_CACHE_MAX_MB', DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.ttl = ttl or float(os.environ.get('RESPONSE_CACHE_TTL', DEFAULT_TTL))
+        self.puts = 0
+        self.lock = threading.RLock()
+
+        os.makedirs(os.path.join(self.path, 'blobs'), exist_ok=True)
+        # Shared by the threads of the process (stage1 requests several rounds at once), behind the lock
+        self.conn = sqlite3.connect(os.path.join(self.path, 'index.db'), timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def blob_path(self, digest):
+        return os.path.join(self.path, 'blobs', digest[:2], digest + '.gz')
+
+    def get(self, url, allow_stale=None):
+        """
+        Reads a cached response.
+
+        Args:
+            url (str): The endpoint URL.
+            allow_stale (bool): Also return expired entries (default: only in offline mode).
+
+        Returns:
+            tuple: (status, decoded body), or None if the response is not cached (or expired).
+        """
+        key = cache_key(url)
+        allow_stale = offline() if allow_stale is None else allow_stale
+        now = time.time()
+
+        with self.lock:
+            row = self.conn.execute("SELECT digest, status, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or (not allow_stale and row[2] is not None and row[2] <= now):
+            metrics.incr('cache_misses')
+            return None
+
+        try:
+            with open(self.blob_path(row[0]), 'rb') as f:
+                body = gzip.decompress(f.read())
+        except OSError:
+            # The blob was evicted by another process in the meantime
+            metrics.incr('cache_misses')
+            return None
+
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        metrics.incr('cache_hits')
+        return row[1], body
+
+    def get_json(self, url, allow_stale=None):
+        """
+        Reads a cached JSON response with status 200.
+
+        Returns:
+            dict: The JSON payload, or None if it is not cached.
+        """
+        cached = self.get(url, allow_stale)
+        if cached is None or cached[0] != 200:
+            return None
+        return json.loads(cached[1].decode('utf-8'))
+
+    def put(self, url, body, status=200, json_data=None):
+        """
+        Stores a decoded response.
+
+        Args:
+            url (str): The endpoint URL.
+            body (bytes): The decoded body.
+            status (int): The HTTP status (200, or 404 for an endpoint a match does not have).
+            json_data (dict): The parsed body, if the caller already has it (used by the freshness rules).
+        """
+        key = cache_key(url)
+        if json_data is None and status == 200:
+            try:
+                json_data = json.loads(body.decode('utf-8'))
+            except ValueError:
+                json_data = None
+        ttl = freshness(key, json_data, status, self.ttl)
+        now = time.time()
+
+        # Identical bodies are stored once
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            compressed = gzip.compress(body, compresslevel=6)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(temp_path, path)
+            size = len(compressed)
+        else:
+            size = os.path.getsize(path)
+
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO blobs (digest, size) VALUES (?, ?)", (digest, size))
+            self.conn.execute(
+                "INSERT INTO entries (key, digest, status, stored_at, accessed_at, expires_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET digest = excluded.digest, status = excluded.status, "
+                "stored_at = excluded.stored_at, accessed_at = excluded.accessed_at, expires_at = excluded.expires_at",
+                (key, digest, status, now, now, now + ttl if ttl is not None else None)
+            )
+        metrics.incr('cache_puts')
+
+        with self.lock:
+            self.puts += 1
+            if self.puts % EVICT_EVERY == 0:
+                self.evict()
+
+    def size(self):
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def evict(self, max_bytes=None):
+        """
+        Removes the least recently used entries until the stored bodies fit in the size cap.
+
+        Args:
+            max_bytes (int): Size cap (default: the cache's).
+
+        Returns:
+            int: Number of entries removed.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        removed = 0
+        with self.lock:
+            while self.size() > max_bytes:
+                keys = [row[0] for row in self.conn.execute("SELECT key FROM entries ORDER BY accessed_at LIMIT 20")]
+                if not keys:
+                    break
+                with self.conn:
+                    self.conn.executemany("DELETE FROM entries WHERE key = ?", ((key,) for key in keys))
+                removed += len(keys)
+                self.remove_orphan_blobs()
+
+        if removed:
+            metrics.incr('cache_evicted', removed)
+        return removed
+
+    def remove_expired(self):
+        with self.lock, self.conn:
+            removed = self.conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)).rowcount
+        self.remove_orphan_blobs()
+        return removed
+
+    # Deletes the bodies no entry refers to anymore
+    def remove_orphan_blobs(self):
+        with self.lock:
+            digests = [row[0] for row in self.conn.execute("SELECT digest FROM blobs WHERE digest NOT IN (SELECT digest FROM entries)")]
+            for digest in digests:
+                try:
+                    os.remove(self.blob_path(digest))
+                except FileNotFoundError:
+                    pass
+            with self.conn:
+                self.conn.executemany("DELETE FROM blobs WHERE digest = ?", ((digest,) for digest in digests))
+
+    def stats(self):
+        with self.lock:
+            entries, permanent = self.conn.execute("SELECT COUNT(*), COUNT(*) - COUNT(expires_at) FROM entries").fetchone()
+            blobs = self.conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        return {'entries': entries, 'permanent': permanent, 'blobs': blobs, 'bytes': self.size()}
+
+
+def enabled():
+    return os.environ.get('RESPONSE_CACHE_DIR', DEFAULT_DIR).strip().lower() not in ('', 'none')
+
+
+_cache = None
+_cache_pid = None
+
+
+def get():
+    """
+    Returns the cache of this process, opening it on first use.
+
+    Returns:
+        ResponseCache: The cache, or None if it is disabled (RESPONSE_CACHE_DIR=none).
+    """
+    global _cache, _cache_pid
+    if not enabled():
+        return None
+    # A forked worker must not reuse its parent's SQLite connection
+    if _cache is None or _cache_pid != os.getpid():
+        _cache = ResponseCache()
+        _cache_pid = os.getpid()
+    return _cache
+
+
+def close():
+    """
+    Closes the cache of this process; the next `get` opens it again.
+    """
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+
+
+def add_arguments(parser):
+    parser.add_argument('action', choices=['stats', 'prune'])
+    parser.add_argument('--path', default=os.environ.get('RESPONSE_CACHE_DIR', DEFAULT_DIR), help="Cache directory")
+
+
+def main(args):
+    with ResponseCache(args.path) as cache:
+        if args.action == 'prune':
+            print(f"Removed {cache.remove_expired()} expired and {cache.evict()} least recently used entries")
+        stats = cache.stats()
+        print(f"{stats['entries']} entries ({stats['permanent']} never expire), {stats['blobs']} bodies, {stats['bytes'] / (1024 * 1024):.1f} MB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Show or clean up the API response cache")
+    add_arguments(parser)
+    main(parser.parse_args())
@@ -0,0 +1,135 @@
+import threading
+import boto3
+from . import metrics
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class S3Uploader:
+    """
+    Long-lived S3 uploader that runs the uploads on a background thread pool.
+
+    A single client (with a connection pool sized to the number of threads) is shared
+    by all uploads. At most `max_pending` uploads can be queued: when the queue is full,
+    `upload` blocks until a slot is released, so memory stays bounded.
+
+    Args:
+        bucket_name (str): The target bucket.
+        aws_access_key_id (str): AWS access key ID.
+        aws_secret_access_key (str): AWS secret access key.
+        region (str): AWS region of the bucket.
+        endpoint_url (str): Optional S3 endpoint, e.g. a local MinIO or moto server.
+        max_workers (int): Number of upload threads.
+        max_pending (int): Maximum number of queued or running uploads.
+        overwrite (bool): Replace the existing objects instead of skipping them (used to reprocess matches).
+    """
+
+    def __init__(self, bucket_name, aws_access_key_id=None, aws_secret_access_key=None, region='us-east-2',
+                 endpoint_url=None, max_workers=8, max_pending=64, overwrite=False):
+        self.bucket_name = bucket_name
+        self.overwrite = overwrite
+        self.s3 = boto3.client(
+            's3',
+            aws_access_key_id=aws_access_key_id,
+            aws_secret_access_key=aws_secret_access_key,
+            region_name=region,
+            endpoint_url=endpoint_url,
+            config=Config(max_pool_connections=max_workers, retries={'max_attempts': 5, 'mode': 'standard'})
+        )
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='s3-upload')
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.failed = []
+
+    def upload(self, s3_filename, body, content_type='application/json', **extra_args):
+        """
+        Queues an upload and returns immediately (unless the queue is full).
+
+        Args:
+            s3_filename (str): The object key.
+            body (bytes): The object content.
+            content_type (str): The object Content-Type.
+            **extra_args: Extra put_object arguments, e.g. ContentEncoding.
+
+        Returns:
+            concurrent.futures.Future: Resolves to True if the object was uploaded (or already existed).
+        """
+        self.slots.acquire()
+        future = self.executor.submit(self._put, s3_filename, body, content_type, extra_args)
+
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self.lock:
+            self.pending.discard(future)
+        self.slots.release()
+
+    def _put(self, s3_filename, body, content_type, extra_args):
+        try:
+            try:
+                # Check if the object exists
+                if not self.overwrite:
+                    with metrics.timer('s3_head'):
+                        self.s3.head_object(Bucket=self.bucket_name, Key=s3_filename)
+                    print(f"File already exists: s3://{self.bucket_name}/{s3_filename}. Skipping upload.")
+                    metrics.incr('s3_skipped')
+                    return True
+            except ClientError as e:
+                # A 404 error means the file wasn't found
+                if e.response['Error']['Code'] != '404':
+                    raise
+
+            with metrics.timer('s3_put'):
+                self.s3.put_object(
+                    Bucket=self.bucket_name,
+                    Key=s3_filename,
+                    Body=body,
+                    ContentType=content_type,
+                    **extra_args
+                )
+            print(f"Data pushed to S3 storage: s3://{self.bucket_name}/{s3_filename}")
+            metrics.incr('s3_uploaded')
+            metrics.incr('bytes_uploaded', len(body))
+            return True
+        except Exception as e:
+            print(f"Error uploading s3://{self.bucket_name}/{s3_filename}: {e}")
+            metrics.incr('s3_failed')
+            with self.lock:
+                self.failed.append((s3_filename, str(e)))
+            return False
+
+    def flush(self):
+        """
+        Waits until every queued upload has finished.
+
+        Returns:
+            list: (s3_filename, error) tuples of the uploads that failed so far.
+        """
+        with self.lock:
+            pending = list(self.pending)
+        wait(pending)
+
+        with self.lock:
+            return list(self.failed)
+
+    def close(self):
+        """
+        Flushes the queue and stops the upload threads.
+
+        Returns:
+            list: (s3_filename, error) tuples of the uploads that failed.
+        """
+        failed = self.flush()
+        self.executor.shutdown(wait=True)
+        return failed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
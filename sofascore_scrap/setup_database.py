@@ -0,0 +1,223 @@
+import argparse
+import psycopg2
+from psycopg2 import sql
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Get database credentials from environment variables
+DB_CREDENTIALS = {
+    'dbname': os.environ.get('DATABASE_POSTGRES'),
+    'user': os.environ.get('USER_POSTGRES'),
+    'password': os.environ.get('PASSWORD_POSTGRES'),
+    'host': os.environ.get('HOST_POSTGRES'),
+    'port': os.environ.get('PORT_POSTGRES')
+}
+
+# Versioned schema migrations.
+# Every migration runs once, in order, and the applied versions are recorded in schema_migrations.
+# All the pending migrations run on a single connection and in a single transaction: either the
+# database is fully upgraded or it is left untouched. Existing databases are upgraded in place.
+
+# Key of the advisory lock that keeps two runs from migrating the same database at once
+MIGRATION_LOCK_ID = 725_001
+
+# Version 1: the tables created by the first versions of this script (kept as they were,
+# so on an existing database this migration only records the version)
+BASE_TABLES = """
+CREATE TABLE IF NOT EXISTS player (id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, country VARCHAR(255));
+CREATE TABLE IF NOT EXISTS team (id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, country VARCHAR(255), abbreviation VARCHAR(10));
+CREATE TABLE IF NOT EXISTS league (id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, country VARCHAR(255));
+CREATE TABLE IF NOT EXISTS season (id INTEGER PRIMARY KEY, season_year VARCHAR(255) NOT NULL, id_league INTEGER REFERENCES league(id));
+CREATE TABLE IF NOT EXISTS referee (id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, games_officiated INTEGER, yellow_cards INTEGER, red_cards INTEGER);
+CREATE TABLE IF NOT EXISTS stadium (id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, city VARCHAR(255), country VARCHAR(255), capacity INTEGER);
+CREATE TABLE IF NOT EXISTS match (
+    id INTEGER PRIMARY KEY,
+    match_time TIMESTAMP NOT NULL,
+    round VARCHAR(50),
+    season_id INTEGER REFERENCES season(id),
+    referee_id INTEGER REFERENCES referee(id),
+    stadium_id INTEGER REFERENCES stadium(id),
+    home_team_id INTEGER REFERENCES team(id),
+    away_team_id INTEGER REFERENCES team(id)
+);
+CREATE TABLE IF NOT EXISTS match_stat (
+    id SERIAL PRIMARY KEY,
+    stat_name VARCHAR(255) NOT NULL,
+    home_value DECIMAL(5, 2) NOT NULL,
+    away_value DECIMAL(5, 2) NOT NULL,
+    match_id INTEGER REFERENCES match(id)
+);
+"""
+
+# Version 2: indexes on the foreign keys, used by the per-season and per-team queries and by the FK checks
+FOREIGN_KEY_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_season_id_league ON season (id_league);
+CREATE INDEX IF NOT EXISTS idx_match_season_id ON match (season_id);
+CREATE INDEX IF NOT EXISTS idx_match_home_team_id ON match (home_team_id);
+CREATE INDEX IF NOT EXISTS idx_match_away_team_id ON match (away_team_id);
+CREATE INDEX IF NOT EXISTS idx_match_referee_id ON match (referee_id);
+CREATE INDEX IF NOT EXISTS idx_match_stadium_id ON match (stadium_id);
+"""
+
+
+def create_season_partitions(cursor, season_ids):
+    """
+    Creates the match_stat partitions of the given seasons, if they do not exist yet.
+
+    Args:
+        cursor (psycopg2.extensions.cursor): A cursor of the open transaction.
+        season_ids (iterable): The season IDs.
+    """
+    for season_id in sorted({int(season_id) for season_id in season_ids}):
+        cursor.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {partition} PARTITION OF match_stat FOR VALUES IN ({season_id})").format(
+            partition=sql.Identifier(f"match_stat_{season_id}"),
+            season_id=sql.Literal(season_id)
+        ))
+
+
+def partition_match_stat(cursor):
+    """
+    Version 3: rebuilds match_stat as a table partitioned by season (one partition per season),
+    with one row per (match, statistic): its primary key (season_id, match_id, stat_name) allows bulk upserts.
+
+    The existing rows are copied with the season of their match (the last row wins for a duplicated statistic).
+    Rows whose match has no season are left in match_stat_legacy.
+
+    Args:
+        cursor (psycopg2.extensions.cursor): A cursor of the migration transaction.
+    """
+    cursor.execute("ALTER TABLE match_stat RENAME TO match_stat_legacy")
+    cursor.execute("ALTER INDEX IF EXISTS match_stat_pkey RENAME TO match_stat_legacy_pkey")
+    cursor.execute("""
+        CREATE TABLE match_stat (
+            match_id INTEGER NOT NULL REFERENCES match(id),
+            season_id INTEGER NOT NULL,
+            stat_name VARCHAR(255) NOT NULL,
+            home_value DECIMAL(5, 2) NOT NULL,
+            away_value DECIMAL(5, 2) NOT NULL,
+            PRIMARY KEY (season_id, match_id, stat_name)
+        ) PARTITION BY LIST (season_id)
+    """)
+    # Per-match lookups (and the FK checks of match) do not know the season
+    cursor.execute("CREATE INDEX idx_match_stat_match_id ON match_stat (match_id)")
+
+    cursor.execute("SELECT DISTINCT m.season_id FROM match_stat_legacy s JOIN match m ON m.id = s.match_id WHERE m.season_id IS NOT NULL")
+    create_season_partitions(cursor, [row[0] for row in cursor.fetchall()])
+
+    cursor.execute("""
+        INSERT INTO match_stat (match_id, season_id, stat_name, home_value, away_value)
+        SELECT DISTINCT ON (s.match_id, s.stat_name) s.match_id, m.season_id, s.stat_name, s.home_value, s.away_value
+        FROM match_stat_legacy s JOIN match m ON m.id = s.match_id
+        WHERE m.season_id IS NOT NULL
+        ORDER BY s.match_id, s.stat_name, s.id DESC
+    """)
+    print(f"{cursor.rowcount} statistics moved to the partitioned match_stat table")
+
+    cursor.execute("""
+        SELECT COUNT(*) FROM match_stat_legacy s
+        WHERE NOT EXISTS (SELECT 1 FROM match m WHERE m.id = s.match_id AND m.season_id IS NOT NULL)
+    """)
+    left_behind = cursor.fetchone()[0]
+    if left_behind:
+        print(f"{left_behind} statistics without a match season were kept in match_stat_legacy")
+    else:
+        cursor.execute("DROP TABLE match_stat_legacy")
+
+
+# (version, description, SQL script or function called with the cursor)
+MIGRATIONS = [
+    (1, "Base tables", BASE_TABLES),
+    (2, "Indexes on the foreign keys", FOREIGN_KEY_INDEXES),
+    (3, "match_stat partitioned by season, one row per (match, statistic)", partition_match_stat),
+]
+
+
+def applied_versions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(conn, target=None):
+    """
+    Applies the pending migrations, up to `target`, in a single transaction.
+
+    Args:
+        conn (psycopg2.extensions.connection): The database connection.
+        target (int): Last version to apply (default: all of them).
+
+    Returns:
+        list: The versions applied.
+    """
+    applied = []
+    try:
+        with conn.cursor() as cursor:
+            # Serializes concurrent runs; released at the end of the transaction
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            done = applied_versions(cursor)
+
+            for version, description, step in MIGRATIONS:
+                if version in done or (target is not None and version > target):
+                    continue
+                print(f"Applying migration {version}: {description}")
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+                cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)", (version, description))
+                applied.append(version)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return applied
+
+
+def print_status(conn):
+    with conn.cursor() as cursor:
+        done = applied_versions(cursor)
+    conn.rollback()
+    for version, description, _ in MIGRATIONS:
+        print(f"{version:>3} {'applied' if version in done else 'pending':<8} {description}")
+
+
+def add_arguments(parser):
+    parser.add_argument('--status', action='store_true', help="List the migrations and whether they are applied")
+    parser.add_argument('--target', type=int, help="Last migration version to apply")
+
+
+def main(args):
+    conn = None
+    try:
+        conn = psycopg2.connect(**DB_CREDENTIALS)
+        if args.status:
+            print_status(conn)
+        else:
+            print("Starting schema migration...")
+            applied = migrate(conn, args.target)
+            if applied:
+                print(f"Applied migrations: {', '.join(map(str, applied))}")
+            else:
+                print("The database schema is up to date.")
+    except psycopg2.Error as e:
+        print(f"Error connecting to the database or executing the migrations: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+
+# --- Main Script Execution ---
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create or upgrade the PostgreSQL schema")
+    add_arguments(parser)
+    main(parser.parse_args())
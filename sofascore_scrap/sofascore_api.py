@@ -0,0 +1,192 @@
+import os
+from . import metrics
+from . import rate_limiter
+from . import response_cache
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Default SofaScore API root. It can be overridden with the SOFASCORE_API_URL
+# environment variable, e.g. to point at a local stub server serving recorded payloads
+DEFAULT_API_URL = 'https://www.sofascore.com/api/v1'
+
+# Headers sent with every direct API request
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36',
+    'Accept': 'application/json',
+    'Accept-Encoding': 'gzip, deflate',
+    'Referer': 'https://www.sofascore.com/',
+}
+
+# requests is imported by the functions that send requests: the stages import this module
+# even when every response is read from the cache (or there is nothing to collect)
+
+# Attempts of a request before it is given up (throttling, connection errors and 5xx responses are retried)
+MAX_ATTEMPTS = 4
+
+
+def api_url(path):
+    """
+    Builds the full URL of an API endpoint.
+
+    Args:
+        path (str): The endpoint path, starting with '/'.
+
+    Returns:
+        str: The endpoint URL under the configured API root.
+    """
+    base_url = os.environ.get('SOFASCORE_API_URL', DEFAULT_API_URL)
+    return base_url.rstrip('/') + path
+
+
+def rounds_url(id_league, id_season):
+    return api_url(f"/unique-tournament/{id_league}/season/{id_season}/rounds")
+
+
+def round_events_url(id_league, id_season, round_number):
+    return api_url(f"/unique-tournament/{id_league}/season/{id_season}/events/round/{round_number}")
+
+
+def create_session(pool_size=16):
+    """
+    Creates an HTTP session with a connection pool large enough for concurrent requests.
+
+    Args:
+        pool_size (int): Maximum number of pooled connections per host.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+def fetch_json(session, url, timeout=30, max_attempts=MAX_ATTEMPTS):
+    """
+    Requests an API endpoint and returns its decoded JSON body.
+
+    The response cache is read first, and the responses are stored in it. Every request goes
+    through the shared rate limiter. Throttling responses (403/429) slow down all the workers,
+    and they are retried with exponential backoff, like connection errors and server errors.
+
+    Args:
+        session (requests.Session): The session used for the request.
+        url (str): The endpoint URL.
+        timeout (int): Request timeout in seconds.
+        max_attempts (int): Attempts before the error is raised.
+
+    Returns:
+        dict: The JSON payload.
+
+    Raises:
+        response_cache.CacheMiss: In offline mode, if the response is not cached.
+    """
+    cache = response_cache.get()
+    if cache is not None:
+        json_data = cache.get_json(url)
+        if json_data is not None:
+            return json_data
+    if response_cache.offline():
+        raise response_cache.CacheMiss(f"{url} is not in the response cache")
+
+    import requests
+    limiter = rate_limiter.get()
+
+    for attempt in range(max_attempts):
+        limiter.acquire()
+        try:
+            with metrics.timer('api_request'):
+                response = session.get(url, timeout=timeout)
+                if response.status_code in rate_limiter.THROTTLE_STATUSES:
+                    retry_after = rate_limiter.retry_after_seconds(response.headers)
+                    limiter.on_throttle(retry_after)
+                    raise rate_limiter.ThrottledError(f"{response.status_code} for {url}", retry_after)
+                response.raise_for_status()
+                body = response.content
+        except (rate_limiter.ThrottledError, requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        except requests.HTTPError as e:
+            # Client errors (e.g. 404) will not change on a retry
+            if e.response is not None and e.response.status_code < 500:
+                raise
+            error = e
+        else:
+            limiter.on_success()
+            metrics.incr('bytes_decoded', len(body))
+            with metrics.timer('json_parse'):
+                json_data = response.json()
+            if cache is not None:
+                cache.put(url, body, json_data=json_data)
+            return json_data
+
+        if attempt + 1 < max_attempts:
+            delay = rate_limiter.backoff_delay(attempt)
+            print(f"Retrying {url} in {delay:.1f}s ({error})")
+            metrics.incr('api_retries')
+            time.sleep(delay)
+
+    raise error
+
+
+def parse_season_rounds(json_data):
+    """
+    Reads the current round and the number of rounds from a /rounds payload.
+
+    Args:
+        json_data (dict): The /rounds JSON payload.
+
+    Returns:
+        tuple: (current_round, total_rounds).
+    """
+    current_round = int(json_data['currentRound']['round'])
+    total_rounds = max((int(item['round']) for item in json_data.get('rounds', [])), default=current_round)
+    return current_round, total_rounds
+
+
+def fetch_season_rounds(session, id_league, id_season):
+    """
+    Gets the current round and the number of rounds of a season.
+
+    Args:
+        session (requests.Session): The session used for the request.
+        id_league (int): The unique tournament ID.
+        id_season (int): The season ID.
+
+    Returns:
+        tuple: (current_round, total_rounds).
+    """
+    return parse_season_rounds(fetch_json(session, rounds_url(id_league, id_season)))
+
+
+def fetch_rounds(session, id_league, id_season, rounds, max_workers=8):
+    """
+    Fetches the events of several rounds concurrently.
+
+    Results are yielded in the same order as `rounds`, so the caller can process
+    them exactly as it would process rounds captured from the browser.
+
+    Args:
+        session (requests.Session): The session used for the requests.
+        id_league (int): The unique tournament ID.
+        id_season (int): The season ID.
+        rounds (iterable): The round numbers to fetch.
+        max_workers (int): Number of rounds in flight at the same time.
+
+    Yields:
+        tuple: (round_number, json_data), where json_data is None if the request failed.
+    """
+    def fetch_round(round_number):
+        try:
+            return round_number, fetch_json(session, round_events_url(id_league, id_season, round_number))
+        except Exception as e:
+            print(f"Error fetching round {round_number} of season {id_season}: {e}")
+            return round_number, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield from executor.map(fetch_round, rounds)
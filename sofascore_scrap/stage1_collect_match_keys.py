@@ -0,0 +1,501 @@
+import json
+import re
+import os
+import argparse
+from . import sofascore_api
+from . import capture
+from . import metrics
+from . import request_filter
+from . import rate_limiter
+from . import response_cache
+from .state_store import StateStore
+from dotenv import load_dotenv
+
+load_dotenv() # Load .env variables
+
+# psycopg2 and selenium are imported where they are used: a run with nothing to collect
+# (every season finished) neither connects to the database nor starts the browser
+
+# Read environment variables
+user_postgres = os.environ.get('USER_POSTGRES')
+password_postgres = os.environ.get('PASSWORD_POSTGRES')
+host_postgres = os.environ.get('HOST_POSTGRES')
+port_postgres = os.environ.get('PORT_POSTGRES')
+database_postgres = os.environ.get('DATABASE_POSTGRES')
+
+# keys_matches.csv is still exported at the end of every run for compatibility
+csv_keys_matches = 'keys_matches.csv'
+
+# Status types of the matches that will not change anymore
+# A round whose matches all have one of these types is complete
+settled_status_types = ('finished', 'canceled')
+
+# SQL INSERT queries (multi-row, used with execute_values)
+insert_league = "INSERT INTO league (id, name, country) VALUES %s ON CONFLICT (id) DO NOTHING"
+insert_season = "INSERT INTO season (id, id_league, season_year) VALUES %s ON CONFLICT (id) DO NOTHING"
+insert_team = "INSERT INTO team (id, name, abbreviation, country) VALUES %s ON CONFLICT (id) DO NOTHING"
+
+
+# Creates the Chrome driver used to browse the tournament pages
+def create_driver():
+    from selenium.webdriver.chrome.options import Options
+
+    # Configure Chrome optioons
+    options = Options()
+    options.headless = False
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    request_filter.configure_options(options)
+
+    # Initialize the WebDriver with the capture backend (CAPTURE_BACKEND: cdp or seleniumwire)
+    # Only the round APIs are captured; images, fonts, ads and analytics are blocked
+    driver = capture.create_driver(options, request_filter.STAGE1_SCOPES)
+
+    # Set wait timeouts
+    driver.set_page_load_timeout(180)
+    return driver
+
+# Pattern of the round API URL, e.g. .../events/round/12 (must not match round/1 for round 12)
+def round_pattern(round_number):
+    return re.escape(f"/round/{round_number}") + r'(?:[/?]|$)'
+
+# Reads the JSON file with the league's championship data
+def load_leagues(filename='leagues_season.json'):
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class MatchKeyCollector:
+    """
+    Collects the keys of the ended matches of the configured league seasons.
+
+    The processed IDs (leagues, seasons, teams and match keys) are kept in the state store.
+    The idea behind this is to avoid reprocessing and saving data that has already been
+    saved to the database, which helps to reduce database calls and save resources.
+
+    Args:
+        mode (str): 'browser' to drive the tournament page, 'api' to request the round APIs directly.
+        max_workers (int): Rounds requested at the same time in api mode.
+        on_match (callable): Optional callback called with each new match key once it is recorded.
+        reprocess (bool): Process every round again, ignoring the round checkpoints, the finished seasons and the
+            recorded match keys (which are updated), e.g. from the response cache after a parser change.
+        store (StateStore): Optional state store to use instead of the default one.
+        conn (connection): Optional open database connection to use instead of connecting with the .env settings.
+    """
+
+    def __init__(self, mode='browser', max_workers=8, on_match=None, store=None, conn=None, reprocess=False):
+        self.mode = mode
+        self.max_workers = max_workers
+        self.on_match = on_match
+        self.reprocess = reprocess
+        self.store = store if store is not None else StateStore()
+        self.conn = conn
+        self.cursor = None
+        self.driver = None
+        self.wait = None
+        self.session = None
+        self.season_rounds = {}   # round -> complete, for the season being collected
+
+        # First run with the store: import the IDs saved by the CSV based bookkeeping
+        if self.store.is_empty():
+            self.store.import_legacy_csv(csv_keys_matches)
+
+        # The HTTP session (api mode) and the driver (browser mode, only when a season is not in the response
+        # cache) are opened by the first season that is not finished, the database connection by the first
+        # season with rows to save (a reprocess run that only reads the cache does not need the database)
+
+    # Connects to the database on first use
+    def connect(self):
+        if self.cursor is None:
+            if self.conn is None:
+                import psycopg2
+                self.conn = psycopg2.connect(
+                    user=user_postgres,
+                    password=password_postgres,
+                    host=host_postgres,
+                    port=port_postgres,
+                    database=database_postgres
+                )
+                print("Succesfully connected to the database")
+            self.cursor = self.conn.cursor()
+        return self.cursor
+
+    def close(self):
+        if self.cursor is not None:
+            self.cursor.close()
+            print("Cursor closed.")
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
+            print("Database connection closed.")
+
+        # Keep keys_matches.csv available for the tools that still read it
+        self.store.export_csv('match_keys', csv_keys_matches)
+        self.store.close()
+
+        if self.driver is not None:
+            self.driver.quit()
+        if self.session is not None:
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Rounds of a season that do not have to be visited again (none when reprocessing)
+    def completed_rounds(self, id_season):
+        return set() if self.reprocess else self.store.completed_rounds(id_season)
+
+    # Filters the ended matches of a round, collects the teams (round 1 only) and writes the match keys
+    # Returns True if the round is complete (all its matches are settled, so it never has to be visited again)
+    def process_round_events(self, json_data, current_round, leagueSeason, season_teams):
+        matches = []
+        reprocessed = []
+        events = json_data.get('events', [])
+        complete = bool(events) and all(event.get('status', {}).get('type') in settled_status_types for event in events)
+
+        # Extraction the target data
+        for event in events:
+            ended = all(k in event for k in ['customId', 'id', 'slug', 'homeTeam', 'awayTeam']) and event['status']['description'] == 'Ended'
+
+            # A single round is enough to scrape the competition's teams
+            # They are saved in a single batch once the season has been processed, so they are collected
+            # even when the match keys were recorded by a run that could not save them
+            if ended and current_round == 1:
+                for team in (event['homeTeam'], event['awayTeam']):
+                    if not self.store.has_id('teams', team['id']): # CABS
+                        season_teams[str(team['id'])] = (
+                            team['id'],
+                            team['name'],
+                            team['nameCode'],
+                            team['country']['name']
+                        )
+                    else:
+                        print(f"Team {team['name']} ({team['id']}) already processed")
+
+            known = self.store.has_match(event['id'])   # CABS
+            if known and not self.reprocess:
+                print(f"Match {event['id']} already saved")
+                metrics.incr('matches_skipped')
+            elif ended:
+                result = {
+                    'customId': event['customId'],
+                    'id': str(event['id']),
+                    'id_mandante': event['homeTeam']['id'],
+                    'id_visitante': event['awayTeam']['id'],
+                    'slug': event['slug'],
+                    'league': leagueSeason,
+                    'mandante': event['homeTeam']['name'],
+                    'visitante': event['awayTeam']['name'],
+                    'rodada': current_round
+                }
+                # Reprocessed keys are updated, but only the new ones are passed on (on_match)
+                (reprocessed if known else matches).append(result)
+
+                print(f"Salvo: {result}")
+
+        # Record all the match keys of the round in a single transaction
+        if reprocessed:
+            self.store.add_matches(reprocessed, replace=True)
+            metrics.incr('matches_reprocessed', len(reprocessed))
+        if matches:
+            self.store.add_matches(matches)
+            metrics.incr('matches_collected', len(matches))
+
+            if self.on_match is not None:
+                for result in matches:
+                    self.on_match(result)
+
+        return complete
+
+    # Processes a round; its checkpoint is written with the season's rows (see collect_league_season)
+    def process_round(self, json_data, current_round, id_season, leagueSeason, season_teams):
+        complete = self.process_round_events(json_data, current_round, leagueSeason, season_teams)
+        self.season_rounds[current_round] = complete
+        metrics.incr('rounds_processed')
+
+    # Saves the league, season and team rows of a season in a single transaction
+    # Existing rows are ignored by the database (ON CONFLICT DO NOTHING), so no error/rollback is needed for them
+    # Returns True if the rows were committed (or there was nothing to save)
+    def save_season_rows(self, league_rows, season_rows, team_rows):
+        if not (league_rows or season_rows or team_rows):
+            return True
+
+        # Raises (and stops the run) if the database cannot be reached
+        self.connect()
+        from psycopg2.extras import execute_values
+        try:
+            with metrics.timer('db_insert'):
+                # The league must be saved before the season because of the foreign key
+                if league_rows:
+                    execute_values(self.cursor, insert_league, league_rows)
+                if season_rows:
+                    execute_values(self.cursor, insert_season, season_rows)
+                if team_rows:
+                    execute_values(self.cursor, insert_team, team_rows)
+                self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            print(f"Error saving leagues/seasons/teams: {e}")
+            return False
+
+        # Update the store only after the commit succeeded
+        for rows, table in ((league_rows, 'leagues'), (season_rows, 'seasons'), (team_rows, 'teams')):
+            if rows:
+                self.store.add_ids(table, [row[0] for row in rows])
+
+        print(f"Saved {len(league_rows)} league(s), {len(season_rows)} season(s) and {len(team_rows)} team(s)")
+        return True
+
+    # Collects the rounds of a season by requesting the round APIs directly
+    # Returns the number of rounds of the season
+    def collect_season_api(self, id_league, id_season, leagueSeason, season_teams):
+        print(f"Fetching SofaScore API: {leagueSeason}")
+        if self.session is None:
+            # Pooled HTTP session shared by all round requests
+            self.session = sofascore_api.create_session(pool_size=self.max_workers)
+        current_round, total_rounds = sofascore_api.fetch_season_rounds(self.session, id_league, id_season)
+
+        # Process the rounds from current down to round 1 (inclusive), in the same order as the browser mode
+        # Rounds already completed by previous runs are not requested again
+        completed = self.completed_rounds(id_season)
+        rounds = [round_number for round_number in range(current_round, 0, -1) if round_number not in completed]
+        print(f"{len(rounds)} of {current_round} rounds to visit")
+        metrics.incr('rounds_skipped', current_round - len(rounds))
+
+        for round_number, json_data in sofascore_api.fetch_rounds(self.session, id_league, id_season, rounds, max_workers=self.max_workers):
+            print(round_number)
+            if json_data is not None:
+                try:
+                    self.process_round(json_data, round_number, id_season, leagueSeason, season_teams)
+                except Exception as e:
+                    print(f"Error processing JSON: {e}")
+
+        return total_rounds
+
+    # Collects the rounds of a season from the response cache, without the browser
+    # Returns the number of rounds of the season, or None if the cache does not have every round to process
+    def collect_season_cache(self, id_league, id_season, leagueSeason, season_teams):
+        cache = response_cache.get()
+        if cache is None:
+            return None
+        rounds_data = cache.get_json(sofascore_api.rounds_url(id_league, id_season))
+        if rounds_data is None:
+            return None
+        current_round, total_rounds = sofascore_api.parse_season_rounds(rounds_data)
+
+        completed = self.completed_rounds(id_season)
+        rounds = [round_number for round_number in range(current_round, 0, -1) if round_number not in completed]
+        cached = [(round_number, cache.get_json(sofascore_api.round_events_url(id_league, id_season, round_number))) for round_number in rounds]
+        if any(json_data is None for _, json_data in cached):
+            return None
+
+        print(f"Reading {len(rounds)} rounds of {leagueSeason} from the response cache")
+        metrics.incr('rounds_skipped', current_round - len(rounds))
+        for round_number, json_data in cached:
+            print(round_number)
+            try:
+                self.process_round(json_data, round_number, id_season, leagueSeason, season_teams)
+            except Exception as e:
+                print(f"Error processing JSON: {e}")
+
+        return total_rounds
+
+    # Collects the rounds of a season by driving the tournament page and reading the intercepted round APIs
+    # Returns the number of rounds of the season (None if the rounds API response was not captured)
+    def collect_season_browser(self, country, slug, id_league, id_season, leagueSeason, season_teams):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+
+        if self.driver is None:
+            self.driver = create_driver()
+            self.wait = WebDriverWait(self.driver, 30)
+        driver = self.driver
+        wait = self.wait
+
+        print(f"Acessing SofaScore: {leagueSeason}")
+        limiter = rate_limiter.get()
+        driver.maximize_window()
+        limiter.acquire()
+        with metrics.timer('page_load', season=id_season):
+            driver.get(f"https://www.sofascore.com/pt/torneio/futebol/{country}/{slug}/{id_league}#id:{id_season}")
+
+        # Wait until the element that shows the current round is rendered and extract its number
+        round_xpath = '/html/body/div[1]/main/div[2]/div/div/div[1]/div[4]/div[1]/div[1]/div[3]/div/div/div[1]/div/div/button/div/div'
+        match = wait.until(lambda d: re.search(r'\d+', d.find_element(By.XPATH, round_xpath).text))
+        current_round = int(match.group())
+
+        # The page also requests the list of rounds, which tells how many rounds the season has
+        total_rounds = None
+        rounds_request = capture.wait_for_response(driver, re.escape(f"/season/{id_season}/rounds") + r'(?:\?|$)')
+        if rounds_request is not None:
+            rounds_data = capture.response_json(rounds_request)
+            capture.cache_response(rounds_request, rounds_data)
+            total_rounds = sofascore_api.parse_season_rounds(rounds_data)[1]
+
+        # Rounds below the lowest incomplete one do not have to be visited again
+        completed = self.completed_rounds(id_season)
+        pending = [round_number for round_number in range(1, current_round + 1) if round_number not in completed]
+        if not pending:
+            print(f"All {current_round} rounds already complete")
+            return total_rounds
+        lowest_pending = pending[0]
+        print(f"{len(pending)} of {current_round} rounds to visit")
+        metrics.incr('rounds_skipped', current_round - len(pending))
+
+        # Find and click the 'Back' and 'Next' buttons to load the API data
+        backButton = wait.until(EC.element_to_be_clickable((By.XPATH, "/html/body/div[1]/main/div[2]/div/div/div[1]/div[4]/div[1]/div[1]/div[3]/div/div/div[1]/div/button[1]")))
+        limiter.acquire()
+        backButton.click()
+        capture.wait_for_response(driver, round_pattern(current_round - 1))
+        nextButton= wait.until(EC.element_to_be_clickable((By.XPATH, "/html/body/div[1]/main/div[2]/div/div/div[1]/div[4]/div[1]/div[1]/div[3]/div/div/div[1]/div/button[2]")))
+        limiter.acquire()
+        nextButton.click()
+
+        # Process the rounds from current down to the lowest incomplete one (inclusive)
+        while current_round >= lowest_pending:
+            print(current_round)
+
+            # Complete rounds are only clicked through
+            request = None
+            if current_round not in completed:
+                # Returns as soon as the API response of the round arrives
+                request = capture.wait_for_response(driver, round_pattern(current_round))
+
+            if request is not None and request.response.status_code in rate_limiter.THROTTLE_STATUSES:
+                # The round is not checkpointed, so it is visited again by the next run
+                print(f"Round {current_round} throttled ({request.response.status_code})")
+                limiter.on_throttle(rate_limiter.retry_after_seconds(request.response.headers))
+            elif request is not None:
+                print(f"Detected: {request.url}")
+                print(f"Status: {request.response.status_code}")
+                limiter.on_success()
+
+                try:
+                    # Decode the body according to its Content-Encoding and load JSON
+                    json_data = capture.response_json(request)
+                    capture.cache_response(request, json_data)
+
+                    self.process_round(json_data, current_round, id_season, leagueSeason, season_teams)
+
+                except Exception as e:
+                    print(f"Error decompressing or processing JSON: {e}")
+
+            # Clear before clicking so the next wait only sees the previous round's response
+            capture.clear_responses(driver)
+
+            if current_round > 1:
+                limiter.acquire()
+                backButton.click()
+
+            # Navigate to previous round
+            current_round = current_round - 1
+
+        return total_rounds
+
+    # Saves the league and season, collects all its rounds and saves the teams
+    def collect_league_season(self, league):
+        # Configuration of the league and season selected for extraction
+        country = league.get('country')
+        slug = league.get('slug')
+        name = league.get('name')
+        season = league.get('season')
+        id_season = league.get('id_season')
+        id_league = league.get('id_league')
+        leagueSeason = f"{slug}-{season}"
+
+        # Every round of the season is complete and recorded: nothing can change anymore
+        if not self.reprocess and self.store.is_season_finished(id_season):
+            print(f"Season {season} ({id_season}) for league '{name}' already finished, skipping")
+            metrics.incr('seasons_skipped')
+            return
+
+        league_rows = []
+        season_rows = []
+        season_teams = {}
+        total_rounds = None
+        self.season_rounds = {}
+
+        if not self.store.has_id('leagues', id_league): # Check if Already Been Saved (CABS)
+            league_rows.append((id_league, name, country))
+        else:
+            print(f"League {name}({id_league}) already processed")
+
+        if not self.store.has_id('seasons', id_season): # CABS
+            season_rows.append((id_season, id_league, season))
+        else:
+            print(f"Season {season} ({id_season}) for league '{name}' already processed")
+
+        try:
+            with metrics.timer('season', season=id_season):
+                if self.mode == 'api':
+                    # The round requests read the response cache first
+                    total_rounds = self.collect_season_api(id_league, id_season, leagueSeason, season_teams)
+                else:
+                    total_rounds = self.collect_season_cache(id_league, id_season, leagueSeason, season_teams)
+                    if total_rounds is None and response_cache.offline():
+                        raise response_cache.CacheMiss(f"{leagueSeason} is not in the response cache")
+                    if total_rounds is None:
+                        total_rounds = self.collect_season_browser(country, slug, id_league, id_season, leagueSeason, season_teams)
+        except Exception as e:
+            print(f"Error acessing {leagueSeason}: {e}")
+
+        # One transaction (and a few round-trips) per season, whatever the number of teams
+        if not self.save_season_rows(league_rows, season_rows, list(season_teams.values())):
+            # Nothing is checkpointed: the next run visits the rounds again and round 1 gives the teams back
+            print(f"Rounds of {leagueSeason} not checkpointed, they will be visited again")
+            return
+
+        # The rounds and the season progress are only checkpointed once the season's rows are committed
+        self.store.set_round_statuses(id_season, self.season_rounds)
+        if total_rounds and self.store.update_season_progress(id_season, total_rounds):
+            print(f"Season {season} ({id_season}) for league '{name}' finished")
+
+    # Process all leagues registered in the JSON file
+    def run(self, leagues):
+        for league in leagues:
+            self.collect_league_season(league)
+
+
+# Adds the collection arguments, shared with the streaming pipeline, to a parser
+def add_collect_arguments(parser):
+    # --mode browser: drives the tournament page and reads the round APIs captured from the browser
+    # --mode api: requests the round APIs directly, with several rounds in flight at once
+    parser.add_argument('--mode', choices=['browser', 'api'], default='browser', help="How the round data is collected")
+    parser.add_argument('--max-workers', type=int, default=8, help="Rounds requested at the same time in api mode")
+    parser.add_argument('--offline', action='store_true', help="Only read the API responses from the response cache (no browser, no request)")
+
+# Adds the stage1 command line arguments to a parser
+def add_arguments(parser):
+    add_collect_arguments(parser)
+    parser.add_argument('--reprocess', action='store_true', help="Process every round again (finished seasons and recorded matches included) and update the match keys; with --offline only from the response cache")
+    parser.add_argument('--league', help="Only the configured league-season with this name, e.g. brasileirao-serie-a-2023")
+
+
+# Runs stage1 with the parsed command line arguments
+def main(args):
+    if args.offline:
+        response_cache.set_offline()
+
+    leagues = load_leagues()
+    if args.league:
+        leagues = [league for league in leagues if f"{league.get('slug')}-{league.get('season')}" == args.league]
+        if not leagues:
+            print(f"League-season {args.league} is not in leagues_season.json")
+            return
+    metrics.start()
+
+    try:
+        with MatchKeyCollector(mode=args.mode, max_workers=args.max_workers, reprocess=args.reprocess) as collector:
+            collector.run(leagues)
+    except Exception as error:
+        print("Error to coneccting to the database or starting the browser: ", error)
+
+    metrics.finish()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Collect the keys of the ended matches of the configured seasons")
+    add_arguments(parser)
+    main(parser.parse_args())
@@ -0,0 +1,512 @@
+import gzip
+import json
+import os
+import argparse
+from . import capture
+from . import metrics
+from . import preflight
+from . import request_filter
+from . import rate_limiter
+from . import response_cache
+import time
+import multiprocessing
+from .browser_session import BrowserSession, BrowserStartError
+from .state_store import StateStore
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+load_dotenv() # Load .env variables
+
+# selenium and boto3 are imported where they are used: a run with no pending match
+# starts neither a browser nor an S3 client
+
+# Read environment variables
+aws_key_id = os.environ.get('AWS_ACCESS_KEY_ID')
+aws_secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
+
+# Name of the bucket where the match data is stored
+bucket_name = "sofascore-scrap-project"
+
+# Optional S3-compatible endpoint (e.g. a local MinIO or moto server)
+s3_endpoint_url = os.environ.get('S3_ENDPOINT_URL')
+
+# Selects the period == 'ALL' statistics of a statistics document
+def statistics_period_all(json_data):
+    return next((item for item in json_data['statistics'] if item['period'] == 'ALL'), None)
+
+# SofaScore API root of the match endpoints
+API_URL = "https://www.sofascore.com/api/v1"
+
+# Match endpoints stage2 can store: name -> (API path after /event/{id}, S3 prefix, file name suffix,
+# function that selects the stored part of the document or None to store the whole document)
+ENDPOINTS = {
+    'info': ('', 'matche_info', 'info', None),
+    'statistics': ('/statistics', 'matche_stats', 'period-all', statistics_period_all),
+    'lineups': ('/lineups', 'matche_players_stats', 'players-stats', None),
+    'incidents': ('/incidents', 'matche_incidents', 'incidents', None),
+    'shotmap': ('/shotmap', 'matche_shotmap', 'shotmap', None),
+}
+
+# Endpoints stored by default (STAGE2_ENDPOINTS or --endpoints select others)
+DEFAULT_ENDPOINTS = ('info', 'statistics')
+
+# Endpoints every match has: a match is only done once they are stored
+REQUIRED_ENDPOINTS = ('info', 'statistics')
+
+# Serializes a JSON object and queues its upload to S3
+def upload_json(uploader, json_obj, s3_filename):
+    json_str = json.dumps(json_obj, ensure_ascii=False, indent=2)
+    return uploader.upload(s3_filename, json_str.encode('utf-8'), content_type='application/json')
+
+# Queues the upload of a gzip-compressed JSON body, stored as .json.gz with Content-Encoding: gzip
+def upload_gzip(uploader, body, s3_filename):
+    return uploader.upload(s3_filename, body, content_type='application/json', ContentEncoding='gzip')
+
+# Reads the endpoint names from a comma-separated list (the STAGE2_ENDPOINTS environment variable by default)
+# The info is always included: stage3 reads it and the throttling check relies on it
+def parse_endpoints(value=None):
+    value = value or os.environ.get('STAGE2_ENDPOINTS') or ','.join(DEFAULT_ENDPOINTS)
+    names = [name.strip().lower() for name in value.split(',') if name.strip()]
+
+    unknown = [name for name in names if name not in ENDPOINTS]
+    if unknown:
+        raise ValueError(f"Unknown stage2 endpoints: {', '.join(unknown)} (available: {', '.join(ENDPOINTS)})")
+
+    if 'info' not in names:
+        names.insert(0, 'info')
+    return list(dict.fromkeys(names))
+
+# Full API URL of an endpoint of a match
+def endpoint_url(id_match, name):
+    return f"{API_URL}/event/{id_match}{ENDPOINTS[name][0]}"
+
+# Creates a headless Chrome driver with the default timeouts
+# With a profile directory the cookies (consent included) and the HTTP cache are kept between runs
+def create_driver(profile_dir=None):
+    from selenium.webdriver.chrome.options import Options
+
+    # Configure Chrome options
+    options = Options()
+    options.headless = True
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    if profile_dir:
+        options.add_argument(f"--user-data-dir={profile_dir}")
+    request_filter.configure_options(options)
+
+    # Initialize the WebDriver with the capture backend (CAPTURE_BACKEND: cdp or seleniumwire)
+    # Only the match endpoints (info, statistics, lineups, incidents, shotmap) are captured; images, fonts, ads and analytics are blocked
+    driver = capture.create_driver(options, request_filter.STAGE2_SCOPES)
+
+    # Set wait timeouts
+    driver.set_page_load_timeout(180)
+    return driver
+
+# Builds the S3 key of a match document: the stage3 patterns rely on the info and statistics names
+def document_key(match, name, raw=False):
+    _, prefix, suffix, _ = ENDPOINTS[name]
+    extension = 'json.gz' if raw else 'json'
+    return f"{prefix}/{match['league']}/{match['slug']}-{match['id']}-{suffix}.{extension}"
+
+# Decodes the captured responses of a match (endpoint name -> request, None if not captured) and queues their upload to S3
+# A missing info or statistics response is a failure; the other endpoints do not exist for every match (404) and are skipped
+# With a state store, the missing optional endpoints are recorded so the pre-flight check does not look for them again
+# Returns the upload futures and the list of failures (used by extract_match and the benchmark)
+def process_match_responses(match, responses, uploader, raw=False, store=None):
+    failures = []
+    uploads = []
+    absent = []
+
+    for name, request in responses.items():
+        _, _, _, transform = ENDPOINTS[name]
+        required = name in REQUIRED_ENDPOINTS
+
+        if request is None or (not required and request.response.status_code == 404):
+            if required:
+                failures.append(f"{name} response not captured")
+            else:
+                print(f"No {name} for match {match['id']}")
+                metrics.incr('documents_missing')
+                if request is not None:
+                    absent.append((match['id'], name))
+            continue
+        if request.response.status_code != 200:
+            failures.append(f"{name}: status {request.response.status_code}")
+            continue
+
+        try:
+            s3_filename = document_key(match, name, raw=raw)
+            if raw and transform is None:
+                # Upload the gzip body without parsing it (as received with seleniumwire, re-compressed with cdp)
+                uploads.append(upload_gzip(uploader, body=capture.gzip_response_body(request), s3_filename=s3_filename))
+                continue
+
+            # Decode the body according to its Content-Encoding and load JSON
+            json_data = capture.response_json(request)
+            if transform is not None:
+                json_data = transform(json_data)
+                if json_data is None:
+                    continue
+
+            if raw:
+                # Only the sub-document is serialized again (compact and gzip-compressed)
+                body = gzip.compress(json.dumps(json_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+                uploads.append(upload_gzip(uploader, body=body, s3_filename=s3_filename))
+            else:
+                uploads.append(upload_json(uploader, json_obj=json_data, s3_filename=s3_filename))
+        except Exception as e:
+            print(f"Error decompressing or processing JSON: {e}")
+            failures.append(f"{name}: {e}")
+
+    if store is not None and absent:
+        store.add_absent_endpoints(absent)
+    return uploads, failures
+
+# Reads the selected endpoints of a match from the response cache
+# Returns the responses (endpoint name -> request), or None if any of them is not cached
+def cached_responses(id_match, endpoints):
+    cache = response_cache.get()
+    if cache is None:
+        return None
+
+    responses = {}
+    for name in endpoints:
+        url = endpoint_url(id_match, name)
+        cached = cache.get(url)
+        if cached is None:
+            return None
+        status, body = cached
+        responses[name] = capture.CapturedRequest(url, capture.CapturedResponse(status, {}, body))
+    return responses
+
+# Captures the selected endpoints of a single match in one page visit and stores them in the response cache
+# The info comes with the page load and the statistics with a click; the other endpoints are read from the
+# page load if the page requested them, otherwise they are requested from the page all at once
+# The browser of the session is reused across matches (started on the first one)
+# Returns the responses (endpoint name -> request, None if not captured), or raises ThrottledError
+def capture_match(session, match, endpoints):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+
+    # Configuration off the match selected for the extraction
+    name_match = match['slug']
+    custom_id = match['customId']
+    id_match = match['id']
+
+    extra_endpoints = [name for name in endpoints if name not in REQUIRED_ENDPOINTS]
+    responses = dict.fromkeys(endpoints)
+
+    url = f"https://www.sofascore.com/pt/football/match/{name_match}/{custom_id}#id:{id_match}"
+    limiter = rate_limiter.get()
+
+    print(f"Acessing Match {id_match}")
+    driver = session.start()
+    limiter.acquire()
+    with metrics.timer('page_load', match=id_match):
+        driver.get(url)
+
+    # Wait for the match info API response instead of a fixed sleep
+    responses['info'] = capture.wait_for_response(driver, capture.exact_url(endpoint_url(id_match, 'info')))
+
+    # Accept Cookies (only until the browser has accepted them once)
+    session.accept_cookies()
+
+    # Endpoints the page already requested while loading
+    for name in extra_endpoints:
+        responses[name] = capture.find_response(driver, capture.exact_url(endpoint_url(id_match, name)))
+
+    # Try to click in the stats button to trigger the API request
+    if 'statistics' in endpoints:
+        try:
+            capture.clear_responses(driver)
+            stats_button = session.wait.until(EC.element_to_be_clickable((By.XPATH, "/html/body/div[1]/main/div[2]/div/div/div[1]/div[4]/div[2]/div[1]/div/div[1]/div/div/div/h2[2]")))
+            limiter.acquire()
+            stats_button.click()
+            responses['statistics'] = capture.wait_for_response(driver, capture.exact_url(endpoint_url(id_match, 'statistics')))
+        except Exception as e:
+            print(f"Error Browse the stats: {e}")
+
+    # The other endpoints are requested together, without another click and wait per endpoint
+    missing = [name for name in extra_endpoints if responses[name] is None]
+    if missing:
+        for _ in missing:
+            limiter.acquire()
+        responses.update(zip(missing, capture.fetch_in_page(driver, [endpoint_url(id_match, name) for name in missing])))
+
+    check_throttled(responses)
+
+    for request in responses.values():
+        if request is not None:
+            capture.cache_response(request)
+    return responses
+
+# Throttling responses, or a page that did not make any of the API calls, slow every worker down
+# Raises ThrottledError in that case, otherwise records the success in the rate limiter
+def check_throttled(responses):
+    limiter = rate_limiter.get()
+    captured = [request for request in responses.values() if request is not None]
+    throttled = [request for request in captured if request.response.status_code in rate_limiter.THROTTLE_STATUSES]
+    if throttled or not captured:
+        retry_after = rate_limiter.retry_after_seconds(throttled[0].response.headers) if throttled else None
+        limiter.on_throttle(retry_after)
+        status = throttled[0].response.status_code if throttled else 'empty page'
+        raise rate_limiter.ThrottledError(f"throttled ({status})", retry_after)
+    limiter.on_success()
+
+# Extracts the selected endpoints of a single match and queues their upload to S3
+# The responses are read from the response cache when they are all there, otherwise the match page is visited
+# Returns the upload futures, or raises an exception if any of them could not be captured or processed
+# With raw=True the gzip bodies are stored as .json.gz instead of pretty-printed JSON (re-compressed with the cdp backend)
+# capture_responses(session, match, endpoints) reads the responses that are not cached (capture_match by default)
+# The optional endpoints the match does not have are recorded in the state store, if one is given
+def extract_match(session, match, uploader, raw=False, endpoints=None, capture_responses=None, store=None):
+    endpoints = endpoints or parse_endpoints()
+    capture_responses = capture_responses or capture_match
+
+    responses = cached_responses(match['id'], endpoints)
+    if responses is not None:
+        print(f"Match {match['id']} read from the response cache")
+    elif response_cache.offline():
+        raise response_cache.CacheMiss(f"match {match['id']} is not in the response cache")
+    else:
+        try:
+            responses = capture_responses(session, match, endpoints)
+        finally:
+            session.page_done()
+
+    uploads, failures = process_match_responses(match, responses, uploader, raw=raw, store=store)
+
+    if failures:
+        raise RuntimeError("; ".join(failures))
+
+    return uploads
+
+# Records the stage2 status of the matches whose uploads have all finished
+# Returns the matches that are still waiting for their uploads
+def record_finished_uploads(store, in_flight):
+    statuses = []
+    still_running = []
+
+    for id_match, uploads in in_flight:
+        if all(upload.done() for upload in uploads):
+            if all(upload.result() for upload in uploads):
+                statuses.append((id_match, 'done', None))
+            else:
+                statuses.append((id_match, 'failed', 'upload failed'))
+        else:
+            still_running.append((id_match, uploads))
+
+    if statuses:
+        store.set_stage2_status(statuses)
+    return still_running
+
+# Processes a shard of matches (any iterable) with its own browser session, S3 uploader and state store connection
+# The worker number selects the browser profile (each worker keeps its own between runs)
+# A failing match is retried later with exponential backoff; after the last attempt it goes to the dead-letter list
+# Returns the processed matches, the errors and the metrics of the shard (merged by the parent process)
+# An uploader and a capture_responses function (see extract_match) can be given instead of the S3 and browser ones
+def run_shard(matches, raw=False, endpoints=None, worker=0, overwrite=False, uploader=None, capture_responses=None):
+    # A worker process starts from a copy of its parent's metrics: only its own are returned
+    if multiprocessing.parent_process() is not None:
+        metrics.reset()
+
+    processed = []
+    errors = []
+    in_flight = []
+    store = StateStore()
+    if uploader is None:
+        from .s3_uploader import S3Uploader
+        uploader = S3Uploader(
+            bucket_name,
+            aws_access_key_id=aws_key_id,
+            aws_secret_access_key=aws_secret_key,
+            endpoint_url=s3_endpoint_url,
+            overwrite=overwrite
+        )
+    session = BrowserSession(create_driver, f"stage2-{worker}")
+    retries = rate_limiter.RetryQueue()
+
+    def attempt(match, attempts):
+        try:
+            with metrics.timer('match', match=match['id']):
+                uploads = extract_match(session, match, uploader, raw=raw, endpoints=endpoints, capture_responses=capture_responses, store=store)
+            processed.append(match['id'])
+            in_flight.append((match['id'], uploads))
+            metrics.incr('matches_processed')
+        except BrowserStartError:
+            # A browser that cannot be started fails the whole shard, not each of its matches
+            raise
+        except response_cache.CacheMiss as e:
+            # Offline: the match stays pending for a run with the browser
+            print(f"Skipping match {match['id']}: {e}")
+            metrics.incr('matches_not_cached')
+        except Exception as e:
+            print(f"Error acessing match {match['id']}: {e}")
+            store.set_stage2_status([(match['id'], 'failed', str(e))])
+
+            if retries.schedule(match, attempts + 1):
+                print(f"Match {match['id']} will be retried (attempt {attempts + 1} of {retries.max_attempts} failed)")
+                metrics.incr('matches_retried')
+            else:
+                errors.append((match['id'], str(e)))
+                store.add_dead_letters([(match['id'], attempts + 1, str(e))])
+                metrics.incr('matches_failed')
+
+            # A crashed browser is started again for the next match
+            session.check()
+
+    try:
+        for match in matches:
+            attempt(match, 0)
+            for retry_match, attempts in retries.pop_ready():
+                attempt(retry_match, attempts)
+            in_flight = record_finished_uploads(store, in_flight)
+
+        # No more new matches: wait for the scheduled retries
+        while retries:
+            time.sleep(retries.next_delay())
+            for retry_match, attempts in retries.pop_ready():
+                attempt(retry_match, attempts)
+            in_flight = record_finished_uploads(store, in_flight)
+    finally:
+        session.close()
+
+        # Wait for the queued uploads, report the keys that could not be uploaded
+        # and record the status of the remaining matches
+        for s3_filename, error in uploader.close():
+            errors.append((s3_filename, error))
+        record_finished_uploads(store, in_flight)
+        store.close()
+
+    return processed, errors, metrics.snapshot()
+
+# Pre-flight: marks the matches whose documents of the selected endpoints are all stored as done and returns the others
+# The bucket is listed once per league (or a local manifest is read) instead of loading the page of every match
+# The optional endpoints recorded as absent for a match (404) do not keep it pending
+# Returns None if the stored documents could not be listed
+def skip_uploaded(store, matches, endpoints, manifest=None):
+    if not matches:
+        return matches
+
+    prefixes = [ENDPOINTS[name][1] for name in endpoints]
+    try:
+        s3 = None
+        if not manifest:
+            import boto3
+            s3 = boto3.client(
+                's3',
+                aws_access_key_id=aws_key_id,
+                aws_secret_access_key=aws_secret_key,
+                region_name='us-east-2',
+                endpoint_url=s3_endpoint_url
+            )
+        absent = {
+            id_match: {ENDPOINTS[name][1] for name in names if name in ENDPOINTS}
+            for id_match, names in store.absent_endpoints().items()
+        }
+        pending, done = preflight.split_pending(matches, prefixes, s3=s3, bucket_name=bucket_name, manifest=manifest, absent=absent)
+    except Exception as e:
+        print(f"Pre-flight check failed, extracting all the pending matches: {e}")
+        return None
+
+    if done:
+        store.set_stage2_status([(id_match, 'done', None) for id_match in done])
+    print(f"Pre-flight: {len(done)} matches already uploaded, {len(pending)} to extract")
+    return pending
+
+# Lists the matches stage2 has to extract, checked against the stored documents unless preflight is False
+# When an optional endpoint is selected (e.g. lineups), the matches already done are checked too, so the
+# endpoint is backfilled for the matches extracted before it was selected (the ones without it are recorded once)
+def matches_to_extract(store, endpoints, manifest=None, preflight=True):
+    backfill = preflight and any(name not in REQUIRED_ENDPOINTS for name in endpoints)
+    matches = store.pending_matches(include_done=backfill)
+    if not preflight:
+        return matches
+
+    pending = skip_uploaded(store, matches, endpoints, manifest=manifest)
+    if pending is None:
+        # Without the listing the pending matches are extracted, as before (the uploader still skips the existing objects)
+        return store.pending_matches() if backfill else matches
+    return pending
+
+# Processes the matches pulled from a queue until a None sentinel is received
+def run_queue_consumer(queue, raw=False, endpoints=None, worker=0):
+    return run_shard(iter(queue.get, None), raw=raw, endpoints=endpoints, worker=worker)
+
+
+# Adds the stage2 command line arguments to a parser
+def add_arguments(parser):
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes, each one with its own browser")
+    parser.add_argument('--raw', action='store_true', help="Store the gzip API bodies as .json.gz instead of pretty-printed JSON (the original bytes only with CAPTURE_BACKEND=seleniumwire)")
+    parser.add_argument('--endpoints', help=f"Comma-separated match endpoints to store (available: {', '.join(ENDPOINTS)}; default: STAGE2_ENDPOINTS or {','.join(DEFAULT_ENDPOINTS)})")
+    parser.add_argument('--manifest', help="List of the stored documents used by the pre-flight check instead of the bucket: a local copy of the bucket or a file with one key per line")
+    parser.add_argument('--no-preflight', action='store_true', help="Do not check which matches are already stored before starting the browsers")
+    parser.add_argument('--offline', action='store_true', help="Only read the API responses from the response cache (no browser); the matches not cached stay pending")
+    parser.add_argument('--reprocess', action='store_true', help="Extract every collected match again (not only the pending ones) and overwrite the stored documents")
+    parser.add_argument('--league', help="With --reprocess, only the matches of this league-season")
+
+# Runs stage2 with the parsed command line arguments
+def main(args):
+    if args.offline:
+        response_cache.set_offline()
+    endpoints = parse_endpoints(args.endpoints)
+    metrics.start()
+
+    # Read the match keys that stage2 has not completed yet
+    with StateStore() as store:
+        # The keys were collected before the state store existed: import them from the CSV file
+        if store.is_empty():
+            store.import_csv('match_keys', 'keys_matches.csv')
+        if args.reprocess:
+            # e.g. after a parser change: with --offline every match is read from the response cache
+            matches = store.collected_matches(args.league)
+        else:
+            matches = matches_to_extract(store, endpoints, manifest=args.manifest, preflight=not args.no_preflight)
+
+    processed = []
+    errors = []
+
+    if not matches:
+        # Nothing to extract: no browser is started
+        print("No pending matches")
+    elif args.workers <= 1:
+        try:
+            processed, errors, _ = run_shard(matches, raw=args.raw, endpoints=endpoints, overwrite=args.reprocess)
+        except Exception as e:
+            # Same as a failed worker: the browser could not be started
+            print(f"Worker failed: {e}")
+            errors.extend((match['id'], str(e)) for match in matches)
+    else:
+        # Round-robin shards keep the workload of every worker balanced across leagues and rounds
+        shards = [matches[i::args.workers] for i in range(args.workers)]
+
+        # Every worker draws from the same rate limit
+        limiter = rate_limiter.get()
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=rate_limiter.install, initargs=(limiter,)) as executor:
+            futures = {
+                executor.submit(run_shard, shard, raw=args.raw, endpoints=endpoints, worker=worker, overwrite=args.reprocess): shard
+                for worker, shard in enumerate(shards) if shard
+            }
+
+            for future in as_completed(futures):
+                try:
+                    shard_processed, shard_errors, shard_metrics = future.result()
+                    processed.extend(shard_processed)
+                    errors.extend(shard_errors)
+                    metrics.merge(shard_metrics)
+                except Exception as e:
+                    # The whole shard failed (e.g. the browser could not be started)
+                    print(f"Worker failed: {e}")
+                    errors.extend((match['id'], str(e)) for match in futures[future])
+
+    print(f"Matches processed: {len(processed)}")
+    print(f"Errors (matches and S3 keys): {len(errors)}")
+    for item, error in errors:
+        print(f"  {item}: {error}")
+
+    metrics.finish()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Extract the statistics and info of the collected matches")
+    add_arguments(parser)
+    main(parser.parse_args())
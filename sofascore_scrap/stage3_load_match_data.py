@@ -0,0 +1,398 @@
+import psycopg2
+from psycopg2 import Error, sql
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import re
+from . import metrics
+from .setup_database import create_season_partitions
+from dotenv import load_dotenv
+
+load_dotenv() # Load .env variables
+
+# Read environment variables
+user_postgres = os.environ.get('USER_POSTGRES')
+password_postgres = os.environ.get('PASSWORD_POSTGRES')
+host_postgres = os.environ.get('HOST_POSTGRES')
+port_postgres = os.environ.get('PORT_POSTGRES')
+database_postgres = os.environ.get('DATABASE_POSTGRES')
+aws_key_id = os.environ.get('AWS_ACCESS_KEY_ID')
+aws_secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
+s3_endpoint_url = os.environ.get('S3_ENDPOINT_URL')
+
+# Name of the bucket where stage2 stores the match data
+bucket_name = "sofascore-scrap-project"
+
+# Prefixes (S3) or sub-directories (local) written by stage2
+info_prefix = 'matche_info/'
+stats_prefix = 'matche_stats/'
+
+# Match ID in the document names, e.g. flamengo-palmeiras-11352380-info.json(.gz)
+info_name_pattern = re.compile(r'-(\d+)-info\.json(?:\.gz)?$')
+stats_name_pattern = re.compile(r'-(\d+)-period-all\.json(?:\.gz)?$')
+
+# match_stat.home_value/away_value are DECIMAL(5, 2)
+max_stat_value = 999.99
+
+# Columns loaded in each table, in COPY order
+COLUMNS = {
+    'league': ['id', 'name', 'country'],
+    'season': ['id', 'season_year', 'id_league'],
+    'team': ['id', 'name', 'country', 'abbreviation'],
+    'referee': ['id', 'name', 'games_officiated', 'yellow_cards', 'red_cards'],
+    'stadium': ['id', 'name', 'city', 'country', 'capacity'],
+    'match': ['id', 'match_time', 'round', 'season_id', 'referee_id', 'stadium_id', 'home_team_id', 'away_team_id'],
+    'match_stat': ['match_id', 'stat_name', 'home_value', 'away_value'],
+}
+
+# Columns refreshed when a row already exists (None: existing rows are kept as they are)
+UPDATE_COLUMNS = {
+    'league': None,
+    'season': None,
+    'team': None,
+    'referee': ['name', 'games_officiated', 'yellow_cards', 'red_cards'],
+    'stadium': ['name', 'city', 'country', 'capacity'],
+    'match': ['match_time', 'round', 'season_id', 'referee_id', 'stadium_id', 'home_team_id', 'away_team_id'],
+}
+
+# Columns the schema declares NOT NULL (besides the IDs): a document without them is rejected before the COPY
+NOT_NULL_COLUMNS = {
+    'league': ['name'],
+    'season': ['season_year'],
+    'team': ['name'],
+    'referee': ['name'],
+    'stadium': ['name'],
+    'match': ['match_time'],
+}
+
+
+# Lists the documents under a prefix of the bucket (paginated ListObjectsV2)
+def list_s3_documents(s3, prefix, bucket=bucket_name):
+    keys = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        keys.extend(item['Key'] for item in page.get('Contents', []))
+    return keys
+
+# Lists the documents under a sub-directory of a local copy of the bucket
+def list_local_documents(root, prefix):
+    paths = []
+    for dirpath, _, filenames in os.walk(os.path.join(root, prefix)):
+        paths.extend(os.path.join(dirpath, filename) for filename in filenames)
+    return sorted(paths)
+
+# Loads a JSON document, stored as .json or as .json.gz (stage2 --raw)
+def parse_document(name, data):
+    if name.endswith('.gz'):
+        data = gzip.decompress(data)
+    return json.loads(data.decode('utf-8'))
+
+# Reads several documents, downloading them from S3 in parallel or reading them from disk
+# Yields (name, json_data) tuples; unreadable documents are reported and skipped
+def read_documents(names, s3=None, max_workers=16):
+    def read(name):
+        try:
+            with metrics.timer('read_document'):
+                if s3 is not None:
+                    data = s3.get_object(Bucket=bucket_name, Key=name)['Body'].read()
+                else:
+                    with open(name, 'rb') as f:
+                        data = f.read()
+            metrics.incr('bytes_received', len(data))
+            with metrics.timer('json_parse'):
+                return name, parse_document(name, data)
+        except Exception as e:
+            print(f"Error reading {name}: {e}")
+            metrics.incr('documents_failed')
+            return name, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for name, json_data in executor.map(read, names):
+            if json_data is not None:
+                yield name, json_data
+
+# Splits a list in chunks of at most `size` items
+def batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+# Converts a match info document (/event/{id}) into rows for each table
+def normalize_info(json_data, rows):
+    event = json_data['event']
+
+    tournament = event.get('tournament', {}).get('uniqueTournament') or {}
+    season = event.get('season') or {}
+    referee = event.get('referee')
+    venue = event.get('venue')
+
+    if tournament.get('id'):
+        rows['league'].append((tournament['id'], tournament.get('name'), tournament.get('category', {}).get('name')))
+    if season.get('id'):
+        rows['season'].append((season['id'], season.get('year') or season.get('name'), tournament.get('id')))
+
+    for side in ('homeTeam', 'awayTeam'):
+        team = event[side]
+        rows['team'].append((team['id'], team.get('name'), (team.get('country') or {}).get('name'), team.get('nameCode')))
+
+    if referee and referee.get('id'):
+        rows['referee'].append((
+            referee['id'],
+            referee.get('name'),
+            referee.get('games'),
+            referee.get('yellowCards'),
+            referee.get('redCards')
+        ))
+
+    if venue and venue.get('id'):
+        rows['stadium'].append((
+            venue['id'],
+            venue.get('name') or (venue.get('stadium') or {}).get('name'),
+            (venue.get('city') or {}).get('name'),
+            (venue.get('country') or {}).get('name'),
+            venue.get('capacity') or (venue.get('stadium') or {}).get('capacity')
+        ))
+
+    rows['match'].append((
+        event['id'],
+        datetime.fromtimestamp(event['startTimestamp'], tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        (event.get('roundInfo') or {}).get('round'),
+        season.get('id'),
+        referee.get('id') if referee else None,
+        venue.get('id') if venue else None,
+        event['homeTeam']['id'],
+        event['awayTeam']['id']
+    ))
+
+# Converts a statistics document (period == 'ALL') into match_stat rows
+def normalize_stats(id_match, json_data, rows):
+    seen = set()
+    for group in json_data.get('groups', []):
+        for item in group.get('statisticsItems', []):
+            name = item.get('name')
+            home_value = item.get('homeValue')
+            away_value = item.get('awayValue')
+
+            # The same statistic can be listed in more than one group
+            if not name or name in seen or home_value is None or away_value is None:
+                continue
+            if abs(home_value) > max_stat_value or abs(away_value) > max_stat_value:
+                print(f"Skipping {name} of match {id_match}: value out of range ({home_value}, {away_value})")
+                continue
+
+            seen.add(name)
+            rows['match_stat'].append((id_match, name, home_value, away_value))
+
+# Checks the rows of a document against the NOT NULL columns of the schema
+# Raises ValueError with the first missing value
+def validate_rows(rows):
+    for table, columns in NOT_NULL_COLUMNS.items():
+        for row in rows[table]:
+            if row[0] is None:
+                raise ValueError(f"{table} without id")
+            for column in columns:
+                if row[COLUMNS[table].index(column)] is None:
+                    raise ValueError(f"{table} {row[0]} without {column}")
+
+# Streams rows into a staging table with COPY FROM STDIN
+def copy_rows(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    cursor.copy_expert(
+        sql.SQL("COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)").format(
+            table=sql.Identifier(table),
+            columns=sql.SQL(', ').join(map(sql.Identifier, columns))
+        ),
+        buffer
+    )
+
+# Loads the rows of a table through a staging table and an upsert
+def upsert_rows(cursor, table, rows):
+    if not rows:
+        return
+
+    columns = COLUMNS[table]
+    stage = f"stage_{table}"
+
+    cursor.execute(sql.SQL("CREATE TEMP TABLE {stage} (LIKE {table}) ON COMMIT DROP").format(
+        stage=sql.Identifier(stage),
+        table=sql.Identifier(table)
+    ))
+    copy_rows(cursor, stage, columns, rows)
+
+    update_columns = UPDATE_COLUMNS[table]
+    if update_columns:
+        conflict_action = sql.SQL("DO UPDATE SET {}").format(sql.SQL(', ').join(
+            sql.SQL("{column} = EXCLUDED.{column}").format(column=sql.Identifier(column)) for column in update_columns
+        ))
+    else:
+        conflict_action = sql.SQL("DO NOTHING")
+
+    # DISTINCT ON: the same referee, stadium or team can appear several times in a batch
+    cursor.execute(sql.SQL(
+        "INSERT INTO {table} ({columns}) SELECT DISTINCT ON (id) {columns} FROM {stage} ORDER BY id "
+        "ON CONFLICT (id) {conflict_action}"
+    ).format(
+        table=sql.Identifier(table),
+        columns=sql.SQL(', ').join(map(sql.Identifier, columns)),
+        stage=sql.Identifier(stage),
+        conflict_action=conflict_action
+    ))
+
+# Upserts the statistics of the matches in the batch through a staging table
+# match_stat is partitioned by season (setup_database.py, migration 3): the season comes from the match row
+def upsert_match_stats(cursor, rows):
+    if not rows:
+        return
+
+    cursor.execute(
+        "CREATE TEMP TABLE stage_match_stat (match_id INTEGER, stat_name VARCHAR(255), home_value NUMERIC, away_value NUMERIC) "
+        "ON COMMIT DROP"
+    )
+    copy_rows(cursor, 'stage_match_stat', COLUMNS['match_stat'], rows)
+
+    # Partitions of the seasons loaded for the first time
+    cursor.execute("SELECT DISTINCT m.season_id FROM stage_match_stat s JOIN match m ON m.id = s.match_id WHERE m.season_id IS NOT NULL")
+    create_season_partitions(cursor, [row[0] for row in cursor.fetchall()])
+
+    # Reloading a match updates its statistics instead of duplicating them
+    # Statistics of matches whose info has not been loaded are skipped (no season and a broken foreign key)
+    cursor.execute(
+        "INSERT INTO match_stat (match_id, season_id, stat_name, home_value, away_value) "
+        "SELECT s.match_id, m.season_id, s.stat_name, s.home_value, s.away_value FROM stage_match_stat s "
+        "JOIN match m ON m.id = s.match_id WHERE m.season_id IS NOT NULL "
+        "ON CONFLICT (season_id, match_id, stat_name) DO UPDATE SET home_value = EXCLUDED.home_value, away_value = EXCLUDED.away_value"
+    )
+    if cursor.rowcount < len(rows):
+        print(f"{len(rows) - cursor.rowcount} statistics skipped: match info not loaded")
+
+# Converts the documents of a batch into rows for each table
+# A document that cannot be normalized or misses a NOT NULL value is reported and skipped,
+# without leaving part of its rows in the batch
+def normalize_documents(documents, kind):
+    rows = {table: [] for table in COLUMNS}
+    normalized = []
+
+    for name, json_data in documents:
+        document_rows = {table: [] for table in COLUMNS}
+        try:
+            if kind == 'info':
+                normalize_info(json_data, document_rows)
+            else:
+                id_match = int(stats_name_pattern.search(name).group(1))
+                normalize_stats(id_match, json_data, document_rows)
+            validate_rows(document_rows)
+        except Exception as e:
+            print(f"Skipping {name}: cannot normalize the document ({e!r})")
+            metrics.incr('documents_failed')
+            continue
+
+        for table, table_rows in document_rows.items():
+            rows[table].extend(table_rows)
+        normalized.append((name, json_data))
+
+    return rows, normalized
+
+# Loads a batch of documents in a single transaction
+# If the batch fails (e.g. a value the schema rejects), its documents are loaded again one by one,
+# so only the offending documents are dropped
+# Returns the number of documents loaded
+def load_batch(conn, documents, kind):
+    rows, documents = normalize_documents(documents, kind)
+    if not documents:
+        return 0
+
+    cursor = conn.cursor()
+    try:
+        with metrics.timer('db_load', kind=kind, documents=len(documents)):
+            if kind == 'info':
+                # Parents first, because of the foreign keys
+                for table in ('league', 'season', 'team', 'referee', 'stadium', 'match'):
+                    upsert_rows(cursor, table, rows[table])
+            else:
+                upsert_match_stats(cursor, rows['match_stat'])
+            conn.commit()
+    except Exception as e:
+        conn.rollback()
+        if len(documents) == 1:
+            print(f"Skipping {documents[0][0]}: {str(e).strip()}")
+            metrics.incr('documents_failed')
+            return 0
+        print(f"Error loading {kind} batch, loading its {len(documents)} documents one by one: {str(e).strip()}")
+        return sum(load_batch(conn, [document], kind) for document in documents)
+    finally:
+        cursor.close()
+
+    if len(documents) > 1:
+        print(f"Loaded {len(documents)} {kind} documents ({len(rows['match'])} matches, {len(rows['match_stat'])} statistics)")
+    metrics.incr('documents_loaded', len(documents))
+    return len(documents)
+
+# Loads all the info documents first (matches) and then all the statistics
+def load_documents(conn, list_documents, s3=None, league=None, batch_size=500):
+    for kind, prefix, name_pattern in (('info', info_prefix, info_name_pattern), ('stats', stats_prefix, stats_name_pattern)):
+        names = [name for name in list_documents(prefix + (f"{league}/" if league else '')) if name_pattern.search(name)]
+        print(f"Found {len(names)} {kind} documents")
+
+        for names_batch in batches(names, batch_size):
+            load_batch(conn, list(read_documents(names_batch, s3=s3)), kind)
+
+
+# Adds the stage3 command line arguments to a parser
+def add_arguments(parser):
+    parser.add_argument('--source', choices=['s3', 'local'], default='s3', help="Where the documents are read from")
+    parser.add_argument('--path', default='.', help="Local directory with the matche_info/ and matche_stats/ folders")
+    parser.add_argument('--league', help="Only load one league-season, e.g. brasileirao-serie-a-2023")
+    parser.add_argument('--batch-size', type=int, default=500, help="Documents loaded per transaction")
+
+# Runs stage3 with the parsed command line arguments
+def main(args):
+    metrics.start()
+
+    s3 = None
+    if args.source == 's3':
+        s3 = boto3.client(
+            's3',
+            aws_access_key_id=aws_key_id,
+            aws_secret_access_key=aws_secret_key,
+            region_name='us-east-2',
+            endpoint_url=s3_endpoint_url
+        )
+        list_documents = lambda prefix: list_s3_documents(s3, prefix)
+    else:
+        list_documents = lambda prefix: list_local_documents(args.path, prefix)
+
+    try:
+        # Connect to the database
+        conn = psycopg2.connect(
+            user=user_postgres,
+            password=password_postgres,
+            host=host_postgres,
+            port=port_postgres,
+            database=database_postgres
+        )
+        print("Succesfully connected to the database")
+    except (Exception, Error) as error:
+        print("Error to coneccting to the database: ", error)
+        return
+
+    try:
+        load_documents(conn, list_documents, s3=s3, league=args.league, batch_size=args.batch_size)
+    finally:
+        conn.close()
+        print("Database connection closed.")
+
+    metrics.finish()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load the match info and statistics documents into PostgreSQL")
+    add_arguments(parser)
+    main(parser.parse_args())
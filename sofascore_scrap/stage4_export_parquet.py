@@ -0,0 +1,344 @@
+import argparse
+import os
+import re
+import uuid
+from datetime import datetime, timezone
+import boto3
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from . import metrics
+from .stage3_load_match_data import (
+    aws_key_id, aws_secret_key, s3_endpoint_url,
+    info_prefix, stats_prefix, info_name_pattern, stats_name_pattern,
+    list_s3_documents, list_local_documents, read_documents, batches
+)
+
+# Exports the match info and the 'ALL' period statistics written by stage2 into a columnar
+# Parquet dataset, partitioned by league-season (hive style, e.g. matches/league_season=brasileirao-serie-a-2023/).
+# Each run only appends the documents that are not in the dataset yet, as new files.
+# Every partition keeps a manifest of the documents it was built from (_exported-*.txt) and of the ones that could
+# not be flattened (_failed-*.txt, with the reason); the Parquet readers ignore the files starting with '_'.
+
+# League-season folder in the document names, e.g. matche_stats/brasileirao-serie-a-2023/...
+league_season_pattern = re.compile(r'(?:^|/)matche_(?:info|stats)/([^/]+)/')
+
+# Name of the partition column
+PARTITION = 'league_season'
+
+# Document key recorded in the manifests: the part of the name from the stage2 prefix on (same for S3 and local copies)
+document_key_pattern = re.compile(r'(?:^|/)(matche_(?:info|stats)/.+)$')
+
+MATCH_SCHEMA = pa.schema([
+    ('match_id', pa.int64()),
+    ('custom_id', pa.string()),
+    ('slug', pa.string()),
+    ('tournament_id', pa.int32()),
+    ('tournament', pa.string()),
+    ('country', pa.string()),
+    ('season_id', pa.int32()),
+    ('season_year', pa.string()),
+    ('round', pa.int16()),
+    ('start_time', pa.timestamp('s', tz='UTC')),
+    ('status', pa.string()),
+    ('home_team_id', pa.int32()),
+    ('home_team', pa.string()),
+    ('home_team_code', pa.string()),
+    ('away_team_id', pa.int32()),
+    ('away_team', pa.string()),
+    ('away_team_code', pa.string()),
+    ('home_score', pa.int16()),
+    ('away_score', pa.int16()),
+    ('winner_code', pa.int8()),
+    ('referee_id', pa.int32()),
+    ('referee', pa.string()),
+    ('venue_id', pa.int32()),
+    ('venue', pa.string()),
+    ('city', pa.string()),
+    ('capacity', pa.int32()),
+])
+
+# One row per statistic of a match (long format), so every statistic has the same columns
+STAT_SCHEMA = pa.schema([
+    ('match_id', pa.int64()),
+    ('stat_group', pa.string()),
+    ('stat_name', pa.string()),
+    ('stat_key', pa.string()),
+    ('home_value', pa.float64()),
+    ('away_value', pa.float64()),
+    ('home', pa.string()),
+    ('away', pa.string()),
+])
+
+# Dataset tables: (sub-directory, stage2 prefix, document name pattern, schema)
+TABLES = {
+    'matches': (info_prefix, info_name_pattern, MATCH_SCHEMA),
+    'match_stats': (stats_prefix, stats_name_pattern, STAT_SCHEMA),
+}
+
+
+def league_season_of(name):
+    match = league_season_pattern.search(name.replace(os.sep, '/'))
+    return match.group(1) if match else None
+
+def document_key(name):
+    name = name.replace(os.sep, '/')
+    match = document_key_pattern.search(name)
+    return match.group(1) if match else name
+
+# Flattens a match info document into a matches row
+def flatten_info(json_data):
+    event = json_data['event']
+    tournament = event.get('tournament', {}).get('uniqueTournament') or {}
+    season = event.get('season') or {}
+    home = event.get('homeTeam') or {}
+    away = event.get('awayTeam') or {}
+    referee = event.get('referee') or {}
+    venue = event.get('venue') or {}
+    start = event.get('startTimestamp')
+
+    return {
+        'match_id': event['id'],
+        'custom_id': event.get('customId'),
+        'slug': event.get('slug'),
+        'tournament_id': tournament.get('id'),
+        'tournament': tournament.get('name'),
+        'country': (tournament.get('category') or {}).get('name'),
+        'season_id': season.get('id'),
+        'season_year': season.get('year') or season.get('name'),
+        'round': (event.get('roundInfo') or {}).get('round'),
+        'start_time': datetime.fromtimestamp(start, tz=timezone.utc) if start else None,
+        'status': (event.get('status') or {}).get('type'),
+        'home_team_id': home.get('id'),
+        'home_team': home.get('name'),
+        'home_team_code': home.get('nameCode'),
+        'away_team_id': away.get('id'),
+        'away_team': away.get('name'),
+        'away_team_code': away.get('nameCode'),
+        'home_score': (event.get('homeScore') or {}).get('current'),
+        'away_score': (event.get('awayScore') or {}).get('current'),
+        'winner_code': event.get('winnerCode'),
+        'referee_id': referee.get('id'),
+        'referee': referee.get('name'),
+        'venue_id': venue.get('id'),
+        'venue': venue.get('name') or (venue.get('stadium') or {}).get('name'),
+        'city': (venue.get('city') or {}).get('name'),
+        'capacity': venue.get('capacity') or (venue.get('stadium') or {}).get('capacity'),
+    }
+
+# Flattens the groups of a statistics document (period == 'ALL') into match_stats rows
+def flatten_stats(id_match, json_data):
+    rows = []
+    for group in json_data.get('groups', []):
+        for item in group.get('statisticsItems', []):
+            if not item.get('name'):
+                continue
+            rows.append({
+                'match_id': id_match,
+                'stat_group': group.get('groupName'),
+                'stat_name': item['name'],
+                'stat_key': item.get('key'),
+                'home_value': item.get('homeValue'),
+                'away_value': item.get('awayValue'),
+                'home': item.get('home'),
+                'away': item.get('away'),
+            })
+    return rows
+
+
+# Opens the dataset location: a local directory or a s3://bucket/prefix URI
+def open_output(output):
+    if output.startswith('s3://') and s3_endpoint_url:
+        endpoint = re.sub(r'^https?://', '', s3_endpoint_url)
+        fs = pafs.S3FileSystem(
+            access_key=aws_key_id,
+            secret_key=aws_secret_key,
+            region='us-east-2',
+            endpoint_override=endpoint,
+            scheme='https' if s3_endpoint_url.startswith('https') else 'http'
+        )
+        return fs, output[len('s3://'):].rstrip('/')
+    if output.startswith('s3://'):
+        return pafs.S3FileSystem(access_key=aws_key_id, secret_key=aws_secret_key, region='us-east-2'), output[len('s3://'):].rstrip('/')
+    return pafs.LocalFileSystem(), os.path.abspath(output)
+
+# Lists the Parquet files of a directory of the dataset (recursively)
+def list_parquet_files(fs, path):
+    if fs.get_file_info(path).type != pafs.FileType.Directory:
+        return []
+    infos = fs.get_file_info(pafs.FileSelector(path, recursive=True))
+    return [info.path for info in infos if info.type == pafs.FileType.File and info.path.endswith('.parquet')]
+
+# Reads the match IDs of some Parquet files (only the match_id column is read)
+def exported_ids(fs, files):
+    if not files:
+        return set()
+    dataset = ds.dataset(files, filesystem=fs, format='parquet')
+    return set(dataset.to_table(columns=['match_id']).column('match_id').to_pylist())
+
+# Reads the manifests of the partitions of a table
+# The partitions written before the manifests existed have none: the match IDs of their files are returned instead
+# Returns (keys of the exported documents, keys of the failed documents, match IDs of the partitions without manifest)
+def read_manifest(fs, root, table, league=None):
+    path = f"{root}/{table}" + (f"/{PARTITION}={league}" if league else '')
+    exported = set()
+    failed = set()
+    if fs.get_file_info(path).type != pafs.FileType.Directory:
+        return exported, failed, set()
+
+    files_by_partition = {}
+    for info in fs.get_file_info(pafs.FileSelector(path, recursive=True)):
+        if info.type == pafs.FileType.File:
+            files_by_partition.setdefault(info.path.rsplit('/', 1)[0], []).append(info)
+
+    legacy_files = []
+    for infos in files_by_partition.values():
+        manifests = [info for info in infos if info.base_name.startswith(('_exported-', '_failed-'))]
+        if not manifests:
+            legacy_files.extend(info.path for info in infos if info.path.endswith('.parquet'))
+        for info in manifests:
+            keys = failed if info.base_name.startswith('_failed-') else exported
+            with fs.open_input_stream(info.path) as f:
+                keys.update(line.split('\t')[0] for line in f.read().decode('utf-8').splitlines() if line.strip())
+
+    return exported, failed, exported_ids(fs, legacy_files)
+
+# Adds a manifest file per league-season with the given lines ('exported' document keys, or 'failed' keys and reasons)
+# A new file is written every time: object stores cannot append to an existing one
+def write_manifest(fs, root, table, kind, lines_by_partition):
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+    for league_season, lines in lines_by_partition.items():
+        if not lines:
+            continue
+        directory = f"{root}/{table}/{PARTITION}={league_season}"
+        fs.create_dir(directory, recursive=True)
+        with fs.open_output_stream(f"{directory}/_{kind}-{stamp}-{uuid.uuid4().hex[:8]}.txt") as f:
+            f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+
+# Writes the rows of a batch, one new file per league-season
+def write_rows(fs, root, table, schema, rows_by_partition):
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+    for league_season, rows in rows_by_partition.items():
+        if not rows:
+            continue
+        directory = f"{root}/{table}/{PARTITION}={league_season}"
+        fs.create_dir(directory, recursive=True)
+        with metrics.timer('parquet_write', table=table, rows=len(rows)):
+            pq.write_table(
+                pa.Table.from_pylist(rows, schema=schema),
+                f"{directory}/part-{stamp}-{uuid.uuid4().hex[:8]}.parquet",
+                filesystem=fs,
+                compression='zstd'
+            )
+        metrics.incr('parquet_rows', len(rows))
+        print(f"Wrote {len(rows)} rows to {table}/{PARTITION}={league_season}")
+
+# Appends the documents that are not in the dataset yet
+# The documents are skipped by the manifests, so a statistics document without any row or a document that failed
+# is not downloaded again (with retry_failed the failed ones are exported again)
+def export_documents(fs, root, list_documents, s3=None, league=None, batch_size=5000, retry_failed=False):
+    for table, (prefix, name_pattern, schema) in TABLES.items():
+        exported, failed, legacy_ids = read_manifest(fs, root, table, league)
+        skipped = exported if retry_failed else exported | failed
+
+        # The documents are named after their match: exported documents are not even downloaded
+        names = []
+        legacy = {}
+        for name in list_documents(prefix + (f"{league}/" if league else '')):
+            id_match = name_pattern.search(name)
+            if not id_match or document_key(name) in skipped:
+                continue
+            if int(id_match.group(1)) in legacy_ids:
+                # Exported before the manifests existed: recorded now, so its partition is read from the manifest next time
+                legacy.setdefault(league_season_of(name), []).append(document_key(name))
+            else:
+                names.append(name)
+        write_manifest(fs, root, table, 'exported', legacy)
+        print(f"{len(names)} new {table} documents ({len(exported) + sum(map(len, legacy.values()))} already exported, {len(failed)} failed)")
+
+        for names_batch in batches(names, batch_size):
+            rows_by_partition = {}
+            done = {}
+            failures = {}
+            for name, json_data in read_documents(names_batch, s3=s3):
+                league_season = league_season_of(name)
+                try:
+                    if table == 'matches':
+                        rows = [flatten_info(json_data)]
+                    else:
+                        rows = flatten_stats(int(name_pattern.search(name).group(1)), json_data)
+                except Exception as e:
+                    print(f"Error flattening {name}: {e}")
+                    failures.setdefault(league_season, []).append(f"{document_key(name)}\t{e!r}")
+                    metrics.incr('documents_failed')
+                    continue
+                rows_by_partition.setdefault(league_season, []).extend(rows)
+                done.setdefault(league_season, []).append(document_key(name))
+
+            # The manifest is written once the rows are
+            write_rows(fs, root, table, schema, rows_by_partition)
+            write_manifest(fs, root, table, 'exported', done)
+            write_manifest(fs, root, table, 'failed', failures)
+
+# Rewrites each partition made of several appended files into a single file sorted by match
+def compact(fs, root, league=None):
+    for table, (_, _, schema) in TABLES.items():
+        table_path = f"{root}/{table}"
+        if fs.get_file_info(table_path).type != pafs.FileType.Directory:
+            continue
+
+        for info in fs.get_file_info(pafs.FileSelector(table_path)):
+            if info.type != pafs.FileType.Directory or (league and info.base_name != f"{PARTITION}={league}"):
+                continue
+            files = list_parquet_files(fs, info.path)
+            if len(files) < 2:
+                continue
+
+            data = ds.dataset(files, filesystem=fs, format='parquet', schema=schema).to_table().sort_by('match_id')
+            # The new file is written before the old ones are deleted, so no row is ever missing
+            pq.write_table(data, f"{info.path}/part-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-compacted.parquet", filesystem=fs, compression='zstd')
+            for path in files:
+                fs.delete_file(path)
+            print(f"Compacted {len(files)} files of {table}/{info.base_name} ({data.num_rows} rows)")
+
+
+# Adds the stage4 command line arguments to a parser
+def add_arguments(parser):
+    parser.add_argument('--source', choices=['s3', 'local'], default='s3', help="Where the stage2 documents are read from")
+    parser.add_argument('--path', default='.', help="Local directory with the matche_info/ and matche_stats/ folders")
+    parser.add_argument('--output', default='match_dataset', help="Dataset location: a local directory or s3://bucket/prefix")
+    parser.add_argument('--league', help="Only export one league-season, e.g. brasileirao-serie-a-2023")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Documents written per Parquet file")
+    parser.add_argument('--compact', action='store_true', help="Merge the files appended by previous runs into one file per partition")
+    parser.add_argument('--retry-failed', action='store_true', help="Export again the documents that could not be flattened by previous runs")
+
+# Runs stage4 with the parsed command line arguments
+def main(args):
+    metrics.start()
+
+    s3 = None
+    if args.source == 's3':
+        s3 = boto3.client(
+            's3',
+            aws_access_key_id=aws_key_id,
+            aws_secret_access_key=aws_secret_key,
+            region_name='us-east-2',
+            endpoint_url=s3_endpoint_url
+        )
+        list_documents = lambda prefix: list_s3_documents(s3, prefix)
+    else:
+        list_documents = lambda prefix: list_local_documents(args.path, prefix)
+
+    fs, root = open_output(args.output)
+    export_documents(fs, root, list_documents, s3=s3, league=args.league, batch_size=args.batch_size, retry_failed=args.retry_failed)
+    if args.compact:
+        compact(fs, root, league=args.league)
+
+    metrics.finish()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the match info and statistics to a Parquet dataset partitioned by league-season")
+    add_arguments(parser)
+    main(parser.parse_args())
@@ -0,0 +1,411 @@
+import argparse
+import csv
+import os
+import sqlite3
+
+# Default location of the state database
+DEFAULT_PATH = 'scrap_state.db'
+
+# Columns of the match keys, in the same order as keys_matches.csv
+MATCH_KEY_FIELDS = ['customId', 'id', 'id_mandante', 'id_visitante', 'slug', 'league', 'mandante', 'visitante', 'rodada']
+
+# Tables holding plain IDs, with the legacy CSV file each one replaces
+ID_TABLES = {
+    'leagues': 'registered_leagues.csv',
+    'seasons': 'registered_seasons.csv',
+    'teams': 'registered_teams.csv',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leagues (id INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS seasons (id INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS teams (id INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS match_keys (
+    id INTEGER PRIMARY KEY,
+    customId TEXT NOT NULL,
+    id_mandante INTEGER,
+    id_visitante INTEGER,
+    slug TEXT NOT NULL,
+    league TEXT NOT NULL,
+    mandante TEXT,
+    visitante TEXT,
+    rodada INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_match_keys_league ON match_keys (league);
+CREATE TABLE IF NOT EXISTS stage2_status (
+    id INTEGER PRIMARY KEY REFERENCES match_keys(id),
+    status TEXT NOT NULL,
+    error TEXT,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_stage2_status_status ON stage2_status (status);
+CREATE TABLE IF NOT EXISTS season_rounds (
+    id_season INTEGER NOT NULL,
+    round INTEGER NOT NULL,
+    complete INTEGER NOT NULL,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id_season, round)
+);
+CREATE TABLE IF NOT EXISTS season_progress (
+    id_season INTEGER PRIMARY KEY,
+    total_rounds INTEGER,
+    finished INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS absent_endpoints (
+    id INTEGER NOT NULL REFERENCES match_keys(id),
+    endpoint TEXT NOT NULL,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, endpoint)
+);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY REFERENCES match_keys(id),
+    attempts INTEGER NOT NULL,
+    error TEXT,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+class StateStore:
+    """
+    Embedded SQLite store with the processed leagues, seasons, teams, match keys, round checkpoints, stage2 status,
+    the optional endpoints each match does not have and the dead-letter list of the matches stage2 gave up on.
+
+    Every lookup goes through a primary key or index, and every write method commits its
+    whole batch atomically. WAL mode lets the stage2 workers read and write concurrently.
+
+    Args:
+        path (str): Path of the SQLite database file.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def is_empty(self):
+        """
+        Checks whether nothing has been recorded yet.
+
+        Returns:
+            bool: True if all the tables are empty.
+        """
+        for table in list(ID_TABLES) + ['match_keys']:
+            if self.conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                return False
+        return True
+
+    def has_id(self, table, id_value):
+        """
+        Checks if an ID has already been recorded in one of the ID tables.
+
+        Args:
+            table (str): 'leagues', 'seasons' or 'teams'.
+            id_value (int | str): The ID to check.
+
+        Returns:
+            bool: True if the ID exists.
+        """
+        row = self.conn.execute(f"SELECT 1 FROM {table} WHERE id = ?", (int(id_value),)).fetchone()
+        return row is not None
+
+    def add_ids(self, table, id_values):
+        """
+        Records several IDs in one of the ID tables in a single transaction.
+
+        Args:
+            table (str): 'leagues', 'seasons' or 'teams'.
+            id_values (iterable): The IDs to record.
+        """
+        with self.conn:
+            self.conn.executemany(f"INSERT OR IGNORE INTO {table} (id) VALUES (?)", ((int(i),) for i in id_values))
+
+    def has_match(self, id_match):
+        row = self.conn.execute("SELECT 1 FROM match_keys WHERE id = ?", (int(id_match),)).fetchone()
+        return row is not None
+
+    def add_matches(self, matches, replace=False):
+        """
+        Records several match keys in a single transaction.
+
+        Args:
+            matches (list): Dicts with the MATCH_KEY_FIELDS keys.
+            replace (bool): Update the keys already recorded (stage1 --reprocess) instead of ignoring them.
+        """
+        placeholders = ', '.join(f":{field}" for field in MATCH_KEY_FIELDS)
+        if replace:
+            updates = ', '.join(f"{field} = excluded.{field}" for field in MATCH_KEY_FIELDS if field != 'id')
+            conflict = f"ON CONFLICT (id) DO UPDATE SET {updates}"
+        else:
+            conflict = "ON CONFLICT (id) DO NOTHING"
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO match_keys ({', '.join(MATCH_KEY_FIELDS)}) VALUES ({placeholders}) {conflict}",
+                matches
+            )
+
+    def pending_matches(self, include_done=False):
+        """
+        Lists the match keys that stage2 has not completed yet (dead letters excluded).
+
+        Args:
+            include_done (bool): Also list the completed matches (e.g. to backfill a newly selected endpoint).
+
+        Returns:
+            list: Dicts with the MATCH_KEY_FIELDS keys.
+        """
+        status_filter = "" if include_done else "(s.status IS NULL OR s.status <> 'done') AND "
+        rows = self.conn.execute(
+            "SELECT m.* FROM match_keys m LEFT JOIN stage2_status s ON s.id = m.id "
+            f"WHERE {status_filter}m.id NOT IN (SELECT id FROM dead_letters) "
+            "ORDER BY m.league, m.rodada DESC, m.id"
+        )
+        return [dict(row) for row in rows]
+
+    def collected_matches(self, league=None):
+        """
+        Lists every collected match key, whatever its stage2 status (used to reprocess them).
+
+        Args:
+            league (str): Only the matches of this league-season (e.g. brasileirao-serie-a-2023).
+
+        Returns:
+            list: Dicts with the MATCH_KEY_FIELDS keys.
+        """
+        if league:
+            rows = self.conn.execute("SELECT * FROM match_keys WHERE league = ? ORDER BY rodada DESC, id", (league,))
+        else:
+            rows = self.conn.execute("SELECT * FROM match_keys ORDER BY league, rodada DESC, id")
+        return [dict(row) for row in rows]
+
+    def set_stage2_status(self, statuses):
+        """
+        Records the stage2 result of several matches in a single transaction.
+
+        Args:
+            statuses (list): (id_match, status, error) tuples, where status is 'done' or 'failed'.
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO stage2_status (id, status, error) VALUES (?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET status = excluded.status, error = excluded.error, updated_at = CURRENT_TIMESTAMP",
+                ((int(id_match), status, error) for id_match, status, error in statuses)
+            )
+
+    def add_absent_endpoints(self, items):
+        """
+        Records the optional endpoints (e.g. lineups) the API does not have for a match (404),
+        so the pre-flight check does not send the match back to the browser for them.
+
+        Args:
+            items (list): (id_match, endpoint name) tuples.
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO absent_endpoints (id, endpoint) VALUES (?, ?) "
+                "ON CONFLICT (id, endpoint) DO UPDATE SET updated_at = CURRENT_TIMESTAMP",
+                ((int(id_match), endpoint) for id_match, endpoint in items)
+            )
+
+    def absent_endpoints(self):
+        """
+        Lists the optional endpoints recorded as absent.
+
+        Returns:
+            dict: Match ID -> set of the endpoint names the match does not have.
+        """
+        absent = {}
+        for row in self.conn.execute("SELECT id, endpoint FROM absent_endpoints"):
+            absent.setdefault(row['id'], set()).add(row['endpoint'])
+        return absent
+
+    def add_dead_letters(self, items):
+        """
+        Records the matches that failed on every attempt, so the next runs skip them.
+
+        Args:
+            items (list): (id_match, attempts, error) tuples.
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO dead_letters (id, attempts, error) VALUES (?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET attempts = dead_letters.attempts + excluded.attempts, "
+                "error = excluded.error, updated_at = CURRENT_TIMESTAMP",
+                ((int(id_match), int(attempts), error) for id_match, attempts, error in items)
+            )
+
+    def dead_letters(self):
+        rows = self.conn.execute(
+            "SELECT d.id, m.slug, m.league, d.attempts, d.error, d.updated_at "
+            "FROM dead_letters d LEFT JOIN match_keys m ON m.id = d.id ORDER BY d.updated_at, d.id"
+        )
+        return [dict(row) for row in rows]
+
+    def requeue_dead_letters(self):
+        """
+        Removes every match from the dead-letter list, so stage2 tries them again.
+
+        Returns:
+            int: Number of requeued matches.
+        """
+        with self.conn:
+            return self.conn.execute("DELETE FROM dead_letters").rowcount
+
+    def completed_rounds(self, id_season):
+        """
+        Lists the rounds of a season whose matches have all been settled and recorded.
+
+        Args:
+            id_season (int): The season ID.
+
+        Returns:
+            set: The completed round numbers.
+        """
+        rows = self.conn.execute("SELECT round FROM season_rounds WHERE id_season = ? AND complete = 1", (int(id_season),))
+        return {row['round'] for row in rows}
+
+    def set_round_statuses(self, id_season, statuses):
+        """
+        Checkpoints the processed rounds of a season in a single transaction.
+
+        Args:
+            id_season (int): The season ID.
+            statuses (dict): Round number -> True if the round is complete.
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO season_rounds (id_season, round, complete) VALUES (?, ?, ?) "
+                "ON CONFLICT (id_season, round) DO UPDATE SET complete = excluded.complete, updated_at = CURRENT_TIMESTAMP",
+                [(int(id_season), int(round_number), int(bool(complete))) for round_number, complete in statuses.items()]
+            )
+
+    def is_season_finished(self, id_season):
+        row = self.conn.execute("SELECT finished FROM season_progress WHERE id_season = ?", (int(id_season),)).fetchone()
+        return bool(row and row['finished'])
+
+    def update_season_progress(self, id_season, total_rounds):
+        """
+        Records the number of rounds of a season and marks it as finished if all of them are complete.
+
+        Args:
+            id_season (int): The season ID.
+            total_rounds (int): The number of rounds of the season.
+
+        Returns:
+            bool: True if the season is finished.
+        """
+        completed = self.completed_rounds(id_season)
+        finished = all(round_number in completed for round_number in range(1, int(total_rounds) + 1))
+
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO season_progress (id_season, total_rounds, finished) VALUES (?, ?, ?) "
+                "ON CONFLICT (id_season) DO UPDATE SET total_rounds = excluded.total_rounds, finished = excluded.finished",
+                (int(id_season), int(total_rounds), int(finished))
+            )
+        return finished
+
+    def import_csv(self, table, filename):
+        """
+        Imports a legacy CSV file (registered_*.csv or keys_matches.csv).
+
+        Args:
+            table (str): 'leagues', 'seasons', 'teams' or 'match_keys'.
+            filename (str): The CSV file to import.
+
+        Returns:
+            int: Number of rows read from the file.
+        """
+        if not os.path.exists(filename):
+            return 0
+
+        with open(filename, mode='r', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+
+        if table == 'match_keys':
+            self.add_matches([{field: row.get(field) for field in MATCH_KEY_FIELDS} for row in rows])
+        else:
+            self.add_ids(table, (row['id'] for row in rows if row.get('id')))
+
+        print(f"Imported {len(rows)} rows from {filename} into {table}")
+        return len(rows)
+
+    def import_legacy_csv(self, keys_filename='keys_matches.csv'):
+        """
+        Imports all the legacy CSV files that exist in the working directory.
+
+        Args:
+            keys_filename (str): The match keys CSV file.
+        """
+        for table, filename in ID_TABLES.items():
+            self.import_csv(table, filename)
+        self.import_csv('match_keys', keys_filename)
+
+    def export_csv(self, table, filename):
+        """
+        Exports a table in the legacy CSV format.
+
+        Args:
+            table (str): 'leagues', 'seasons', 'teams' or 'match_keys'.
+            filename (str): The CSV file to (over)write.
+
+        Returns:
+            int: Number of exported rows.
+        """
+        fields = MATCH_KEY_FIELDS if table == 'match_keys' else ['id']
+        order = "league, rodada DESC, id" if table == 'match_keys' else "id"
+        rows = self.conn.execute(f"SELECT {', '.join(fields)} FROM {table} ORDER BY {order}").fetchall()
+
+        # Write to a temporary file first so a crash never leaves a truncated CSV behind
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, mode='w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(fields)
+            writer.writerows(tuple(row) for row in rows)
+        os.replace(tmp_filename, filename)
+
+        print(f"Exported {len(rows)} rows from {table} to {filename}")
+        return len(rows)
+
+    def export_legacy_csv(self, keys_filename='keys_matches.csv'):
+        for table, filename in ID_TABLES.items():
+            self.export_csv(table, filename)
+        self.export_csv('match_keys', keys_filename)
+
+
+def add_arguments(parser):
+    parser.add_argument('action', choices=['import', 'export', 'dead-letters', 'requeue'])
+    parser.add_argument('--db', default=DEFAULT_PATH, help="Path of the SQLite state database")
+
+
+def main(args):
+    with StateStore(args.db) as store:
+        if args.action == 'import':
+            store.import_legacy_csv()
+        elif args.action == 'export':
+            store.export_legacy_csv()
+        elif args.action == 'dead-letters':
+            items = store.dead_letters()
+            for item in items:
+                print(f"{item['id']} {item['league']}/{item['slug']}: {item['attempts']} attempts, {item['error']} ({item['updated_at']})")
+            print(f"{len(items)} dead letter(s)")
+        else:
+            print(f"Requeued {store.requeue_dead_letters()} match(es)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import/export the scraping state from/to the legacy CSV files and manage the dead letters")
+    add_arguments(parser)
+    main(parser.parse_args())
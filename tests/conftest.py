@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# The sofascore_scrap package lives at the root of the repository, the replay server in benchmarks/
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+from sofascore_scrap import metrics, rate_limiter
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """
+    A fast rate limiter installed for the test (high rate, so acquire does not wait).
+    """
+    limiter = rate_limiter.RateLimiter(rate=1000, burst=100, min_rate=1, max_rate=1000)
+    monkeypatch.setattr(rate_limiter, '_limiter', limiter)
+    return limiter
+
+
+@pytest.fixture(autouse=True)
+def isolated_run(tmp_path, monkeypatch):
+    """
+    Runs every test in its own directory (state store, profiles), without the response cache.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('RESPONSE_CACHE_DIR', 'none')
+    monkeypatch.setenv('BROWSER_PROFILE_DIR', 'none')
+    metrics.reset()
+    yield
+    metrics.reset()
@@ -0,0 +1,88 @@
+import pytest
+
+from sofascore_scrap import preflight
+from sofascore_scrap import stage2_extract_match_data as stage2
+from sofascore_scrap.state_store import StateStore
+
+LEAGUE = 'brasileirao-serie-a-2023'
+
+MATCHES = [
+    {'customId': 'a', 'id': 1, 'id_mandante': 1, 'id_visitante': 2, 'slug': 'a-b', 'league': LEAGUE, 'mandante': 'A', 'visitante': 'B', 'rodada': 1},
+    {'customId': 'b', 'id': 2, 'id_mandante': 3, 'id_visitante': 4, 'slug': 'c-d', 'league': LEAGUE, 'mandante': 'C', 'visitante': 'D', 'rodada': 1},
+]
+
+# Match 1 is fully stored, match 2 only has its info
+STORED = [
+    f"matche_info/{LEAGUE}/a-b-1-info.json",
+    f"matche_stats/{LEAGUE}/a-b-1-period-all.json.gz",
+    f"matche_info/{LEAGUE}/c-d-2-info.json",
+]
+
+
+def write_manifest(path, lines):
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def test_stored_documents_are_grouped_by_prefix():
+    stored = preflight.stored_documents(STORED + ['keys_matches.csv', f"matche_info/{LEAGUE}/notes.txt"])
+    assert stored == {'matche_info': {1, 2}, 'matche_stats': {1}}
+
+
+def test_manifest_is_read_from_a_key_list_or_a_directory(tmp_path):
+    listing = write_manifest(tmp_path / 'listing.txt', [f"2024-05-01 10:00:00       1234 {key}" for key in STORED])
+    assert preflight.read_manifest(listing) == STORED
+
+    for key in STORED:
+        path = tmp_path / 'bucket' / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'{}')
+    assert sorted(preflight.read_manifest(str(tmp_path / 'bucket'))) == sorted(STORED)
+
+
+def test_split_pending_keeps_the_matches_missing_a_document(tmp_path):
+    manifest = write_manifest(tmp_path / 'listing.txt', STORED)
+
+    pending, done = preflight.split_pending(MATCHES, ['matche_info', 'matche_stats'], manifest=manifest)
+
+    assert [match['id'] for match in pending] == [2]
+    assert done == [1]
+
+
+def test_absent_optional_endpoint_counts_as_stored(tmp_path):
+    manifest = write_manifest(tmp_path / 'listing.txt', STORED)
+    prefixes = ['matche_info', 'matche_stats', 'matche_players_stats']
+
+    pending, _ = preflight.split_pending(MATCHES[:1], prefixes, manifest=manifest)
+    assert [match['id'] for match in pending] == [1]
+
+    pending, done = preflight.split_pending(MATCHES[:1], prefixes, manifest=manifest, absent={1: {'matche_players_stats'}})
+    assert pending == [] and done == [1]
+
+
+def test_backfill_skips_the_matches_recorded_without_the_endpoint(tmp_path):
+    manifest = write_manifest(tmp_path / 'listing.txt', STORED + [f"matche_stats/{LEAGUE}/c-d-2-period-all.json"])
+
+    with StateStore() as store:
+        store.add_matches(MATCHES)
+        store.set_stage2_status([(1, 'done', None), (2, 'done', None)])
+        store.add_absent_endpoints([(1, 'lineups')])
+
+        # Match 2 was extracted before lineups was selected: it is backfilled, match 1 has none
+        pending = stage2.matches_to_extract(store, ['info', 'statistics', 'lineups'], manifest=manifest)
+        assert [match['id'] for match in pending] == [2]
+
+
+def test_split_pending_lists_the_bucket_once_per_league_and_prefix():
+    pytest.importorskip('moto')
+    from standins import local_s3, create_s3_client
+
+    with local_s3() as (bucket_name, endpoint_url):
+        s3 = create_s3_client(endpoint_url)
+        for key in STORED:
+            s3.put_object(Bucket=bucket_name, Key=key, Body=b'{}')
+
+        pending, done = preflight.split_pending(MATCHES, ['matche_info', 'matche_stats'], s3=s3, bucket_name=bucket_name)
+
+    assert [match['id'] for match in pending] == [2]
+    assert done == [1]
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from sofascore_scrap import rate_limiter
+
+
+def test_throttle_halves_the_rate_down_to_the_minimum():
+    limiter = rate_limiter.RateLimiter(rate=8, min_rate=1, max_rate=8)
+
+    limiter.on_throttle(retry_after=0)
+    assert limiter.rate == 4
+    limiter.on_throttle(retry_after=0)
+    limiter.on_throttle(retry_after=0)
+    assert limiter.rate == 1
+    limiter.on_throttle(retry_after=0)
+    assert limiter.rate == 1
+
+
+def test_throttle_pauses_every_request_for_retry_after():
+    limiter = rate_limiter.RateLimiter(rate=1000, burst=10, min_rate=1, max_rate=1000)
+
+    limiter.on_throttle(retry_after=0.2)
+    started = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.15
+
+
+def test_successes_raise_the_rate_again():
+    limiter = rate_limiter.RateLimiter(rate=4, min_rate=1, max_rate=8, increase=1, increase_after=3)
+    limiter.on_throttle(retry_after=0)
+
+    for _ in range(2):
+        limiter.on_success()
+    assert limiter.rate == 2
+    limiter.on_success()
+    assert limiter.rate == 3
+
+
+@pytest.mark.parametrize('attempt', range(6))
+def test_backoff_delay_is_exponential_with_jitter(attempt):
+    delay = min(60.0, 2.0 * 2 ** attempt)
+    delays = [rate_limiter.backoff_delay(attempt, base_delay=2.0, max_delay=60.0) for _ in range(200)]
+
+    # Half of the delay is fixed, the other half random
+    assert all(delay / 2 <= value <= delay for value in delays)
+    assert len(set(delays)) > 1
+
+
+def test_retry_queue_gives_up_after_the_last_attempt():
+    retries = rate_limiter.RetryQueue(max_attempts=3, base_delay=0, max_delay=0)
+
+    assert retries.schedule('match', 1)
+    assert retries.schedule('match', 2)
+    assert not retries.schedule('match', 3)
+    assert sorted(attempts for _, attempts in retries.pop_ready()) == [1, 2]
+    assert len(retries) == 0
+
+
+def test_retry_queue_waits_for_the_backoff(monkeypatch):
+    monkeypatch.setattr(rate_limiter.random, 'uniform', lambda low, high: high)
+    retries = rate_limiter.RetryQueue(max_attempts=5, base_delay=10, max_delay=600)
+
+    retries.schedule('first', 1)
+    retries.schedule('second', 2)
+    assert retries.pop_ready() == []
+    # backoff_delay(0) is 10s and backoff_delay(1) 20s with the maximum jitter
+    assert 9 < retries.next_delay() <= 10
+
+
+def test_retry_queue_reads_the_environment(monkeypatch):
+    monkeypatch.setenv('RETRY_MAX_ATTEMPTS', '5')
+    monkeypatch.setenv('RETRY_BASE_DELAY', '0.5')
+
+    retries = rate_limiter.RetryQueue()
+    assert retries.max_attempts == 5
+    assert retries.base_delay == 0.5
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({'Retry-After': '7'}, 7.0),
+    ({'retry-after': '1.5'}, 1.5),
+    ({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}, None),
+    ({}, None),
+    (None, None),
+])
+def test_retry_after_seconds(headers, expected):
+    assert rate_limiter.retry_after_seconds(headers) == expected
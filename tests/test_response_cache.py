@@ -0,0 +1,107 @@
+import json
+import os
+import time
+
+import pytest
+
+from sofascore_scrap import response_cache
+from sofascore_scrap.response_cache import ResponseCache
+
+API = 'https://www.sofascore.com/api/v1'
+
+
+def event(status):
+    return {'event': {'id': 1, 'status': {'type': status}}}
+
+
+def round_events(*statuses):
+    return {'events': [{'id': i, 'status': {'type': status}} for i, status in enumerate(statuses)]}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with ResponseCache(str(tmp_path / 'cache'), max_bytes=10 ** 9, ttl=60) as cache:
+        yield cache
+
+
+def test_cache_key_is_the_path_after_the_api_root():
+    assert response_cache.cache_key(f"{API}/event/1/statistics") == '/event/1/statistics'
+    assert response_cache.cache_key('http://127.0.0.1:8000/api/v1/event/1?x=1') == '/event/1?x=1'
+
+
+@pytest.mark.parametrize('key, json_data, status, expected', [
+    # Sub-resources are only requested for ended matches
+    ('/event/1/statistics', {'statistics': []}, 200, None),
+    ('/event/1', event('finished'), 200, None),
+    ('/event/1', event('inprogress'), 200, 60),
+    ('/unique-tournament/325/season/48982/events/round/1', round_events('finished', 'canceled'), 200, None),
+    ('/unique-tournament/325/season/48982/events/round/2', round_events('finished', 'notstarted'), 200, 60),
+    ('/unique-tournament/325/season/48982/rounds', {'rounds': []}, 200, 60),
+    ('/event/1/lineups', None, 404, 60),
+])
+def test_freshness(key, json_data, status, expected):
+    assert response_cache.freshness(key, json_data, status, 60) == expected
+
+
+def test_put_and_get(cache):
+    body = json.dumps(event('finished')).encode('utf-8')
+    cache.put(f"{API}/event/1", body)
+
+    assert cache.get(f"{API}/event/1") == (200, body)
+    assert cache.get_json(f"{API}/event/1") == event('finished')
+    assert cache.get(f"{API}/event/2") is None
+
+
+def test_identical_bodies_are_stored_once(cache):
+    cache.put(f"{API}/event/1/statistics", b'{"statistics": []}')
+    cache.put(f"{API}/event/2/statistics", b'{"statistics": []}')
+
+    stats = cache.stats()
+    assert stats['entries'] == 2
+    assert stats['blobs'] == 1
+
+
+def test_expired_entries_are_only_read_when_stale_ones_are_allowed(cache, monkeypatch):
+    cache.put(f"{API}/event/1", json.dumps(event('inprogress')).encode('utf-8'))
+    later = time.time() + 120
+    monkeypatch.setattr(response_cache.time, 'time', lambda: later)
+
+    assert cache.get(f"{API}/event/1") is None
+    assert cache.get(f"{API}/event/1", allow_stale=True) is not None
+
+    # Offline runs read the expired entries too
+    monkeypatch.setenv('RESPONSE_CACHE_OFFLINE', '1')
+    assert cache.get(f"{API}/event/1") is not None
+
+    assert cache.remove_expired() == 1
+    assert cache.stats()['entries'] == 0
+
+
+def test_least_recently_used_entries_are_evicted_first(cache):
+    for id_match in range(30):
+        cache.put(f"{API}/event/{id_match}/statistics", os.urandom(200))
+        time.sleep(0.001)
+    # Entry 0 is read again, so it is now the most recently used
+    assert cache.get(f"{API}/event/0/statistics") is not None
+
+    max_bytes = cache.size() // 2
+    removed = cache.evict(max_bytes=max_bytes)
+
+    assert removed > 0
+    assert cache.size() <= max_bytes
+    assert cache.get(f"{API}/event/0/statistics") is not None
+    assert cache.get(f"{API}/event/1/statistics") is None
+    # The bodies of the evicted entries are deleted too
+    blobs = sum(len(files) for _, _, files in os.walk(os.path.join(cache.path, 'blobs')))
+    assert blobs == cache.stats()['blobs']
+
+
+def test_disabled_cache(monkeypatch):
+    # RESPONSE_CACHE_DIR=none is set for every test
+    assert response_cache.get() is None
+
+    monkeypatch.setenv('RESPONSE_CACHE_DIR', 'cache')
+    try:
+        assert response_cache.get() is response_cache.get()
+    finally:
+        response_cache.close()
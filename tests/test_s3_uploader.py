@@ -0,0 +1,66 @@
+import pytest
+
+pytest.importorskip('boto3')
+pytest.importorskip('moto')
+
+from standins import local_s3, create_s3_client, bucket_usage, LOCAL_S3_KEY_ID, LOCAL_S3_SECRET_KEY
+from sofascore_scrap import metrics
+from sofascore_scrap.s3_uploader import S3Uploader
+
+KEY = 'matche_info/brasileirao-serie-a-2023/sao-paulo-botafogo-11352300-info.json'
+
+
+@pytest.fixture
+def bucket():
+    with local_s3() as bucket:
+        yield bucket
+
+
+def uploader_for(bucket, **kwargs):
+    bucket_name, endpoint_url = bucket
+    return S3Uploader(
+        bucket_name,
+        aws_access_key_id=LOCAL_S3_KEY_ID,
+        aws_secret_access_key=LOCAL_S3_SECRET_KEY,
+        endpoint_url=endpoint_url,
+        **kwargs
+    )
+
+
+def read_object(bucket, key):
+    bucket_name, endpoint_url = bucket
+    return create_s3_client(endpoint_url).get_object(Bucket=bucket_name, Key=key)
+
+
+def test_uploads_are_queued_and_flushed_on_close(bucket):
+    with uploader_for(bucket, max_workers=4, max_pending=2) as uploader:
+        futures = [uploader.upload(f"matche_info/league/match-{i}-info.json", b'{}') for i in range(10)]
+    assert all(future.result() for future in futures)
+
+    assert bucket_usage(*bucket) == (10, 20)
+    assert metrics.snapshot()['counters']['s3_uploaded'] == 10
+
+
+def test_existing_objects_are_skipped_unless_overwritten(bucket):
+    with uploader_for(bucket) as uploader:
+        uploader.upload(KEY, b'{"version": 1}')
+    with uploader_for(bucket) as uploader:
+        assert uploader.upload(KEY, b'{"version": 2}').result()
+    assert read_object(bucket, KEY)['Body'].read() == b'{"version": 1}'
+    assert metrics.snapshot()['counters']['s3_skipped'] == 1
+
+    with uploader_for(bucket, overwrite=True) as uploader:
+        uploader.upload(KEY, b'{"version": 2}', ContentEncoding='gzip')
+    stored = read_object(bucket, KEY)
+    assert stored['Body'].read() == b'{"version": 2}'
+    # Recent botocore versions add aws-chunked to the encoding moto stores
+    assert stored['ContentEncoding'].split(',')[0] == 'gzip'
+
+
+def test_failed_uploads_are_returned_by_close(bucket):
+    uploader = uploader_for((f"{bucket[0]}-missing", bucket[1]))
+    assert uploader.upload(KEY, b'{}').result() is False
+
+    failed = uploader.close()
+    assert [key for key, _ in failed] == [KEY]
+    assert 'NoSuchBucket' in failed[0][1]
@@ -0,0 +1,120 @@
+import os
+
+import pytest
+
+pytest.importorskip('requests')
+
+from replay_server import ReplayServer
+from standins import CountingConnection, NullConnection, connect_postgres
+from sofascore_scrap import response_cache
+from sofascore_scrap import stage1_collect_match_keys as stage1
+from sofascore_scrap.state_store import StateStore
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+
+# The recorded season: rounds 1 to 3 are finished (5 matches each), round 4 has 3 ended matches out of 5
+SEASON = 48982
+ENDED_MATCHES = 18
+
+
+class FailingCommitConnection(NullConnection):
+    """
+    Connection whose commits fail, like a database that goes away in the middle of a season.
+    """
+
+    def commit(self):
+        raise RuntimeError("connection lost")
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = ReplayServer().start()
+    monkeypatch.setenv('SOFASCORE_API_URL', server.api_url)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def leagues():
+    return stage1.load_leagues(os.path.join(BENCHMARK_DIR, 'leagues_season.json'))
+
+
+def collect(leagues, conn=None, reprocess=False):
+    collected = []
+    collector = stage1.MatchKeyCollector(
+        mode='api',
+        max_workers=4,
+        on_match=collected.append,
+        store=StateStore(),
+        conn=conn if conn is not None else connect_postgres(),
+        reprocess=reprocess
+    )
+    with collector:
+        collector.run(leagues)
+    return collected, collector
+
+
+def test_api_mode_collects_the_ended_matches(server, leagues, limiter):
+    collected, collector = collect(leagues)
+
+    assert len(collected) == ENDED_MATCHES
+    assert {match['rodada'] for match in collected} == {1, 2, 3, 4}
+    # One rounds request and one request per round
+    assert server.requests_served == 5
+    # League, season and teams in a single transaction
+    assert collector.conn.round_trips <= 5
+
+    with StateStore() as store:
+        assert len(store.pending_matches()) == ENDED_MATCHES
+        assert store.completed_rounds(SEASON) == {1, 2, 3}
+        assert store.has_id('leagues', 325) and store.has_id('seasons', SEASON)
+        assert store.has_id('teams', collected[-1]['id_mandante'])
+    # keys_matches.csv is still written for the tools that read it
+    assert os.path.exists('keys_matches.csv')
+
+
+def test_next_run_only_visits_the_incomplete_rounds(server, leagues, limiter):
+    collect(leagues)
+    requests_before = server.requests_served
+
+    collected, _ = collect(leagues)
+
+    assert collected == []
+    # The rounds list and round 4
+    assert server.requests_served - requests_before == 2
+
+
+def test_rounds_are_not_checkpointed_when_the_season_rows_are_not_saved(server, leagues, limiter):
+    collect(leagues, conn=CountingConnection(FailingCommitConnection()))
+
+    with StateStore() as store:
+        assert store.completed_rounds(SEASON) == set()
+        assert not store.has_id('seasons', SEASON)
+        assert len(store.pending_matches()) == ENDED_MATCHES
+
+    # The next run visits the rounds again and saves the teams
+    collected, _ = collect(leagues)
+    assert collected == []
+    with StateStore() as store:
+        assert store.completed_rounds(SEASON) == {1, 2, 3}
+        assert store.has_id('seasons', SEASON)
+
+
+def test_offline_reprocess_reads_the_cache_without_the_database(server, leagues, limiter, monkeypatch):
+    monkeypatch.setenv('RESPONSE_CACHE_DIR', 'cache')
+    try:
+        collect(leagues)
+        requests_before = server.requests_served
+
+        monkeypatch.setenv('RESPONSE_CACHE_OFFLINE', '1')
+        collector = stage1.MatchKeyCollector(mode='api', store=StateStore(), reprocess=True)
+        with collector:
+            collector.run(leagues)
+    finally:
+        response_cache.close()
+
+    assert server.requests_served == requests_before
+    # Nothing new to save: no connection was opened
+    assert collector.conn is None
+    with StateStore() as store:
+        assert len(store.collected_matches()) == ENDED_MATCHES
@@ -0,0 +1,192 @@
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+
+import pytest
+
+from replay_server import ReplayServer
+from sofascore_scrap import capture, rate_limiter
+from sofascore_scrap import stage2_extract_match_data as stage2
+from sofascore_scrap.state_store import StateStore
+
+# Match of the recorded fixtures (benchmarks/fixtures/event/11352300*)
+MATCH = {
+    'customId': 'ppRMh',
+    'id': '11352300',
+    'id_mandante': 1981,
+    'id_visitante': 1958,
+    'slug': 'sao-paulo-botafogo',
+    'league': 'brasileirao-serie-a-2023',
+    'mandante': 'São Paulo',
+    'visitante': 'Botafogo',
+    'rodada': 1,
+}
+
+
+class MemoryUploader:
+    """
+    Uploader that keeps the documents in memory (same interface as S3Uploader).
+    """
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload(self, key, body, content_type=None, **extra_args):
+        self.objects[key] = body
+        future = Future()
+        future.set_result(True)
+        return future
+
+    def close(self):
+        return []
+
+
+@pytest.fixture
+def server():
+    server = ReplayServer(retry_after=0).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def store():
+    # The state store of the test directory, with the match to extract
+    with StateStore() as store:
+        store.add_matches([MATCH])
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setenv('RETRY_MAX_ATTEMPTS', '3')
+    monkeypatch.setenv('RETRY_BASE_DELAY', '0.01')
+
+
+# Requests an endpoint from the replay server and returns it as the capture backends do (body still encoded)
+def fetch(url):
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return capture.CapturedRequest(url, capture.CapturedResponse(response.status, dict(response.headers), response.read()))
+    except urllib.error.HTTPError as e:
+        return capture.CapturedRequest(url, capture.CapturedResponse(e.code, dict(e.headers), e.read()))
+
+
+# Reads the endpoints of a match from the replay server instead of the browser
+# `on_request` is called before every attempt, so a test can change the server between attempts
+def replay_capture(server, on_request=None):
+    attempts = []
+
+    def capture_responses(session, match, endpoints):
+        attempts.append(match['id'])
+        if on_request is not None:
+            on_request(len(attempts))
+
+        limiter = rate_limiter.get()
+        responses = {}
+        for name in endpoints:
+            limiter.acquire()
+            responses[name] = fetch(f"{server.api_url}/event/{match['id']}{stage2.ENDPOINTS[name][0]}")
+        stage2.check_throttled(responses)
+        return responses
+
+    capture_responses.attempts = attempts
+    return capture_responses
+
+
+def run(capture_responses, uploader=None):
+    uploader = uploader or MemoryUploader()
+    processed, errors, shard_metrics = stage2.run_shard(
+        [MATCH], endpoints=['info', 'statistics'], uploader=uploader, capture_responses=capture_responses
+    )
+    return processed, errors, shard_metrics['counters'], uploader
+
+
+def test_throttled_match_is_retried_and_completed(server, store, limiter):
+    # The site throttles the first attempt only
+    server.error_rate = 1.0
+    capture_responses = replay_capture(server, on_request=lambda attempt: setattr(server, 'error_rate', 1.0 if attempt == 1 else 0.0))
+
+    processed, errors, counters, uploader = run(capture_responses)
+
+    assert capture_responses.attempts == [MATCH['id']] * 2
+    assert processed == [MATCH['id']]
+    assert errors == []
+    assert counters['throttled'] == 1
+    assert counters['matches_retried'] == 1
+    assert 'matches_failed' not in counters
+    assert limiter.rate == 500
+    assert sorted(uploader.objects) == [
+        'matche_info/brasileirao-serie-a-2023/sao-paulo-botafogo-11352300-info.json',
+        'matche_stats/brasileirao-serie-a-2023/sao-paulo-botafogo-11352300-period-all.json',
+    ]
+
+    with StateStore() as state:
+        assert state.pending_matches() == []
+        assert state.dead_letters() == []
+
+
+def test_match_throttled_on_every_attempt_goes_to_the_dead_letters(server, store, limiter):
+    server.error_rate = 1.0
+    capture_responses = replay_capture(server)
+
+    processed, errors, counters, uploader = run(capture_responses)
+
+    assert capture_responses.attempts == [MATCH['id']] * 3
+    assert processed == []
+    assert [item for item, _ in errors] == [MATCH['id']]
+    assert counters['throttled'] == 3
+    assert counters['matches_retried'] == 2
+    assert counters['matches_failed'] == 1
+    # Halved on every throttling response
+    assert limiter.rate == 1000 * 0.5 ** 3
+    assert uploader.objects == {}
+
+    with StateStore() as state:
+        dead_letters = state.dead_letters()
+        assert [(row['id'], row['attempts']) for row in dead_letters] == [(int(MATCH['id']), 3)]
+        assert 'throttled (429)' in dead_letters[0]['error']
+        # Dead letters are not pending anymore, until they are requeued
+        assert state.pending_matches() == []
+        state.requeue_dead_letters()
+        assert [match['id'] for match in state.pending_matches()] == [int(MATCH['id'])]
+
+
+def test_match_is_retried_with_the_backoff_delay(server, store, limiter, monkeypatch):
+    monkeypatch.setenv('RETRY_BASE_DELAY', '0.3')
+    server.error_rate = 1.0
+    capture_responses = replay_capture(server, on_request=lambda attempt: setattr(server, 'error_rate', 1.0 if attempt == 1 else 0.0))
+
+    delays = []
+    schedule = rate_limiter.RetryQueue.schedule
+
+    def record_schedule(retries, item, attempts):
+        scheduled = schedule(retries, item, attempts)
+        delays.append(retries.next_delay())
+        return scheduled
+
+    monkeypatch.setattr(rate_limiter.RetryQueue, 'schedule', record_schedule)
+    processed, _, _, _ = run(capture_responses)
+
+    assert processed == [MATCH['id']]
+    # First retry: between half and the whole base delay
+    assert len(delays) == 1 and 0.1 < delays[0] <= 0.3
+
+
+def test_shard_stores_the_documents_in_the_s3_stand_in(server, store, limiter):
+    pytest.importorskip('moto')
+    from standins import local_s3, bucket_usage, LOCAL_S3_KEY_ID, LOCAL_S3_SECRET_KEY
+    from sofascore_scrap.s3_uploader import S3Uploader
+
+    with local_s3() as (bucket_name, endpoint_url):
+        uploader = S3Uploader(bucket_name, LOCAL_S3_KEY_ID, LOCAL_S3_SECRET_KEY, endpoint_url=endpoint_url)
+        # The recorded match has no lineups (404)
+        processed, errors, _ = stage2.run_shard(
+            [MATCH], endpoints=['info', 'statistics', 'lineups'], uploader=uploader, capture_responses=replay_capture(server)
+        )
+        objects, _ = bucket_usage(bucket_name, endpoint_url)
+
+    assert processed == [MATCH['id']]
+    assert errors == []
+    assert objects == 2
+
+    with StateStore() as state:
+        assert state.pending_matches() == []
+        assert state.absent_endpoints() == {int(MATCH['id']): {'lineups'}}
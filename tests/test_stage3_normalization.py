@@ -0,0 +1,134 @@
+import copy
+import json
+import os
+
+import pytest
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('boto3')
+
+from replay_server import FIXTURES_DIR
+from standins import NullConnection, NullCursor
+from sofascore_scrap import stage2_extract_match_data as stage2
+from sofascore_scrap import stage3_load_match_data as stage3
+
+LEAGUE = 'brasileirao-serie-a-2023'
+
+
+def fixture(*path):
+    with open(os.path.join(FIXTURES_DIR, *path), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def info_document(id_match=11352300):
+    return (f"matche_info/{LEAGUE}/sao-paulo-botafogo-{id_match}-info.json", fixture('event', f"{id_match}.json"))
+
+
+def stats_document(id_match=11352300):
+    stats = stage2.statistics_period_all(fixture('event', str(id_match), 'statistics.json'))
+    return (f"matche_stats/{LEAGUE}/sao-paulo-botafogo-{id_match}-period-all.json", stats)
+
+
+def empty_rows():
+    return {table: [] for table in stage3.COLUMNS}
+
+
+class RejectingCursor(NullCursor):
+    """
+    Cursor that rejects the COPY of any row containing `rejected` (like a NOT NULL or precision error).
+    """
+
+    rejected = None
+
+    def copy_expert(self, sql, file, size=8192):
+        if self.rejected in file.getvalue():
+            raise ValueError(f"value rejected by the schema: {self.rejected}")
+
+
+class RejectingConnection(NullConnection):
+    def __init__(self, rejected):
+        super().__init__()
+        self.rejected = rejected
+        self.commits = 0
+
+    def cursor(self, *args, **kwargs):
+        cursor = RejectingCursor(self)
+        cursor.rejected = self.rejected
+        return cursor
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_info_document_gives_a_row_per_table():
+    rows = empty_rows()
+    stage3.normalize_info(info_document()[1], rows)
+
+    assert [row[0] for row in rows['league']] == [325]
+    assert [row[0] for row in rows['season']] == [48982]
+    assert len(rows['team']) == 2
+    assert rows['referee'] == [(802, 'Referee 2', 192, 571, 12)]
+    assert rows['stadium'][0][:2] == (7014, 'Estádio São Paulo')
+    match_row = rows['match'][0]
+    assert match_row[0] == 11352300
+    assert match_row[3:6] == (48982, 802, 7014)
+
+
+def test_statistics_are_deduplicated_and_kept_in_range():
+    stats = {'groups': [
+        {'statisticsItems': [
+            {'name': 'Ball possession', 'homeValue': 55, 'awayValue': 45},
+            {'name': 'Expected goals', 'homeValue': 1.52, 'awayValue': 0.8},
+            {'name': 'Passes', 'homeValue': 1200, 'awayValue': 300},
+            {'name': 'Big chances', 'homeValue': None, 'awayValue': 1},
+        ]},
+        {'statisticsItems': [{'name': 'Ball possession', 'homeValue': 50, 'awayValue': 50}]},
+    ]}
+    rows = empty_rows()
+    stage3.normalize_stats(1, stats, rows)
+
+    assert rows['match_stat'] == [(1, 'Ball possession', 55, 45), (1, 'Expected goals', 1.52, 0.8)]
+
+
+def test_malformed_documents_are_skipped_without_their_partial_rows():
+    without_team_name = copy.deepcopy(info_document(11352301))
+    without_team_name[1]['event']['awayTeam'].pop('name')
+    without_home_team = copy.deepcopy(info_document(11352302))
+    without_home_team[1]['event'].pop('homeTeam')
+
+    rows, documents = stage3.normalize_documents([info_document(), without_team_name, without_home_team], 'info')
+
+    assert [name for name, _ in documents] == [info_document()[0]]
+    assert [row[0] for row in rows['match']] == [11352300]
+    assert len(rows['team']) == 2
+
+
+def test_validate_rows_reports_the_missing_value():
+    rows = empty_rows()
+    rows['season'].append((48982, None, 325))
+
+    with pytest.raises(ValueError, match='season 48982 without season_year'):
+        stage3.validate_rows(rows)
+
+
+def test_batch_is_loaded_in_a_single_transaction():
+    conn = RejectingConnection(rejected='never')
+
+    loaded = stage3.load_batch(conn, [info_document(11352300), info_document(11352301)], 'info')
+
+    assert loaded == 2
+    assert conn.commits == 1
+
+
+def test_rejected_batch_is_loaded_again_document_by_document():
+    documents = [stats_document(11352300), stats_document(11352301), stats_document(11352302)]
+    rejected = copy.deepcopy(documents[1])
+    rejected[1]['groups'][0]['statisticsItems'][0]['name'] = 'REJECTED'
+    documents[1] = rejected
+    conn = RejectingConnection(rejected='REJECTED')
+
+    loaded = stage3.load_batch(conn, documents, 'stats')
+
+    # Only the offending document is dropped
+    assert loaded == 2
+    assert conn.commits == 2
@@ -0,0 +1,100 @@
+import csv
+
+import pytest
+
+from sofascore_scrap.state_store import StateStore, MATCH_KEY_FIELDS
+
+
+def match_key(id_match, league='brasileirao-serie-a-2023', rodada=1, slug='home-away'):
+    return {
+        'customId': f"c{id_match}",
+        'id': id_match,
+        'id_mandante': 1,
+        'id_visitante': 2,
+        'slug': slug,
+        'league': league,
+        'mandante': 'Home',
+        'visitante': 'Away',
+        'rodada': rodada,
+    }
+
+
+@pytest.fixture
+def store():
+    with StateStore() as store:
+        yield store
+
+
+def test_new_store_is_empty_until_something_is_recorded(store):
+    assert store.is_empty()
+    store.add_ids('teams', [1981])
+    assert not store.is_empty()
+    assert store.has_id('teams', '1981')
+    assert not store.has_id('teams', 1958)
+
+
+def test_recorded_match_keys_are_kept_unless_replaced(store):
+    store.add_matches([match_key(1, slug='old')])
+    store.add_matches([match_key(1, slug='new')])
+    assert store.collected_matches()[0]['slug'] == 'old'
+
+    store.add_matches([match_key(1, slug='new')], replace=True)
+    assert store.collected_matches()[0]['slug'] == 'new'
+    assert store.has_match(1)
+
+
+def test_pending_matches_skip_done_and_dead_letters(store):
+    store.add_matches([match_key(1), match_key(2), match_key(3), match_key(4)])
+    store.set_stage2_status([(1, 'done', None), (2, 'failed', 'timeout')])
+    store.add_dead_letters([(3, 3, 'throttled (429)')])
+
+    assert [match['id'] for match in store.pending_matches()] == [2, 4]
+    assert [match['id'] for match in store.pending_matches(include_done=True)] == [1, 2, 4]
+
+    store.add_dead_letters([(3, 2, 'throttled (429)')])
+    assert [(row['id'], row['attempts']) for row in store.dead_letters()] == [(3, 5)]
+    assert store.requeue_dead_letters() == 1
+    assert [match['id'] for match in store.pending_matches()] == [2, 3, 4]
+
+
+def test_collected_matches_of_a_league(store):
+    store.add_matches([match_key(1, league='a-2023'), match_key(2, league='b-2023')])
+    assert [match['id'] for match in store.collected_matches('b-2023')] == [2]
+
+
+def test_season_is_finished_once_every_round_is_complete(store):
+    store.set_round_statuses(48982, {1: True, 2: False})
+    assert store.completed_rounds(48982) == {1}
+    assert not store.update_season_progress(48982, 2)
+    assert not store.is_season_finished(48982)
+
+    store.set_round_statuses(48982, {2: True})
+    assert store.update_season_progress(48982, 2)
+    assert store.is_season_finished(48982)
+
+
+def test_absent_endpoints_are_recorded_once_per_match(store):
+    store.add_matches([match_key(1), match_key(2)])
+    store.add_absent_endpoints([(1, 'lineups'), (1, 'shotmap'), (1, 'lineups'), (2, 'lineups')])
+
+    assert store.absent_endpoints() == {1: {'lineups', 'shotmap'}, 2: {'lineups'}}
+
+
+def test_legacy_csv_files_round_trip(store):
+    store.add_ids('leagues', [325])
+    store.add_ids('seasons', [48982])
+    store.add_ids('teams', [1981, 1958])
+    store.add_matches([match_key(1, rodada=2), match_key(2, rodada=1)])
+    store.export_legacy_csv()
+
+    with open('keys_matches.csv', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0]) == MATCH_KEY_FIELDS
+    assert [row['id'] for row in rows] == ['1', '2']
+
+    with StateStore('imported.db') as imported:
+        imported.import_legacy_csv()
+        assert imported.has_id('leagues', 325)
+        assert imported.has_id('seasons', 48982)
+        assert imported.has_id('teams', 1958)
+        assert [match['id'] for match in imported.collected_matches()] == [1, 2]